@@ -0,0 +1,41 @@
+"""Alembic 运行环境：使用应用的同步引擎（带 SQLite 连接参数）和模型元数据"""
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.db.base import Base, engine, SQLALCHEMY_DATABASE_URL
+from app.models import sql_models  # noqa: F401  注册全部模型
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+def run_migrations_offline() -> None:
+    """只输出 SQL（alembic upgrade head --sql）"""
+    context.configure(
+        url=SQLALCHEMY_DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=SQLALCHEMY_DATABASE_URL.startswith("sqlite"),
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online() -> None:
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite 不支持大部分 ALTER TABLE，改列时用复制表的批量模式
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,90 @@
+"""基线：接管引入 Alembic 之前的数据库
+
+合并原 scripts/migrate_db.py、migrate_users.py、migrate_knowledge.py 的补列和补索引；
+缺少的表按基线时的模型创建。每一步都先检查现状，应用启动时已用 create_all 建好的库也可以直接升级。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 基线时已有的表，之后新增的表由各自的版本创建
+BASELINE_TABLES = [
+    "users",
+    "conversations",
+    "messages",
+    "knowledge_files",
+    "knowledge_namespaces",
+    "knowledge_namespace_members",
+    "knowledge_chunks",
+    "knowledge_stats",
+    "vector_collections",
+    "embedding_collections",
+    "answer_cache",
+]
+
+# 早期版本的表缺少的列: 表名 -> [列]
+LEGACY_COLUMNS = {
+    "messages": [
+        sa.Column("data", sa.Text(), nullable=True),
+    ],
+    "conversations": [
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", name="fk_conversations_user_id"), nullable=True),
+    ],
+    "knowledge_files": [
+        sa.Column("content_hash", sa.String(64), nullable=True),
+        sa.Column("chunk_count", sa.Integer(), server_default="0"),
+        sa.Column("namespace", sa.String(), server_default="shared"),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.Column("duplicate_chunks", sa.Integer(), server_default="0"),
+    ],
+    "vector_collections": [
+        sa.Column("compaction_started_at", sa.DateTime(), nullable=True),
+    ],
+    "knowledge_stats": [
+        sa.Column("version", sa.Integer(), server_default="0"),
+    ],
+}
+
+LEGACY_INDEXES = [
+    ("ix_knowledge_files_content_hash", "knowledge_files", ["content_hash"]),
+    ("ix_knowledge_files_namespace", "knowledge_files", ["namespace"]),
+    ("ix_knowledge_files_owner_id", "knowledge_files", ["owner_id"]),
+]
+
+def upgrade() -> None:
+    from app.db.base import Base
+    from app.models import sql_models  # noqa: F401
+
+    bind = op.get_bind()
+    Base.metadata.create_all(
+        bind=bind, tables=[Base.metadata.tables[name] for name in BASELINE_TABLES], checkfirst=True
+    )
+
+    inspector = sa.inspect(bind)
+    for table, columns in LEGACY_COLUMNS.items():
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        missing = [column for column in columns if column.name not in existing]
+        if missing:
+            # SQLite 不能单独 ALTER 外键约束，批量模式在需要时复制重建表
+            with op.batch_alter_table(table) as batch:
+                for column in missing:
+                    batch.add_column(column)
+
+    for name, table, columns in LEGACY_INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+    # 命名空间上线前的文件归入 shared
+    op.execute("UPDATE knowledge_files SET namespace = 'shared' WHERE namespace IS NULL")
+
+def downgrade() -> None:
+    # 基线之前没有受管理的结构，不回退
+    pass
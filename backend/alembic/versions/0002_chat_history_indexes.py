@@ -0,0 +1,33 @@
+"""对话表复合索引：messages (conversation_id, created_at)、conversations (user_id, updated_at)
+
+历史、上下文查询按对话过滤并按时间排序，对话列表按用户过滤并按更新时间倒序；
+没有复合索引时每次都要全表扫描后排序。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_messages_conversation_id_created_at", "messages", ["conversation_id", "created_at"], if_not_exists=True
+    )
+    op.create_index(
+        "ix_conversations_user_id_updated_at", "conversations", ["user_id", "updated_at"], if_not_exists=True
+    )
+    # 让查询规划器拿到新索引的统计信息
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("ANALYZE messages")
+        op.execute("ANALYZE conversations")
+
+def downgrade() -> None:
+    op.drop_index("ix_conversations_user_id_updated_at", table_name="conversations", if_exists=True)
+    op.drop_index("ix_messages_conversation_id_created_at", table_name="messages", if_exists=True)
@@ -0,0 +1,50 @@
+"""消息附加数据改为 JSON 列：PostgreSQL 上 messages.data、answer_cache.data 转为 JSONB
+
+SQLite 上 JSON 列仍以文本存储，原有的 JSON 字符串无需转换，只把声明类型改为 JSON（复制重建表）。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+JSON_COLUMNS = [("messages", "data"), ("answer_cache", "data")]
+
+def _column_type(bind, table: str, column: str):
+    for info in sa.inspect(bind).get_columns(table):
+        if info["name"] == column:
+            return info["type"]
+    return None
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    for table, column in JSON_COLUMNS:
+        current = _column_type(bind, table, column)
+        if bind.dialect.name == "postgresql":
+            if not isinstance(current, postgresql.JSONB):
+                op.alter_column(
+                    table, column,
+                    type_=postgresql.JSONB(),
+                    postgresql_using=f"NULLIF({column}, '')::jsonb",
+                )
+        elif not isinstance(current, sa.JSON):
+            with op.batch_alter_table(table) as batch:
+                batch.alter_column(column, type_=sa.JSON(), existing_nullable=True)
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    for table, column in JSON_COLUMNS:
+        if bind.dialect.name == "postgresql":
+            op.alter_column(table, column, type_=sa.Text(), postgresql_using=f"{column}::text")
+        else:
+            with op.batch_alter_table(table) as batch:
+                batch.alter_column(column, type_=sa.Text(), existing_nullable=True)
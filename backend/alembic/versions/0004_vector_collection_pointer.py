@@ -0,0 +1,36 @@
+"""向量集合指针：vector_collections 新增 physical_name、compaction_target
+
+Chroma 集合压缩时先复制到带版本后缀的新集合，再在数据库中切换指针，各 worker 按名称重新解析，
+不再删除并重命名正在使用的集合。
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ["physical_name", "compaction_target"]
+
+def _existing_columns() -> set:
+    return {info["name"] for info in sa.inspect(op.get_bind()).get_columns("vector_collections")}
+
+def upgrade() -> None:
+    existing = _existing_columns()
+    for column in COLUMNS:
+        if column not in existing:
+            op.add_column("vector_collections", sa.Column(column, sa.String(), nullable=True))
+
+def downgrade() -> None:
+    existing = _existing_columns()
+    with op.batch_alter_table("vector_collections") as batch:
+        for column in COLUMNS:
+            if column in existing:
+                batch.drop_column(column)
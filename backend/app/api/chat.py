@@ -2,12 +2,17 @@ from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+import asyncio
 import json
-from app.services.rag_service import RAGService
+from app.services.rag_service import get_rag_service
 from app.services.llm_service import LLMService
 from app.services.chemistry_service import ChemistryService
+from app.services.answer_cache import get_answer_cache, normalize_question, tool_fingerprint, is_cacheable_answer
+from app.services.artifact_store import get_artifact_store
+from app.services import context_processor, knowledge_registry, knowledge_namespaces, retrieval_gate
+from app.core.config import settings
 from loguru import logger
-from app.db.base import SessionLocal
+from app.db.base import AsyncSessionLocal, get_async_db
 
 router = APIRouter()
 
@@ -41,6 +46,7 @@ class ChatRequest(BaseModel):
     use_rag: bool = True
     max_tokens: int = 1000
     image_path: Optional[str] = None
+    namespaces: Optional[List[str]] = None  # 限定检索的知识库命名空间，默认为全部可检索命名空间
 
 class ChatResponse(BaseModel):
     """聊天响应模型"""
@@ -59,15 +65,13 @@ class ConversationHistory(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-from sqlalchemy.orm import Session
-from app.db.base import get_db
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from app.models.sql_models import Conversation, Message, User
 from app.api import deps
 
 # 依赖注入
-def get_rag_service() -> RAGService:
-    return RAGService()
-
 def get_llm_service() -> LLMService:
     return LLMService()
 
@@ -83,23 +87,109 @@ async def process_chat_background(
     """后台处理聊天请求"""
     logger.info(f"开始后台处理聊天请求: {conversation_id}")
     start_time = datetime.now()
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     
     try:
         # 实例化服务
-        rag_service = RAGService()
+        rag_service = get_rag_service()
         llm_service = LLMService()
         chemistry_service = ChemistryService()
+        artifacts = get_artifact_store()
 
         sources = []
         context = ""
 
-        # 如果启用RAG，检索相关文档
+        # 获取历史消息 (用于上下文，排除当前助手消息占位符)
+        recent_msgs = (await db.scalars(
+            select(Message).where(
+                Message.conversation_id == conversation_id,
+                Message.id != assistant_msg_id
+            ).order_by(Message.created_at.desc()).limit(11)
+        )).all()
+        
+        chat_history = []
+        if recent_msgs:
+            # 跳过第一条（也就是刚刚插入的当前消息）
+            start_index = 1 if (recent_msgs[0].role == "user" and recent_msgs[0].content == request.message) else 0
+            
+            for m in recent_msgs[start_index:]:
+                chat_history.append({"role": m.role, "content": m.content})
+            
+            chat_history.reverse()
+
+        # 检索门控：知识库为空、纯工具请求或闲聊时跳过检索
+        use_rag = False
+        gate_decision = None
+        namespaces = None
         if request.use_rag:
+            # 只检索用户可见且非空的命名空间，过滤条件在向量打分前生效
+            # 同步的服务函数通过 run_sync 在异步连接上执行
+            user = await db.get(User, user_id)
+            namespaces = await db.run_sync(knowledge_namespaces.search_namespaces, user, request.namespaces)
+            gate_decision = await db.run_sync(
+                retrieval_gate.decide, request.message, has_image=bool(request.image_path), namespaces=namespaces
+            )
+            use_rag = gate_decision["retrieve"] and bool(namespaces)
+            if not use_rag:
+                retrieval_gate.log_decision(conversation_id, request.message, gate_decision)
+
+        # 语义答案缓存：只用于不依赖对话上下文和图片的问题
+        # 门控跳过检索的闲聊和工具请求默认不查缓存，避免每轮多算一次问题向量
+        answer_cache = get_answer_cache()
+        cache_embedding = None
+        kb_version = 0
+        # 使用知识库的回答只在可检索命名空间相同的用户之间复用
+        cache_fingerprint = knowledge_namespaces.scope_fingerprint(tool_fingerprint(), namespaces if use_rag else None)
+        use_answer_cache = (
+            settings.ANSWER_CACHE_ENABLED
+            and (use_rag or settings.ANSWER_CACHE_NON_RAG)
+            and not request.image_path
+            and not chat_history
+        )
+        # 含 CAS 号、分子式、InChIKey 的问题可能直接由词法索引回答，不为查缓存提前计算向量
+        exact_identifiers = use_rag and rag_service.has_exact_identifiers(request.message)
+        if exact_identifiers:
+            use_answer_cache = False
+        if use_answer_cache:
+            try:
+                cache_embedding = await rag_service.embed_query(normalize_question(request.message))
+                # 不使用知识库的回答与知识库版本无关，单独划分作用域
+                kb_version = await db.run_sync(knowledge_registry.get_kb_version) if use_rag else -1
+                cached = await db.run_sync(answer_cache.lookup, cache_embedding, kb_version, cache_fingerprint)
+                if cached:
+                    msg_to_update = await db.get(Message, assistant_msg_id)
+                    if msg_to_update:
+                        msg_to_update.content = cached.answer
+                        msg_to_update.message_type = cached.message_type or "text"
+                        msg_to_update.data = cached.data
+                        await db.commit()
+                    processing_time = (datetime.now() - start_time).total_seconds()
+                    logger.info(f"答案缓存命中，耗时: {processing_time:.3f}秒")
+                    return
+            except Exception as e:
+                logger.warning(f"答案缓存查找失败: {str(e)}")
+                use_answer_cache = False
+
+        # 如果启用RAG，检索相关文档
+        if use_rag:
             logger.info("开始RAG检索")
-            search_results = await rag_service.search_documents(
+            # 检索使用原始问题的向量；归一化后文本不变时复用查缓存时的向量，含精确标识符时由检索按需计算
+            query_embedding = None
+            if cache_embedding is not None and normalize_question(request.message) == request.message:
+                query_embedding = cache_embedding
+            elif not exact_identifiers:
+                try:
+                    query_embedding = await rag_service.embed_query(request.message)
+                except Exception as e:
+                    logger.warning(f"计算查询向量失败: {str(e)}")
+            candidates = await rag_service.retrieve(
                 query=request.message,
-                top_k=5
+                where=knowledge_namespaces.namespace_filter(namespaces),
+                query_embedding=query_embedding
+            )
+            search_results = retrieval_gate.adapt_top_k(candidates)
+            retrieval_gate.log_decision(
+                conversation_id, request.message, gate_decision, candidates, kept=len(search_results)
             )
 
             if search_results:
@@ -107,12 +197,13 @@ async def process_chat_background(
                     {
                         "content": result["content"][:200] + "...",
                         "source": result["metadata"].get("source", "unknown"),
-                        "score": result["score"]
+                        "score": result.get("rerank_score", result["score"])
                     }
                     for result in search_results
                 ]
 
-                context = "\n\n".join([result["content"] for result in search_results])
+                context, context_stats = await rag_service.build_context(request.message, search_results, query_embedding)
+                context_processor.record_savings(context_stats)
                 logger.info(f"检索到 {len(search_results)} 个相关文档")
 
         # 处理图像分析请求
@@ -137,21 +228,6 @@ async def process_chat_background(
                 logger.error(f"光谱分析失败: {str(e)}")
                 context += f"\n\n【光谱图像分析失败】\n{str(e)}\n"
 
-        # 获取历史消息 (用于上下文)
-        recent_msgs = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at.desc()).limit(11).all()
-        
-        chat_history = []
-        if recent_msgs:
-            # 跳过第一条（也就是刚刚插入的当前消息）
-            start_index = 1 if (recent_msgs[0].role == "user" and recent_msgs[0].content == request.message) else 0
-            
-            for m in recent_msgs[start_index:]:
-                chat_history.append({"role": m.role, "content": m.content})
-            
-            chat_history.reverse()
-
         # 生成回答
         logger.info("开始生成回答")
         response_message = await llm_service.generate_response(
@@ -164,10 +240,10 @@ async def process_chat_background(
         # 更新助手回复 (初始回复)
         # 只有当回复不是工具调用时才更新数据库，避免显示JSON
         if "chemistry_tool" not in response_message and "spectrum_tool" not in response_message:
-            msg_to_update = db.query(Message).filter(Message.id == assistant_msg_id).first()
+            msg_to_update = await db.get(Message, assistant_msg_id)
             if msg_to_update:
                 msg_to_update.content = response_message
-                db.commit()
+                await db.commit()
 
         # 工具调用循环
         max_tool_calls = 3
@@ -178,7 +254,7 @@ async def process_chat_background(
             logger.info(f"检测到工具调用 (第 {current_call} 次)")
             
             # 更新状态为正在调用工具
-            msg_to_update = db.query(Message).filter(Message.id == assistant_msg_id).first()
+            msg_to_update = await db.get(Message, assistant_msg_id)
             if msg_to_update and msg_to_update.content != "正在分析请求并调用相关工具...":
                  # 如果之前已经生成了部分文本，保留它，或者替换为状态信息
                  # 这里我们选择暂时替换为状态信息，或者追加
@@ -241,13 +317,16 @@ async def process_chat_background(
                                 combined_query_prompt += f"请根据这些属性数据回答用户关于 {molecule} 的问题：{tool_result_text}\n"
 
                                 # 更新消息数据
-                                msg_to_update = db.query(Message).filter(Message.id == assistant_msg_id).first()
+                                msg_to_update = await db.get(Message, assistant_msg_id)
                                 if msg_to_update:
-                                    current_data = json.loads(msg_to_update.data) if msg_to_update.data else {}
-                                    current_data["properties"] = props["properties"]
+                                    current_data = dict(msg_to_update.data or {})
+                                    current_data["smiles"] = props["smiles"]
+                                    current_data = await asyncio.to_thread(
+                                        artifacts.attach, current_data, "properties", props["smiles"], props["properties"]
+                                    )
                                     msg_to_update.message_type = "molecule"
-                                    msg_to_update.data = json.dumps(current_data)
-                                    db.commit()
+                                    msg_to_update.data = current_data
+                                    await db.commit()
                             else:
                                 tool_result_text = f"错误：{props.get('error')}"
                                 combined_query_prompt += f"计算属性时出错：{tool_result_text}\n"
@@ -266,15 +345,17 @@ async def process_chat_background(
                                 
                                 combined_query_prompt += f"【系统指令】结构图已成功生成（见下文）。请直接向用户展示该图片并解释推断理由。严禁再次调用 'generate_structure_image' 工具！\n\n结构图信息：{tool_result_text}\n"
                                 
-                                msg_to_update = db.query(Message).filter(Message.id == assistant_msg_id).first()
+                                msg_to_update = await db.get(Message, assistant_msg_id)
                                 if msg_to_update:
-                                    current_data = json.loads(msg_to_update.data) if msg_to_update.data else {}
+                                    current_data = dict(msg_to_update.data or {})
                                     current_data["image"] = img_result['image']
                                     current_data["smiles"] = img_result['smiles']
                                     if props_result["success"]:
-                                        current_data["properties"] = props_result["properties"]
-                                    msg_to_update.data = json.dumps(current_data)
-                                    db.commit()
+                                        current_data = await asyncio.to_thread(
+                                            artifacts.attach, current_data, "properties", props_result["smiles"], props_result["properties"]
+                                        )
+                                    msg_to_update.data = current_data
+                                    await db.commit()
                             else:
                                 tool_result_text = f"错误：{img_result.get('error')}"
                                 combined_query_prompt += f"生成结构图时出错：{tool_result_text}\n"
@@ -292,16 +373,21 @@ async def process_chat_background(
 
                                 combined_query_prompt += f"【系统指令】3D结构已成功生成。请告诉用户 {molecule} 的3D结构已准备好，并简要介绍该分子的立体化学特征。严禁再次调用 'generate_3d_structure' 工具！\n"
                                 
-                                msg_to_update = db.query(Message).filter(Message.id == assistant_msg_id).first()
+                                msg_to_update = await db.get(Message, assistant_msg_id)
                                 if msg_to_update:
                                     msg_to_update.message_type = "molecule"
-                                    current_data = json.loads(msg_to_update.data) if msg_to_update.data else {}
-                                    current_data["sdf"] = sdf_result['sdf']
+                                    current_data = dict(msg_to_update.data or {})
                                     current_data["smiles"] = sdf_result['smiles']
+                                    # SDF 和属性表存为附件，消息中只保存引用
+                                    current_data = await asyncio.to_thread(
+                                        artifacts.attach, current_data, "sdf", sdf_result['smiles'], sdf_result['sdf']
+                                    )
                                     if props_result["success"]:
-                                        current_data["properties"] = props_result["properties"]
-                                    msg_to_update.data = json.dumps(current_data)
-                                    db.commit()
+                                        current_data = await asyncio.to_thread(
+                                            artifacts.attach, current_data, "properties", props_result["smiles"], props_result["properties"]
+                                        )
+                                    msg_to_update.data = current_data
+                                    await db.commit()
                             else:
                                 tool_result_text = f"错误：{sdf_result.get('error')}"
                                 combined_query_prompt += f"生成3D结构时出错：{tool_result_text}\n"
@@ -321,10 +407,10 @@ async def process_chat_background(
                     
                     # 只有当回复不是工具调用时才更新数据库，避免显示JSON
                     if "chemistry_tool" not in response_message and "spectrum_tool" not in response_message:
-                        msg_to_update = db.query(Message).filter(Message.id == assistant_msg_id).first()
+                        msg_to_update = await db.get(Message, assistant_msg_id)
                         if msg_to_update:
                             msg_to_update.content = response_message
-                            db.commit()
+                            await db.commit()
                 else:
                     break
 
@@ -335,26 +421,51 @@ async def process_chat_background(
                 logger.error(f"执行工具调用失败: {str(e)}")
                 break
 
+        # 写入答案缓存
+        if use_answer_cache and is_cacheable_answer(response_message):
+            try:
+                final_msg = await db.get(Message, assistant_msg_id)
+                if final_msg:
+                    await db.run_sync(
+                        answer_cache.store,
+                        question=request.message,
+                        embedding=cache_embedding,
+                        answer=final_msg.content,
+                        message_type=final_msg.message_type,
+                        data=final_msg.data,
+                        kb_version=kb_version,
+                        fingerprint=cache_fingerprint
+                    )
+            except Exception as e:
+                await db.rollback()
+                logger.warning(f"写入答案缓存失败: {str(e)}")
+
         processing_time = (datetime.now() - start_time).total_seconds()
         logger.info(f"后台处理完成，耗时: {processing_time:.2f}秒")
 
     except Exception as e:
         logger.error(f"后台处理失败: {str(e)}")
         # 更新消息为错误状态
-        msg_to_update = db.query(Message).filter(Message.id == assistant_msg_id).first()
+        msg_to_update = await db.get(Message, assistant_msg_id)
         if msg_to_update:
             msg_to_update.content = f"处理请求时发生错误: {str(e)}"
-            db.commit()
+            await db.commit()
     finally:
-        db.close()
+        await db.close()
 
 @router.get("/history", response_model=List[ConversationHistory])
 async def get_chat_history(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ):
     """获取所有对话历史"""
-    conversations = db.query(Conversation).filter(Conversation.user_id == current_user.id).order_by(Conversation.updated_at.desc()).all()
+    # 一次查询预加载全部消息，异步会话不能在访问 conv.messages 时隐式加载
+    conversations = (await db.scalars(
+        select(Conversation)
+        .where(Conversation.user_id == current_user.id)
+        .order_by(Conversation.updated_at.desc())
+        .options(selectinload(Conversation.messages))
+    )).all()
     result = []
     for conv in conversations:
         msgs = [
@@ -365,7 +476,7 @@ async def get_chat_history(
                 message_type=m.message_type,
                 image_path=m.image_path,
                 image_url=get_image_url(m.image_path),
-                data=json.loads(m.data) if m.data else None
+                data=m.data
             ) for m in conv.messages
         ]
         result.append(ConversationHistory(
@@ -379,11 +490,15 @@ async def get_chat_history(
 @router.get("/history/{conversation_id}", response_model=ConversationHistory)
 async def get_conversation(
     conversation_id: str, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ):
     """获取指定对话详情"""
-    conv = db.query(Conversation).filter(Conversation.id == conversation_id, Conversation.user_id == current_user.id).first()
+    conv = await db.scalar(
+        select(Conversation)
+        .where(Conversation.id == conversation_id, Conversation.user_id == current_user.id)
+        .options(selectinload(Conversation.messages))
+    )
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
@@ -395,7 +510,7 @@ async def get_conversation(
             message_type=m.message_type,
             image_path=m.image_path,
             image_url=get_image_url(m.image_path),
-            data=json.loads(m.data) if m.data else None
+            data=m.data
         ) for m in conv.messages
     ]
     return ConversationHistory(
@@ -409,7 +524,7 @@ async def get_conversation(
 async def chat(
     request: ChatRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ):
     """处理聊天请求 (异步后台处理)"""
@@ -420,12 +535,11 @@ async def chat(
         conversation_id = request.conversation_id or f"conv_{int(datetime.now().timestamp())}"
         
         # 确保对话存在于数据库
-        db_conv = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        db_conv = await db.get(Conversation, conversation_id)
         if not db_conv:
             db_conv = Conversation(id=conversation_id, title=request.message[:50], user_id=current_user.id)
             db.add(db_conv)
-            db.commit()
-            db.refresh(db_conv)
+            await db.commit()
         elif db_conv.user_id != current_user.id:
              raise HTTPException(status_code=403, detail="Not authorized to access this conversation")
 
@@ -438,7 +552,7 @@ async def chat(
             image_path=request.image_path
         )
         db.add(user_msg)
-        db.commit()
+        await db.commit()
 
         # 创建助手消息占位符
         assistant_msg = Message(
@@ -448,8 +562,7 @@ async def chat(
             message_type="text"
         )
         db.add(assistant_msg)
-        db.commit()
-        db.refresh(assistant_msg)
+        await db.commit()
 
         # 添加后台任务
         background_tasks.add_task(
@@ -476,18 +589,20 @@ async def chat(
 @router.delete("/history/{conversation_id}")
 async def delete_conversation(
     conversation_id: str, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ):
     """删除对话"""
-    conv = db.query(Conversation).filter(Conversation.id == conversation_id, Conversation.user_id == current_user.id).first()
+    conv = await db.scalar(
+        select(Conversation).where(Conversation.id == conversation_id, Conversation.user_id == current_user.id)
+    )
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     # 手动删除关联消息
-    db.query(Message).filter(Message.conversation_id == conversation_id).delete()
+    await db.execute(delete(Message).where(Message.conversation_id == conversation_id))
 
     
-    db.delete(conv)
-    db.commit()
+    await db.delete(conv)
+    await db.commit()
     return {"success": True, "message": "Conversation deleted"}
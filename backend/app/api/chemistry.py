@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+import zstandard
 from app.services.chemistry_service import ChemistryService
+from app.services.artifact_store import KINDS, get_artifact_store
 from loguru import logger
 
 router = APIRouter()
@@ -69,3 +71,33 @@ async def generate_3d_structure(
     except Exception as e:
         logger.error(f"结构图生成API错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+def accepts_zstd(request: Request) -> bool:
+    for item in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if coding.strip().lower() == "zstd" and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            return True
+    return False
+
+@router.get("/artifacts/{kind}/{artifact_id}")
+def get_artifact(kind: str, artifact_id: str, request: Request):
+    """获取消息附件（SDF / 属性表）
+
+    附件按内容寻址且写入后不变，ETag 即附件 ID，响应允许浏览器长期缓存；
+    客户端支持 zstd 时直接返回压缩后的文件，否则解压后返回。
+    """
+    compressed = get_artifact_store().read_compressed(kind, artifact_id)
+    if compressed is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+
+    headers = {
+        "ETag": f'"{artifact_id}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or headers["ETag"] in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    if accepts_zstd(request):
+        return Response(content=compressed, media_type=KINDS[kind], headers={**headers, "Content-Encoding": "zstd"})
+    return Response(content=zstandard.ZstdDecompressor().decompress(compressed), media_type=KINDS[kind], headers=headers)
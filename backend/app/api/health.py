@@ -1,7 +1,12 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Optional
 from app.core.config import settings
+from app.core.metrics import render_metrics
+from app.services.rag_service import get_rag_service
+import asyncio
 import psutil
 import os
 
@@ -14,6 +19,7 @@ class HealthResponse(BaseModel):
     version: str
     uptime: float
     system_info: dict
+    vector_store: Optional[dict] = None
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -27,15 +33,24 @@ async def health_check():
         "python_version": f"{psutil.version_info[0]}.{psutil.version_info[1]}.{psutil.version_info[2]}"
     }
     
+    # 向量库连通性（HTTP 模式下为 Chroma 心跳）
+    vector_store = await asyncio.get_event_loop().run_in_executor(None, get_rag_service().health)
+    
     return HealthResponse(
-        status="healthy",
+        status="healthy" if vector_store.get("status") == "ok" else "degraded",
         timestamp=datetime.now(),
         version=settings.VERSION,
         uptime=psutil.boot_time(),
-        system_info=system_info
+        system_info=system_info,
+        vector_store=vector_store
     )
 
 @router.get("/ping")
 async def ping():
     """简单的ping接口"""
-    return {"message": "pong"}
\ No newline at end of file
+    return {"message": "pong"}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 指标（每个 worker 进程独立统计）"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,45 +1,125 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, UploadFile, File, Form, Query, HTTPException, BackgroundTasks, Depends
 from fastapi.responses import JSONResponse
-from typing import List, Dict, Any
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional
+from datetime import datetime
 from pathlib import Path
+import asyncio
+import hashlib
 import os
-import shutil
+import time
 import uuid
 from loguru import logger
-from app.services.rag_service import RAGService
+from app.services.rag_service import RAGService, get_rag_service
+from app.services import knowledge_registry, knowledge_namespaces, knowledge_snapshot, knowledge_ingest
+from app.services import embedding_collections, embedding_migration, molecule_index
 from app.core.config import settings
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from app.db.base import get_db
-from app.models.sql_models import KnowledgeFile
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.base import get_db, get_async_db
+from app.models.sql_models import KnowledgeFile, KnowledgeNamespace, KnowledgeNamespaceMember, User
+from app.api import deps
 
 router = APIRouter(prefix="/knowledge", tags=["knowledge"])
 
-def get_rag_service() -> RAGService:
-    return RAGService()
+# 流式写入上传文件时每次读取的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def save_upload_with_hash(upload: UploadFile, file_path: Path) -> str:
+    """将上传文件流式写入磁盘，同时计算内容的 SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(file_path, "wb") as buffer:
+        while True:
+            chunk = upload.file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            buffer.write(chunk)
+    return sha256.hexdigest()
+
+class NamespaceCreate(BaseModel):
+    """创建团队命名空间"""
+    name: str
+    title: Optional[str] = None
+
+class NamespaceMember(BaseModel):
+    """团队命名空间成员"""
+    user_id: int
+
+class StructureSearch(BaseModel):
+    """按结构检索文献片段"""
+    query: str  # SMILES、本地名称表中的化合物名或 CAS 号
+    mode: str = "similarity"  # similarity（Morgan 指纹 Tanimoto）| substructure
+    threshold: float = 0.5  # 相似度检索的 Tanimoto 下限
+    top_k: int = 10
+    namespaces: Optional[List[str]] = None  # 默认为全部可检索命名空间
+
+def resolve_namespace(db: Session, user: User, namespace: Optional[str], manage: bool = False) -> str:
+    """校验当前用户对命名空间的写入（或管理）权限，未指定时使用个人命名空间"""
+    namespace = namespace or knowledge_namespaces.user_namespace(user.id)
+    allowed = knowledge_namespaces.can_manage if manage else knowledge_namespaces.can_write
+    if not allowed(db, user, namespace):
+        raise HTTPException(status_code=403, detail=f"No permission for knowledge namespace {namespace}")
+    return namespace
 
 @router.get("/files", response_model=List[Dict[str, Any]])
-async def list_files(db: Session = Depends(get_db)):
-    """列出知识库中的所有文件"""
-    files = db.query(KnowledgeFile).order_by(KnowledgeFile.upload_time.desc()).all()
+async def list_files(
+    namespace: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(deps.get_current_active_user)
+):
+    """列出当前用户可见命名空间中的文件"""
+    readable = await db.run_sync(knowledge_namespaces.readable_namespaces, current_user)
+    if namespace:
+        readable = [namespace] if namespace in readable else []
+    files = (await db.scalars(
+        select(KnowledgeFile).where(
+            KnowledgeFile.namespace.in_(readable)
+        ).order_by(KnowledgeFile.upload_time.desc())
+    )).all()
     return [
         {
             "id": f.id,
             "filename": f.filename,
             "size": f.file_size,
+            "chunks": f.chunk_count or 0,
+            "duplicate_chunks": f.duplicate_chunks or 0,
+            "dedup_ratio": knowledge_ingest.dedup_ratio(f.chunk_count or 0, f.duplicate_chunks or 0),
             "upload_time": f.upload_time,
             "status": f.status,
-            "error": f.error_message
+            "error": f.error_message,
+            "namespace": f.namespace,
+            "owner_id": f.owner_id
         }
         for f in files
     ]
 
 @router.delete("/files/{file_id}")
-async def delete_file(file_id: int, db: Session = Depends(get_db)):
-    """删除文件"""
+async def delete_file(
+    file_id: int,
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+    rag_service: RAGService = Depends(get_rag_service),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_user)
+):
+    """删除文件（上传者或命名空间管理者）"""
     file_record = db.query(KnowledgeFile).filter(KnowledgeFile.id == file_id).first()
-    if not file_record:
+    if not file_record or file_record.namespace not in knowledge_namespaces.readable_namespaces(db, current_user):
         raise HTTPException(status_code=404, detail="File not found")
+    is_owner = file_record.owner_id == current_user.id and knowledge_namespaces.can_write(db, current_user, file_record.namespace)
+    if not is_owner and not knowledge_namespaces.can_manage(db, current_user, file_record.namespace):
+        raise HTTPException(status_code=403, detail="Not authorized to delete this file")
+    
+    # 从向量数据库中删除对应的向量
+    try:
+        deleted = await knowledge_registry.delete_file_vectors(db, rag_service, file_id)
+        logger.info(f"已删除文件 {file_record.filename} 的 {deleted} 个向量")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to delete vectors of file {file_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to delete vectors from vector database")
     
     # 删除物理文件
     try:
@@ -47,63 +127,321 @@ async def delete_file(file_id: int, db: Session = Depends(get_db)):
             os.remove(file_record.file_path)
     except Exception as e:
         logger.error(f"Failed to delete file {file_record.file_path}: {e}")
-
-    # TODO: 从向量数据库中删除对应的向量 (需要 RAGService 支持)
     
     db.delete(file_record)
     db.commit()
+    knowledge_ingest.discard_parsed(db, file_record.content_hash)
+    background_tasks.add_task(restore_near_duplicates, rag_service)
     return {"success": True, "message": "File deleted"}
 
 @router.post("/reset")
 async def reset_knowledge_base(
+    namespace: Optional[str] = Query(None),
+    background_tasks: BackgroundTasks = BackgroundTasks(),
     rag_service: RAGService = Depends(get_rag_service),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_user)
 ):
-    """重置知识库（清空向量库和文件记录）"""
-    # 1. 清空向量库
-    success = await rag_service.clear_database()
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to clear vector database")
-    
-    # 2. 清空数据库记录
-    db.query(KnowledgeFile).delete()
-    db.commit()
-    
-    # 3. 清空物理文件
-    upload_dir = Path(settings.UPLOAD_DIR) / "knowledge_base"
-    if upload_dir.exists():
-        for item in upload_dir.iterdir():
-            if item.is_file():
-                try:
-                    item.unlink()
-                except Exception as e:
-                    logger.error(f"Failed to delete file {item}: {e}")
+    """重置一个命名空间（默认为个人命名空间）：删除其中的文件记录、向量和物理文件，其他命名空间不受影响"""
+    namespace = resolve_namespace(db, current_user, namespace, manage=True)
+    try:
+        result = await knowledge_registry.reset_namespace(db, rag_service, namespace)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to reset namespace {namespace}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to reset knowledge namespace")
 
-    return {"success": True, "message": "Knowledge base reset successfully"}
+    for path in result.pop("paths"):
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            logger.error(f"Failed to delete file {path}: {e}")
+    knowledge_ingest.prune_parsed_cache(db)
+    background_tasks.add_task(restore_near_duplicates, rag_service)
+
+    return {"success": True, "message": f"Knowledge namespace {namespace} reset successfully", **result}
 
 @router.get("/stats")
 async def get_knowledge_stats(
-    rag_service: RAGService = Depends(get_rag_service)
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_user)
+):
+    """获取当前用户可见命名空间的统计信息（读取维护好的计数器）"""
+    readable = knowledge_namespaces.readable_namespaces(db, current_user)
+    stats = knowledge_registry.get_namespace_stats(db, readable)
+    return {
+        "file_count": sum(entry["file_count"] for entry in stats.values()),
+        "total_chunks": sum(entry["total_chunks"] for entry in stats.values()),
+        "namespaces": stats
+    }
+
+@router.get("/namespaces")
+async def list_namespaces(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_user)
+):
+    """列出当前用户可见的命名空间及其权限"""
+    readable = knowledge_namespaces.readable_namespaces(db, current_user)
+    stats = knowledge_registry.get_namespace_stats(db, readable)
+    return [
+        {
+            "name": namespace,
+            "kind": knowledge_namespaces.namespace_kind(namespace),
+            "writable": knowledge_namespaces.can_write(db, current_user, namespace),
+            "manageable": knowledge_namespaces.can_manage(db, current_user, namespace),
+            **stats[namespace]
+        }
+        for namespace in readable
+    ]
+
+@router.post("/namespaces")
+async def create_namespace(
+    body: NamespaceCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
 ):
-    """获取知识库统计信息（直接来自向量库）"""
-    return await rag_service.get_database_stats()
+    """创建团队命名空间（管理员），创建者自动成为成员"""
+    if not knowledge_namespaces.TEAM_NAME_PATTERN.match(body.name):
+        raise HTTPException(status_code=400, detail="Namespace name may only contain letters, digits, '_' and '-'")
+    name = knowledge_namespaces.team_namespace(body.name)
+    if db.query(KnowledgeNamespace).filter(KnowledgeNamespace.name == name).first():
+        raise HTTPException(status_code=400, detail="Namespace already exists")
+    db.add(KnowledgeNamespace(name=name, title=body.title, owner_id=current_user.id))
+    db.add(KnowledgeNamespaceMember(namespace=name, user_id=current_user.id))
+    db.commit()
+    return {"success": True, "name": name}
+
+@router.post("/namespaces/{namespace}/members")
+async def add_namespace_member(
+    namespace: str,
+    body: NamespaceMember,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_user)
+):
+    """添加团队成员（团队所有者或管理员）"""
+    if knowledge_namespaces.namespace_kind(namespace) != "team":
+        raise HTTPException(status_code=400, detail="Only team namespaces have members")
+    resolve_namespace(db, current_user, namespace, manage=True)
+    if not db.query(User).filter(User.id == body.user_id).first():
+        raise HTTPException(status_code=404, detail="User not found")
+    exists = db.query(KnowledgeNamespaceMember).filter(
+        KnowledgeNamespaceMember.namespace == namespace,
+        KnowledgeNamespaceMember.user_id == body.user_id
+    ).first()
+    if not exists:
+        db.add(KnowledgeNamespaceMember(namespace=namespace, user_id=body.user_id))
+        db.commit()
+    return {"success": True}
+
+@router.delete("/namespaces/{namespace}/members/{user_id}")
+async def remove_namespace_member(
+    namespace: str,
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_user)
+):
+    """移除团队成员（团队所有者或管理员）"""
+    resolve_namespace(db, current_user, namespace, manage=True)
+    db.query(KnowledgeNamespaceMember).filter(
+        KnowledgeNamespaceMember.namespace == namespace,
+        KnowledgeNamespaceMember.user_id == user_id
+    ).delete(synchronize_session=False)
+    db.commit()
+    return {"success": True}
+
+@router.post("/stats/recount")
+async def recount_knowledge_stats(
+    rag_service: RAGService = Depends(get_rag_service),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
+):
+    """以向量库为准重新统计，校准计数器（管理员）"""
+    result = await asyncio.get_event_loop().run_in_executor(
+        None, knowledge_registry.recount_stats, db, rag_service
+    )
+    return {"success": True, **result}
+
+class SnapshotCreate(BaseModel):
+    """导出知识库快照"""
+    name: Optional[str] = None
+
+@router.post("/search-by-structure")
+async def search_by_structure(
+    body: StructureSearch,
+    rag_service: RAGService = Depends(get_rag_service),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_user)
+):
+    """返回提到与查询分子相似（或包含查询子结构）的分子的文献片段，只检索当前用户可见的命名空间"""
+    if rag_service.molecules is None:
+        raise HTTPException(status_code=503, detail="Molecule index unavailable (MOLECULE_INDEX_ENABLED or RDKit missing)")
+    if body.mode not in ("similarity", "substructure"):
+        raise HTTPException(status_code=400, detail="mode must be 'similarity' or 'substructure'")
+    molecule = molecule_index.resolve_query(body.query)
+    if molecule is None:
+        raise HTTPException(status_code=400, detail=f"Cannot parse structure: {body.query}")
+
+    start = time.perf_counter()
+    namespaces = knowledge_namespaces.search_namespaces(db, current_user, body.namespaces)
+    results = []
+    if namespaces:
+        results = await rag_service.search_by_structure(
+            molecule,
+            top_k=max(1, min(body.top_k, 100)),
+            mode=body.mode,
+            threshold=min(max(body.threshold, 0.0), 1.0),
+            where=knowledge_namespaces.namespace_filter(namespaces)
+        )
+    return {
+        "query": {"input": body.query, "smiles": molecule_index.canonical_smiles(molecule)},
+        "mode": body.mode,
+        "results": results,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+
+@router.get("/snapshots")
+async def list_snapshots(current_user: User = Depends(deps.get_current_active_superuser)):
+    """列出知识库快照（管理员）"""
+    return knowledge_snapshot.list_snapshots()
+
+@router.post("/snapshots")
+async def export_snapshot(
+    body: SnapshotCreate,
+    rag_service: RAGService = Depends(get_rag_service),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
+):
+    """导出知识库快照到 SNAPSHOT_DIR（管理员），耗时与语料规模线性相关"""
+    if rag_service._ensure_index() is None:
+        raise HTTPException(status_code=503, detail="Vector database unavailable")
+    try:
+        directory = knowledge_snapshot.resolve_snapshot(body.name or datetime.now().strftime("%Y%m%d-%H%M%S"))
+        manifest = await asyncio.get_event_loop().run_in_executor(
+            None, knowledge_snapshot.export_snapshot, db, rag_service.index, directory, rag_service.lexical
+        )
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "name": directory.name, **manifest}
+
+@router.post("/snapshots/{name}/import")
+async def import_snapshot(
+    name: str,
+    verify: bool = Query(False),
+    rag_service: RAGService = Depends(get_rag_service),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
+):
+    """把快照导入空的知识库（管理员），不调用嵌入模型"""
+    if rag_service._ensure_index() is None:
+        raise HTTPException(status_code=503, detail="Vector database unavailable")
+    try:
+        directory = knowledge_snapshot.resolve_snapshot(name)
+        result = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: knowledge_snapshot.import_snapshot(
+                db, rag_service.index, directory,
+                lexical=rag_service.lexical, router=rag_service.router,
+                near_duplicates=rag_service.near_duplicates, molecules=rag_service.molecules, verify=verify
+            )
+        )
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **result}
+
+class EmbeddingMigrationCreate(BaseModel):
+    """迁移到新的嵌入模型，未指定时使用配置中的模型"""
+    provider: Optional[str] = None  # siliconflow | local
+    model: Optional[str] = None
+    dimensions: Optional[int] = None
+
+@router.get("/embedding-collections")
+async def list_embedding_collections(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
+):
+    """列出嵌入集合版本和迁移进度（管理员）"""
+    return embedding_collections.list_collections(db)
+
+@router.post("/embedding-collections/migrate")
+async def start_embedding_migration(
+    body: EmbeddingMigrationCreate,
+    background_tasks: BackgroundTasks,
+    rag_service: RAGService = Depends(get_rag_service),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
+):
+    """后台用新嵌入模型建立新版本集合，完成后原子切换；迁移期间查询继续使用当前集合（管理员）"""
+    spec = embedding_collections.configured_spec()
+    if body.provider or body.model or body.dimensions is not None:
+        spec = {
+            "provider": body.provider or spec["provider"],
+            "model": body.model or spec["model"],
+            "dimensions": body.dimensions if body.dimensions is not None else spec["dimensions"]
+        }
+    try:
+        collection = await asyncio.get_event_loop().run_in_executor(
+            None, embedding_migration.start_migration, db, spec
+        )
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(embedding_migration.run_migration, collection["version"], rag_service)
+    return {"success": True, **collection}
+
+@router.post("/embedding-collections/rollback")
+async def rollback_embedding_collection(
+    background_tasks: BackgroundTasks,
+    rag_service: RAGService = Depends(get_rag_service),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
+):
+    """切回上一个嵌入集合，先在后台补齐切换之后的增删（管理员）"""
+    try:
+        collection = embedding_migration.prepare_rollback(db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(embedding_migration.run_migration, collection["version"], rag_service)
+    return {"success": True, **collection}
+
+@router.post("/embedding-collections/cancel")
+async def cancel_embedding_migration(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
+):
+    """取消进行中的迁移，当前集合保持生效（管理员）"""
+    try:
+        return {"success": True, **embedding_migration.cancel_migration(db)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/embedding-collections/inactive")
+async def drop_inactive_embedding_collections(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
+):
+    """删除已停用和失败的集合版本以释放空间，删除后不能再回滚到这些版本（管理员）"""
+    dropped = await asyncio.get_event_loop().run_in_executor(None, embedding_migration.drop_inactive, db)
+    return {"success": True, "dropped": dropped}
 
 @router.post("/upload")
 async def upload_documents(
     files: List[UploadFile] = File(...),
+    namespace: Optional[str] = Form(None),
     background_tasks: BackgroundTasks = BackgroundTasks(),
     rag_service: RAGService = Depends(get_rag_service),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_user)
 ):
     """
     上传文档到知识库
 
     Args:
         files: 上传的文件列表 (PDF, TXT, MD)
+        namespace: 目标命名空间，默认为上传者的个人命名空间
 
     Returns:
         上传结果
     """
+    namespace = resolve_namespace(db, current_user, namespace)
     try:
         logger.info(f"接收到 {len(files)} 个文档上传请求")
 
@@ -112,25 +450,44 @@ async def upload_documents(
         upload_dir.mkdir(parents=True, exist_ok=True)
 
         saved_files_info = []
+        duplicate_files_info = []
 
         for file in files:
             # 检查文件类型
             ext = Path(file.filename).suffix.lower()
-            if ext not in ['.pdf', '.txt', '.md']:
+            if ext not in knowledge_ingest.SUPPORTED_EXTENSIONS:
                 continue
 
-            # 保存文件
+            # 保存文件（边写入边计算内容哈希）
             safe_filename = f"{uuid.uuid4()}_{file.filename}"
             file_path = upload_dir / safe_filename
+            content_hash = save_upload_with_hash(file, file_path)
+
+            # 同一命名空间中内容完全相同的文件已存在时直接复用已有记录，不再重复解析和建立索引
+            existing = db.query(KnowledgeFile).filter(
+                KnowledgeFile.content_hash == content_hash,
+                KnowledgeFile.namespace == namespace,
+                KnowledgeFile.status != "failed"
+            ).first()
+            if existing:
+                logger.info(f"文件 {file.filename} 与已有文件 {existing.filename} (id={existing.id}) 内容相同，跳过索引")
+                file_path.unlink(missing_ok=True)
+                duplicate_files_info.append({
+                    "filename": file.filename,
+                    "db_id": existing.id,
+                    "existing_filename": existing.filename,
+                    "status": existing.status
+                })
+                continue
 
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
             # 记录到数据库
             db_file = KnowledgeFile(
                 filename=file.filename,
                 file_path=str(file_path),
                 file_size=os.path.getsize(file_path),
+                content_hash=content_hash,
+                namespace=namespace,
+                owner_id=current_user.id,
                 status="pending"
             )
             db.add(db_file)
@@ -142,16 +499,23 @@ async def upload_documents(
                 "db_id": db_file.id
             })
 
-        if not saved_files_info:
+        if not saved_files_info and not duplicate_files_info:
             raise HTTPException(status_code=400, detail="没有有效的文档被上传 (仅支持 PDF, TXT, MD)")
 
         # 在后台处理文档索引
-        background_tasks.add_task(process_documents, rag_service, saved_files_info, db)
+        if saved_files_info:
+            background_tasks.add_task(process_documents, rag_service, saved_files_info, db)
+
+        message = f"成功上传 {len(saved_files_info)} 个文档，正在后台建立索引..."
+        if duplicate_files_info:
+            message += f" {len(duplicate_files_info)} 个文档与知识库中已有文件内容相同，已跳过"
 
         return JSONResponse(content={
             "success": True,
-            "message": f"成功上传 {len(saved_files_info)} 个文档，正在后台建立索引...",
-            "files": [f["path"] for f in saved_files_info]
+            "message": message,
+            "files": [f["path"] for f in saved_files_info],
+            "duplicates": duplicate_files_info,
+            "namespace": namespace
         })
 
     except Exception as e:
@@ -162,9 +526,8 @@ async def process_documents(rag_service: RAGService, files_info: List[Dict], db:
     """后台处理文档索引"""
     try:
         logger.info(f"开始后台处理 {len(files_info)} 个文档")
-
-        from langchain_community.document_loaders import PyPDFLoader, TextLoader
-        from langchain_core.documents import Document
+        total_chunks = 0
+        total_duplicates = 0
 
         for info in files_info:
             file_path = info["path"]
@@ -181,28 +544,24 @@ async def process_documents(rag_service: RAGService, files_info: List[Dict], db:
             file_record = bg_db.query(KnowledgeFile).filter(KnowledgeFile.id == db_id).first()
 
             try:
-                path_obj = Path(file_path)
-                ext = path_obj.suffix.lower()
-
-                if ext == '.pdf':
-                    loader = PyPDFLoader(file_path)
-                else:
-                    loader = TextLoader(file_path, encoding='utf-8')
-
-                docs = loader.load()
-                
-                # 添加元数据
-                for doc in docs:
-                    doc.metadata["source"] = file_record.filename
-                    doc.metadata["file_id"] = file_record.id
-
-                await rag_service.add_documents(docs)
-                
-                file_record.status = "indexed"
-                bg_db.commit()
-                
+                # 解析结果按内容哈希缓存，之后调整切分参数或更换嵌入模型重建索引时不再解析原文件；
+                # 登记 chunk ID 与状态更新在同一事务中提交
+                await knowledge_ingest.index_file(bg_db, rag_service, file_record)
+                total_chunks += file_record.chunk_count or 0
+                total_duplicates += file_record.duplicate_chunks or 0
+                if file_record.duplicate_chunks:
+                    logger.info(
+                        f"文件 {file_record.filename}: 写入 {file_record.chunk_count} 个片段，跳过 "
+                        f"{file_record.duplicate_chunks} 个近重复片段"
+                    )
             except Exception as e:
                 logger.error(f"处理文件 {file_path} 失败: {e}")
+                bg_db.rollback()
+                # 清理已经写入向量库的部分批次，避免残留未登记的向量
+                try:
+                    await rag_service.delete_vectors_by_file(db_id)
+                except Exception as cleanup_error:
+                    logger.error(f"清理文件 {file_path} 的残留向量失败: {cleanup_error}")
                 if file_record:
                     file_record.status = "failed"
                     file_record.error_message = str(e)
@@ -210,21 +569,41 @@ async def process_documents(rag_service: RAGService, files_info: List[Dict], db:
             finally:
                 bg_db.close()
 
-        logger.info("后台文档处理完成")
+        logger.info(
+            f"后台文档处理完成: 写入 {total_chunks} 个片段，跳过 {total_duplicates} 个近重复片段，"
+            f"去重率 {knowledge_ingest.dedup_ratio(total_chunks, total_duplicates):.1%}"
+        )
 
     except Exception as e:
         logger.error(f"后台任务执行失败: {str(e)}")
 
+async def restore_near_duplicates(rag_service: RAGService):
+    """后台重建依据已删除片段被跳过的文件"""
+    from app.db.base import SessionLocal
+    bg_db = SessionLocal()
+    try:
+        await knowledge_ingest.restore_near_duplicates(bg_db, rag_service)
+    except Exception as e:
+        logger.error(f"恢复近重复片段失败: {str(e)}")
+    finally:
+        bg_db.close()
+
 @router.get("/stats")
 async def get_knowledge_base_stats(rag_service: RAGService = Depends(get_rag_service)):
     """获取知识库统计信息"""
     return await rag_service.get_collection_stats()
 
 @router.delete("/clear")
-async def clear_knowledge_base(rag_service: RAGService = Depends(get_rag_service)):
-    """清空知识库"""
-    success = await rag_service.clear_collection()
+async def clear_knowledge_base(
+    rag_service: RAGService = Depends(get_rag_service),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_active_superuser)
+):
+    """清空全部命名空间的向量（管理员）"""
+    success = await rag_service.clear_database()
     if success:
+        knowledge_registry.reset_registry(db)
+        db.commit()
         return {"success": True, "message": "知识库已清空"}
     else:
         raise HTTPException(status_code=500, detail="清空知识库失败")
@@ -19,6 +19,21 @@ class Settings(BaseSettings):
     
     # 数据库配置
     DATABASE_URL: str = "sqlite:///./chemistry_bot.db"
+    # 单个请求的数据库累计耗时超过该值（毫秒）时记录警告，0 为不记录
+    DB_SLOW_REQUEST_MS: float = 200
+    # PostgreSQL 等服务端数据库的连接池（每个 worker 进程的同步、异步引擎各一个池）
+    # 单个 worker 最多占用 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW) 个连接，多 worker 部署时注意数据库的 max_connections
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30  # 等待空闲连接的秒数
+    DB_POOL_RECYCLE: int = 1800  # 连接存活超过该秒数后重建，避免被数据库或代理断开
+    DB_POOL_PRE_PING: bool = True  # 取出连接前检查是否可用
+    # SQLite 连接参数（每个连接建立时设置）：WAL 下读写互不阻塞，写入冲突时等待 busy_timeout 而不是立即报 database is locked
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # WAL 下 NORMAL 不会损坏数据库，断电时可能丢失最后几个事务
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_MB: int = 64  # 每个连接的页缓存
+    SQLITE_MMAP_SIZE_MB: int = 256  # 0 为不使用内存映射
     
     # RAG配置
     EMBEDDING_MODEL: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
@@ -26,6 +41,108 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
     
+    # 向量索引后端: chroma / numpy（精确检索，适合小规模语料）/ hnswlib
+    VECTOR_BACKEND: str = "chroma"
+    CHROMA_MODE: str = "embedded"  # embedded: 本地 PersistentClient; http: 连接 Chroma 服务
+    CHROMA_HOST: str = "localhost"
+    CHROMA_PORT: int = 8001
+    CHROMA_SSL: bool = False
+    CHROMA_AUTH_TOKEN: str = ""
+    HNSW_M: int = 16
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64
+    VECTOR_RESCORE_FACTOR: int = 0  # int8/binary 索引精排候选数 = k * 该值，0 表示按量化方式取默认值（4 / 16）
+    
+    # 嵌入向量截断维度（Matryoshka 式截断后重新归一化），0 表示使用模型原始维度；
+    # 修改后需运行 scripts/reproject_embeddings.py 迁移已有集合
+    EMBEDDING_DIMENSIONS: int = 0
+    
+    # 本地嵌入模型推理后端: torch（sentence-transformers）| onnx（ONNX Runtime，首次使用时导出并缓存）
+    LOCAL_EMBEDDING_BACKEND: str = "torch"
+    ONNX_MODEL_DIR: str = "./models/onnx"
+    ONNX_QUANTIZE: bool = True  # int8 动态量化
+    ONNX_NUM_THREADS: int = 0  # 0 表示使用 ONNX Runtime 默认线程数
+    
+    # 本地嵌入模型的查询微批处理
+    EMBEDDING_BATCH_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    
+    # 向量索引压缩配置
+    VECTOR_COMPACTION_INTERVAL: int = 3600  # 检查间隔（秒），0 表示关闭定时压缩
+    VECTOR_COMPACTION_THRESHOLD: float = 0.2  # 已删除向量占比超过该值时重建集合
+    VECTOR_COMPACTION_MIN_DELETED: int = 100  # 已删除向量数低于该值时不压缩
+    VECTOR_COMPACTION_GRACE_SECONDS: int = 60  # Chroma 集合切换后等待其他 worker 重新解析，再删除旧集合
+    
+    # 语义答案缓存配置
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY: float = 0.92  # 问题向量余弦相似度阈值
+    ANSWER_CACHE_MAX_ENTRIES: int = 5000
+    ANSWER_CACHE_TTL_HOURS: int = 168
+    ANSWER_CACHE_NON_RAG: bool = False  # 是否也缓存不检索知识库的回答（查缓存需要计算问题向量）
+    
+    # 检索重排序配置
+    RERANK_MODE: str = "cross_encoder"  # cross_encoder | lexical | none
+    RERANK_MODEL: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # 多语言小模型，CPU 可用
+    RERANK_BATCH_SIZE: int = 16
+    RERANK_CANDIDATES: int = 20  # 向量检索召回的候选数
+    RERANK_TOP_N: int = 5  # 最多写入提示词的片段数
+    RERANK_SCORE_CUTOFF: float = 0.1  # 重排序得分（0~1）低于该值的片段丢弃
+    
+    # 两级检索：先按文件质心向量选出候选文件，再在这些文件的 chunk 中检索
+    DOCUMENT_ROUTING_ENABLED: bool = True
+    DOCUMENT_ROUTING_MIN_FILES: int = 100  # 文件数低于该值时直接全量检索
+    DOCUMENT_ROUTING_TOP_FILES: int = 20  # 每次查询保留的候选文件数
+    
+    # 化学标识符词法检索配置（SQLite FTS5，与向量库同时写入）
+    LEXICAL_INDEX_ENABLED: bool = True
+    LEXICAL_INDEX_PATH: str = "./data/lexical_index.db"
+    LEXICAL_MIN_HITS: int = 3  # 查询含 CAS 号/分子式/InChIKey 且词法命中不少于该数量时跳过向量检索
+    LEXICAL_FUSION_K: int = 60  # 词法与向量结果倒数排名融合的平滑常数
+    
+    # 解析结果缓存：按内容哈希保存 PDF/文本解析出的逐页文本，重建索引时不再解析原文件
+    PARSED_TEXT_CACHE_ENABLED: bool = True
+    PARSED_TEXT_CACHE_DIR: str = ""  # 留空表示 UPLOAD_DIR/knowledge_parsed
+    
+    # 近重复片段去重：入库前计算字符 shingle 的 MinHash 签名，经 LSH 找出与已入库片段
+    # Jaccard 相似度不低于阈值的片段并跳过（不调用嵌入模型）；签名参数修改后运行 scripts/build_near_duplicate_index.py
+    NEAR_DUPLICATE_ENABLED: bool = True
+    NEAR_DUPLICATE_INDEX_PATH: str = "./data/near_duplicates.db"
+    NEAR_DUPLICATE_THRESHOLD: float = 0.85
+    NEAR_DUPLICATE_NUM_PERM: int = 128
+    NEAR_DUPLICATE_SHINGLE_SIZE: int = 5
+    
+    # 分子结构索引：入库时识别片段中的 SMILES、化合物名和 CAS 号，用 RDKit 规范化后登记分子 -> chunk，
+    # 按 Morgan 指纹 Tanimoto 相似度或子结构检索文献片段（/knowledge/search-by-structure）
+    MOLECULE_INDEX_ENABLED: bool = True
+    MOLECULE_INDEX_PATH: str = "./data/molecule_index.db"
+    
+    # 消息附件：工具生成的 SDF 和属性表按 (类型, 规范 SMILES) 保存为 zstd 压缩文件，消息中只保存引用，
+    # 前端通过 /api/v1/chemistry/artifacts/{kind}/{id} 按需获取（带 ETag，可长期缓存）
+    ARTIFACT_DIR: str = ""  # 留空表示 UPLOAD_DIR/artifacts
+    ARTIFACT_ZSTD_LEVEL: int = 10
+    
+    # 知识库快照目录（scripts/knowledge_snapshot.py 和 /knowledge/snapshots 接口读写）
+    SNAPSHOT_DIR: str = "./data/snapshots"
+
+    # 嵌入模型迁移：后台把现有 chunk 用新模型写入新版本集合，完成后原子切换（scripts/migrate_embeddings.py）
+    EMBEDDING_MIGRATION_BATCH_SIZE: int = 64
+    EMBEDDING_MIGRATION_MAX_PER_MINUTE: int = 0  # 每分钟最多嵌入的 chunk 数（远程 API 限流），0 表示不限
+    EMBEDDING_MIGRATION_AUTO_RESUME: bool = True  # 启动时继续未完成的迁移任务
+    EMBEDDING_MIGRATION_GRACE_SECONDS: int = 90  # 切换后等待其他 worker 切换完成，再补齐旧集合上的写入
+    EMBEDDING_COLLECTION_REFRESH_SECONDS: int = 30  # 各 worker 检查当前生效集合的间隔
+
+    # 上下文后处理配置
+    CONTEXT_MERGE_ENABLED: bool = True  # 合并相邻片段并去除重复内容
+    CONTEXT_SENTENCE_SELECTION: bool = False  # 按句子与问题的相似度做抽取式压缩（每轮额外一次嵌入调用）
+    CONTEXT_SENTENCE_MIN_SCORE: float = 0.4
+    CONTEXT_MIN_SENTENCES: int = 2  # 每个片段至少保留的句子数
+    
+    # 检索门控配置
+    RETRIEVAL_GATE_ENABLED: bool = True  # 知识库为空、纯工具请求或闲聊时跳过检索
+    RETRIEVAL_GATE_SCORE_GAP: float = 0.15  # 相邻片段得分差超过该值时截断，0 表示不截断
+    RETRIEVAL_GATE_LOG: str = "./logs/retrieval_gate.jsonl"  # 门控决策日志，留空表示不写文件
+    
     # LLM配置
     LLM_MODEL: str = "chatglm3-6b"  # 或者使用OpenAI API
     OPENAI_API_KEY: str = ""
@@ -1,15 +1,90 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.db import timing
 
-SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+# 连接串未指定驱动时使用的驱动：同步引擎 PostgreSQL 用 psycopg (3)；异步引擎 SQLite 用 aiosqlite，PostgreSQL 用 asyncpg
+SYNC_DRIVERS = {
+    "postgresql": "postgresql+psycopg",
+    "postgres": "postgresql+psycopg",
+}
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+# 异步引擎不能使用的同步驱动，连接串指定了它们时替换为异步驱动
+BLOCKING_DRIVERS = {"pysqlite", "psycopg2", "psycopg", "pg8000"}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def _with_driver(url: str, drivers: dict, replace: set = frozenset()) -> str:
+    scheme, sep, rest = url.partition("://")
+    dialect, _, driver = scheme.partition("+")
+    if not sep or dialect not in drivers or (driver and driver not in replace):
+        return url
+    return f"{drivers[dialect]}://{rest}"
+
+def sync_database_url(url: str) -> str:
+    """同步引擎的连接串：未指定驱动时补上默认驱动，已指定驱动时保持不变"""
+    return _with_driver(url, SYNC_DRIVERS)
+
+def async_database_url(url: str) -> str:
+    """异步引擎的连接串：未指定驱动或指定的是同步驱动时换成对应的异步驱动"""
+    return _with_driver(url, ASYNC_DRIVERS, BLOCKING_DRIVERS)
+
+SQLALCHEMY_DATABASE_URL = sync_database_url(settings.DATABASE_URL)
+
+def engine_options(url: str) -> dict:
+    """SQLite 允许跨线程使用连接；服务端数据库使用可配置的连接池"""
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+def sqlite_pragmas() -> list:
+    return [
+        f"journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"cache_size={-int(settings.SQLITE_CACHE_SIZE_MB) * 1024}",
+        f"mmap_size={int(settings.SQLITE_MMAP_SIZE_MB) * 1024 * 1024}",
+        "temp_store=MEMORY",
+    ]
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cursor.execute(f"PRAGMA {pragma}")
+    finally:
+        cursor.close()
+
+def configure_sqlite(sync_engine) -> None:
+    """SQLite 引擎在每个新连接上设置 WAL、同步级别、忙等待和缓存参数"""
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+
+# 同步引擎：后台任务、脚本和尚未迁移的同步接口使用
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎：async 接口使用，数据库往返不阻塞事件循环
+ASYNC_DATABASE_URL = async_database_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+# 提交后不过期对象，避免之后读取属性时触发隐式的同步加载
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+configure_sqlite(engine)
+configure_sqlite(async_engine.sync_engine)
+timing.instrument(engine)
+timing.instrument(async_engine.sync_engine)
+
 Base = declarative_base()
 
 def get_db():
@@ -18,3 +93,16 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def sync_id_sequence(db, table: str, column: str = "id") -> None:
+    """按显式 ID 批量写入后，把 PostgreSQL 的自增序列推进到当前最大值（SQLite 自动处理）"""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    db.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+        f"COALESCE(MAX({column}), 1), MAX({column}) IS NOT NULL) FROM {table}"
+    ))
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,102 @@
+"""按接口统计数据库耗时
+
+在引擎上挂 cursor 执行事件累计每条 SQL 的耗时，累加到当前请求的计时器（contextvar）中；
+中间件在响应开始时把结果写入 Server-Timing 响应头和 Prometheus 直方图 db_request_seconds。
+同步会话在线程池中执行、异步会话在 greenlet 中执行，都继承请求的上下文，因此两种会话的查询都会被计入。
+"""
+from contextvars import ContextVar
+from typing import Optional
+import time
+
+from loguru import logger
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.metrics import Histogram
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+db_request_seconds = Histogram("db_request_seconds", "单个请求内数据库查询的累计耗时")
+db_request_queries = Histogram("db_request_queries", "单个请求执行的 SQL 条数", QUERY_BUCKETS)
+
+class RequestTiming:
+    __slots__ = ("seconds", "queries")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("db_request_timing", default=None)
+
+def current() -> Optional[RequestTiming]:
+    return _current.get()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start_time"].pop()
+    timing = _current.get()
+    if timing is not None:
+        timing.seconds += time.perf_counter() - start
+        timing.queries += 1
+
+def _handle_error(exception_context):
+    # 执行失败时不会触发 after_cursor_execute，丢弃对应的开始时间
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+
+def instrument(sync_engine) -> None:
+    """给同步引擎（异步引擎传 async_engine.sync_engine）挂计时事件"""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+def route_template(scope) -> str:
+    """匹配到的路由模板（/api/v1/chat/history/{conversation_id}），未匹配时为 unmatched
+
+    新版 FastAPI 中 include_router 的路由只记录相对路径，前缀按段数从实际路径中补回
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    if ":path}" in template:
+        return template
+    segments = scope["path"].rstrip("/").split("/")
+    depth = len(template.rstrip("/").split("/"))
+    prefix = "/".join(segments[:len(segments) - depth + 1]) if len(segments) >= depth else ""
+    return prefix + template
+
+class DBTimingMiddleware:
+    """ASGI 中间件：统计每个请求的数据库耗时，按路由模板分组"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                labels = {"method": scope["method"], "route": route_template(scope)}
+                db_request_seconds.observe(timing.seconds, labels)
+                db_request_queries.observe(timing.queries, labels)
+                elapsed_ms = timing.seconds * 1000
+                if settings.DB_SLOW_REQUEST_MS and elapsed_ms >= settings.DB_SLOW_REQUEST_MS:
+                    logger.warning(f"数据库耗时较高: {labels['method']} {labels['route']} {elapsed_ms:.1f}ms / {timing.queries} 条 SQL")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", f"db;dur={elapsed_ms:.2f};desc=\"{timing.queries} queries\"".encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
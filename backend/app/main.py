@@ -6,8 +6,11 @@ from app.api import chat, health, chemistry, knowledge, upload, auth
 from app.api.v1 import spectrum
 from app.core.config import settings
 from app.core.logging import setup_logging
-from app.db.base import engine, Base
+from app.db.base import engine, async_engine, Base
+from app.db.timing import DBTimingMiddleware
 from app.models import sql_models
+from app.services import knowledge_registry, embedding_migration
+import asyncio
 import os
 
 # 设置 Hugging Face 镜像 (针对国内网络环境)
@@ -40,6 +43,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 按接口统计数据库耗时（Server-Timing 响应头和 /api/v1/metrics）
+app.add_middleware(DBTimingMiddleware)
+
 # 确保上传目录存在
 os.makedirs("data/uploads", exist_ok=True)
 # 确保静态目录存在
@@ -58,6 +64,19 @@ app.include_router(spectrum.router, prefix="/api/v1", tags=["光谱分析"])
 app.include_router(chemistry.router, prefix="/api/v1/chemistry", tags=["化学工具"])
 app.include_router(knowledge.router, prefix="/api/v1", tags=["知识库管理"])
 
+@app.on_event("startup")
+async def start_background_jobs():
+    """启动后台定时任务"""
+    # 定时检查已删除向量占比，超过阈值时重建向量集合
+    asyncio.create_task(knowledge_registry.run_compaction_scheduler())
+    # 继续执行未完成的嵌入模型迁移任务（其他 worker 执行中断后接手）
+    asyncio.create_task(embedding_migration.run_migration_supervisor())
+
+@app.on_event("shutdown")
+async def close_database():
+    """关闭异步引擎的连接池"""
+    await async_engine.dispose()
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, LargeBinary, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.base import Base
 
+# JSON 列：PostgreSQL 上为 JSONB，SQLite 上以 JSON 文本存储；读写均为 Python dict
+JSONData = JSON().with_variant(JSONB(), "postgresql")
+
 class User(Base):
     __tablename__ = "users"
 
@@ -26,7 +30,10 @@ class Conversation(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
     user = relationship("User", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", order_by="Message.created_at")
+
+    # 对话列表按用户过滤、按更新时间倒序
+    __table_args__ = (Index("ix_conversations_user_id_updated_at", "user_id", "updated_at"),)
 
 class Message(Base):
     __tablename__ = "messages"
@@ -37,11 +44,14 @@ class Message(Base):
     content = Column(Text)
     message_type = Column(String, default="text") # text, image, molecule
     image_path = Column(String, nullable=True)
-    data = Column(Text, nullable=True) # JSON string for extra data (sdf, properties, etc.)
+    data = Column(JSONData, nullable=True) # extra data (smiles, image, artifact refs for sdf/properties)
     created_at = Column(DateTime, default=datetime.now)
 
     conversation = relationship("Conversation", back_populates="messages")
 
+    # 历史和上下文查询按对话过滤、按创建时间排序
+    __table_args__ = (Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at"),)
+
 class KnowledgeFile(Base):
     __tablename__ = "knowledge_files"
 
@@ -49,7 +59,98 @@ class KnowledgeFile(Base):
     filename = Column(String, index=True)
     file_path = Column(String)
     file_size = Column(Integer)
+    content_hash = Column(String(64), index=True, nullable=True) # SHA-256 of file content, used for upload deduplication
+    namespace = Column(String, index=True, default="shared") # knowledge namespace: shared, user:<id> or team:<name>
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=True) # uploader
+    chunk_count = Column(Integer, default=0) # number of chunks in the vector store
+    duplicate_chunks = Column(Integer, default=0) # near-duplicate chunks skipped at ingest
     upload_time = Column(DateTime, default=datetime.now)
     status = Column(String, default="pending") # pending, indexed, failed
     error_message = Column(Text, nullable=True)
-    vector_ids = Column(Text, nullable=True) # JSON string of vector IDs if needed
+    vector_ids = Column(Text, nullable=True) # deprecated: chunk IDs now live in knowledge_chunks
+
+class KnowledgeNamespace(Base):
+    """团队知识库命名空间（shared 和 user:<id> 为隐式命名空间，不需要记录）"""
+    __tablename__ = "knowledge_namespaces"
+
+    name = Column(String, primary_key=True) # team:<name>
+    title = Column(String, nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+class KnowledgeNamespaceMember(Base):
+    """团队命名空间成员：成员可检索和上传，命名空间所有者和管理员可管理成员和重置"""
+    __tablename__ = "knowledge_namespace_members"
+
+    namespace = Column(String, ForeignKey("knowledge_namespaces.name"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+class KnowledgeChunk(Base):
+    """chunk 注册表：记录每个文件写入向量库的 chunk ID，用于按文件删除向量"""
+    __tablename__ = "knowledge_chunks"
+
+    id = Column(String, primary_key=True) # chunk ID in the vector store
+    file_id = Column(Integer, ForeignKey("knowledge_files.id"), index=True, nullable=False)
+    chunk_index = Column(Integer)
+    content_hash = Column(String(64), index=True) # SHA-256 of chunk text
+    created_at = Column(DateTime, default=datetime.now)
+
+class KnowledgeStats(Base):
+    """知识库统计计数器，在建立索引和删除文件时与注册表同一事务更新"""
+    __tablename__ = "knowledge_stats"
+
+    scope = Column(String, primary_key=True) # "global" or a knowledge namespace
+    file_count = Column(Integer, default=0)
+    total_chunks = Column(Integer, default=0)
+    version = Column(Integer, default=0) # bumped on every knowledge base content change
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class VectorCollectionState(Base):
+    """向量集合状态：记录存活/已删除向量数，用于判断何时压缩索引"""
+    __tablename__ = "vector_collections"
+
+    name = Column(String, primary_key=True)
+    live_vectors = Column(Integer, default=0)
+    deleted_vectors = Column(Integer, default=0) # deleted since last compaction
+    last_compacted_at = Column(DateTime, nullable=True)
+    compaction_started_at = Column(DateTime, nullable=True) # lease held by the worker running compaction
+    physical_name = Column(String, nullable=True) # Chroma collection currently serving this name, NULL = name itself
+    compaction_target = Column(String, nullable=True) # collection being filled by compaction, writes are mirrored to it
+
+class EmbeddingCollection(Base):
+    """嵌入集合版本：每个版本对应一个嵌入模型及其 chunk 集合和文件质心集合，同一时刻只有一个 active"""
+    __tablename__ = "embedding_collections"
+
+    name = Column(String, primary_key=True) # chunk collection name
+    documents_name = Column(String, nullable=False) # file centroid collection name
+    version = Column(Integer, unique=True, nullable=False)
+    provider = Column(String, nullable=False) # siliconflow | local
+    model = Column(String, nullable=False)
+    dimensions = Column(Integer, default=0) # EMBEDDING_DIMENSIONS truncation, 0 = full model output
+    dimension = Column(Integer, nullable=True) # actual vector dimension stored in the collection
+    status = Column(String, index=True, nullable=False) # building | active | retired | failed | dropped
+    previous = Column(String, nullable=True) # collection that was active before this one
+    total_chunks = Column(Integer, default=0)
+    migrated_chunks = Column(Integer, default=0)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    activated_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True) # lease held by the worker running the migration
+
+class AnswerCacheEntry(Base):
+    """语义答案缓存：按问题向量的余弦相似度复用历史回答"""
+    __tablename__ = "answer_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    question = Column(Text)
+    normalized_question = Column(Text)
+    embedding = Column(LargeBinary) # float32, L2-normalized
+    answer = Column(Text)
+    message_type = Column(String, default="text")
+    data = Column(JSONData, nullable=True) # same format as Message.data
+    kb_version = Column(Integer, index=True)
+    tool_fingerprint = Column(String(64), index=True)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    last_hit_at = Column(DateTime, nullable=True)
@@ -0,0 +1,175 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from functools import lru_cache
+import hashlib
+import re
+import threading
+import unicodedata
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from loguru import logger
+from app.core.config import settings
+from app.models.sql_models import AnswerCacheEntry
+
+# 不应写入缓存的回答（错误信息或未完成的工具调用）
+UNCACHEABLE_PREFIXES = ("生成回答时发生错误", "API未配置", "处理请求时发生错误")
+TOOL_MARKERS = ("chemistry_tool", "spectrum_tool")
+
+_PUNCTUATION = re.compile(r"[\s\?？!！。.,，;；:：、~～\"'“”‘’]+")
+
+def normalize_question(text: str) -> str:
+    """问题归一化：全角转半角、小写、去除空白和标点"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _PUNCTUATION.sub(" ", text).strip()
+
+@lru_cache(maxsize=1)
+def tool_fingerprint() -> str:
+    """模型、系统提示词（工具定义）和 RDKit 版本的指纹，任一变化都会让旧缓存失效"""
+    from app.services.llm_service import LLMService
+    try:
+        from rdkit import __version__ as rdkit_version
+    except ImportError:
+        rdkit_version = "none"
+
+    prompt = LLMService()._build_system_prompt()
+    payload = "\n".join([settings.UNIFIED_MODEL_NAME, rdkit_version, prompt])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def is_cacheable_answer(answer: Optional[str]) -> bool:
+    """只缓存正常完成的回答"""
+    if not answer:
+        return False
+    if answer.startswith(UNCACHEABLE_PREFIXES):
+        return False
+    return not any(marker in answer for marker in TOOL_MARKERS)
+
+class SemanticAnswerCache:
+    """语义答案缓存
+
+    缓存条目保存在数据库中，按 (知识库版本, 工具指纹) 划分作用域；
+    当前作用域的问题向量在进程内缓存为矩阵，查找只需一次矩阵乘法。
+    其他 worker 写入新条目时通过 max(id) 检测并重新加载。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scope = None
+        self._max_id = 0
+        self._ids: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def _scope_query(self, db: Session, kb_version: int, fingerprint: str):
+        expires = datetime.now() - timedelta(hours=settings.ANSWER_CACHE_TTL_HOURS)
+        return db.query(AnswerCacheEntry).filter(
+            AnswerCacheEntry.kb_version == kb_version,
+            AnswerCacheEntry.tool_fingerprint == fingerprint,
+            AnswerCacheEntry.created_at >= expires
+        )
+
+    def _refresh(self, db: Session, kb_version: int, fingerprint: str) -> None:
+        scope = (kb_version, fingerprint)
+        max_id = self._scope_query(db, kb_version, fingerprint).with_entities(
+            func.max(AnswerCacheEntry.id)
+        ).scalar() or 0
+        if scope == self._scope and max_id == self._max_id:
+            return
+
+        rows = self._scope_query(db, kb_version, fingerprint).with_entities(
+            AnswerCacheEntry.id, AnswerCacheEntry.embedding
+        ).all()
+        self._scope = scope
+        self._max_id = max_id
+        self._ids = [row[0] for row in rows]
+        self._matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+
+    def lookup(
+        self,
+        db: Session,
+        embedding: List[float],
+        kb_version: int,
+        fingerprint: str
+    ) -> Optional[AnswerCacheEntry]:
+        """查找相似度超过阈值的缓存答案"""
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        query = query / norm
+
+        with self._lock:
+            self._refresh(db, kb_version, fingerprint)
+            if self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                return None
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            entry_id = self._ids[best]
+
+        if score < settings.ANSWER_CACHE_SIMILARITY:
+            logger.info(f"答案缓存未命中 (最高相似度 {score:.3f})")
+            return None
+
+        entry = db.query(AnswerCacheEntry).filter(AnswerCacheEntry.id == entry_id).first()
+        if entry:
+            entry.hits = (entry.hits or 0) + 1
+            entry.last_hit_at = datetime.now()
+            db.commit()
+            logger.info(f"答案缓存命中 (相似度 {score:.3f}): {entry.question[:50]}")
+        return entry
+
+    def store(
+        self,
+        db: Session,
+        question: str,
+        embedding: List[float],
+        answer: str,
+        message_type: str,
+        data: Optional[Dict[str, Any]],
+        kb_version: int,
+        fingerprint: str
+    ) -> None:
+        """写入缓存答案，超过容量时淘汰最久未命中的条目"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return
+
+        db.add(AnswerCacheEntry(
+            question=question,
+            normalized_question=normalize_question(question),
+            embedding=(vector / norm).tobytes(),
+            answer=answer,
+            message_type=message_type,
+            data=data,
+            kb_version=kb_version,
+            tool_fingerprint=fingerprint
+        ))
+        db.flush()
+
+        total = db.query(func.count(AnswerCacheEntry.id)).scalar() or 0
+        overflow = total - settings.ANSWER_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            stale_ids = [
+                row[0] for row in db.query(AnswerCacheEntry.id).order_by(
+                    func.coalesce(AnswerCacheEntry.last_hit_at, AnswerCacheEntry.created_at)
+                ).limit(overflow).all()
+            ]
+            db.query(AnswerCacheEntry).filter(
+                AnswerCacheEntry.id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+        db.commit()
+
+    def clear(self, db: Session) -> None:
+        """清空缓存"""
+        db.query(AnswerCacheEntry).delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            self._scope = None
+            self._ids = []
+            self._matrix = None
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> SemanticAnswerCache:
+    """进程内共享的答案缓存"""
+    return SemanticAnswerCache()
@@ -0,0 +1,106 @@
+"""消息附件存储：3D 结构 (SDF)、属性表等工具结果按 (类型, 规范 SMILES) 内容寻址，保存为 zstd 压缩文件
+
+消息的 data 字段只保存引用 {"id", "kind", "size", "url"}，历史接口不再返回和解析整段 SDF，
+工具循环中更新消息也只重写几百字节的 JSON；前端按需请求 url，响应带 ETag 并允许长期缓存。
+同一分子的同类结果只写一次，由所有消息和用户共享，因此删除对话时不删除附件。
+"""
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import os
+import uuid
+
+import zstandard
+from loguru import logger
+
+from app.core.config import settings
+
+# 类型 -> 响应的媒体类型
+KINDS = {
+    "sdf": "chemical/x-mdl-sdfile",
+    "properties": "application/json",
+}
+
+def artifact_id(kind: str, smiles: str) -> str:
+    return hashlib.sha256(f"{kind}\n{smiles}".encode("utf-8")).hexdigest()
+
+def artifact_url(kind: str, artifact_id: str) -> str:
+    return f"/api/v1/chemistry/artifacts/{kind}/{artifact_id}"
+
+def encode_payload(kind: str, payload: Any) -> bytes:
+    if kind == "properties":
+        return json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return payload.encode("utf-8")
+
+def decode_payload(kind: str, raw: bytes) -> Any:
+    if kind == "properties":
+        return json.loads(raw)
+    return raw.decode("utf-8")
+
+def is_valid_id(artifact_id: str) -> bool:
+    return len(artifact_id) == 64 and all(c in "0123456789abcdef" for c in artifact_id)
+
+class ArtifactStore:
+    """按 类型/哈希前两位/哈希.zst 分目录保存；写入后内容不再改变"""
+
+    def __init__(self, root: str, level: int = 10):
+        self.root = Path(root)
+        self.level = level
+
+    def path(self, kind: str, artifact_id: str) -> Path:
+        return self.root / kind / artifact_id[:2] / f"{artifact_id}.zst"
+
+    def put(self, kind: str, smiles: str, payload: Any) -> Dict[str, Any]:
+        """保存附件并返回写入消息 data 的引用；已存在时直接返回引用"""
+        key = artifact_id(kind, smiles)
+        raw = encode_payload(kind, payload)
+        path = self.path(kind, key)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再替换，并发写入同一分子时不会读到写了一半的文件
+            tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+            tmp.write_bytes(zstandard.ZstdCompressor(level=self.level).compress(raw))
+            os.replace(tmp, path)
+        return {"id": key, "kind": kind, "size": len(raw), "url": artifact_url(kind, key)}
+
+    def read_compressed(self, kind: str, artifact_id: str) -> Optional[bytes]:
+        if kind not in KINDS or not is_valid_id(artifact_id):
+            return None
+        try:
+            return self.path(kind, artifact_id).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def get(self, kind: str, artifact_id: str) -> Optional[Any]:
+        compressed = self.read_compressed(kind, artifact_id)
+        if compressed is None:
+            return None
+        return decode_payload(kind, zstandard.ZstdDecompressor().decompress(compressed))
+
+    def attach(self, data: Optional[Dict[str, Any]], kind: str, smiles: str, payload: Any) -> Dict[str, Any]:
+        """返回新的消息 data：payload 存为附件，data["artifacts"][kind] 记录引用，并去掉旧的内联字段"""
+        data = dict(data or {})
+        artifacts = dict(data.get("artifacts") or {})
+        artifacts[kind] = self.put(kind, smiles, payload)
+        data["artifacts"] = artifacts
+        data.pop(kind, None)
+        return data
+
+    def extract_inline(self, data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """把旧消息 data 中内联的 SDF / 属性表移入附件存储；没有可移动的内容（或缺少 SMILES）时返回 None"""
+        if not data or not data.get("smiles"):
+            return None
+        kinds = [kind for kind in KINDS if data.get(kind)]
+        if not kinds:
+            return None
+        for kind in kinds:
+            data = self.attach(data, kind, data["smiles"], data[kind])
+        return data
+
+@lru_cache(maxsize=1)
+def get_artifact_store() -> ArtifactStore:
+    root = settings.ARTIFACT_DIR or str(Path(settings.UPLOAD_DIR) / "artifacts")
+    logger.info(f"消息附件目录: {root}")
+    return ArtifactStore(root, settings.ARTIFACT_ZSTD_LEVEL)
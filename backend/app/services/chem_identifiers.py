@@ -0,0 +1,141 @@
+from typing import List, Dict
+import re
+
+# 常用化合物名称 -> SMILES（ChemistryService 解析名称时优先查表，检索时作为精确名称识别）
+COMMON_NAMES = {
+    "aspirin": "CC(=O)OC1=CC=CC=C1C(=O)O",
+    "acetylsalicylic acid": "CC(=O)OC1=CC=CC=C1C(=O)O",
+    "caffeine": "CN1C=NC2=C1C(=O)N(C(=O)N2C)C",
+    "water": "O",
+    "ethanol": "CCO",
+    "benzene": "c1ccccc1",
+    "methane": "C",
+    "ammonia": "N",
+    "carbon dioxide": "O=C=O",
+    "glucose": "C(C1C(C(C(C(O1)O)O)O)O)O",
+    "paracetamol": "CC(=O)NC1=CC=C(O)C=C1",
+    "acetaminophen": "CC(=O)NC1=CC=C(O)C=C1",
+    "ibuprofen": "CC(C)CC1=CC=C(C=C1)C(C)C(=O)O"
+}
+
+# 中文常用名 -> COMMON_NAMES 中的英文名
+COMMON_NAME_ALIASES = {
+    "阿司匹林": "aspirin",
+    "乙酰水杨酸": "acetylsalicylic acid",
+    "咖啡因": "caffeine",
+    "乙醇": "ethanol",
+    "酒精": "ethanol",
+    "苯": "benzene",
+    "甲烷": "methane",
+    "氨气": "ammonia",
+    "二氧化碳": "carbon dioxide",
+    "葡萄糖": "glucose",
+    "对乙酰氨基酚": "paracetamol",
+    "扑热息痛": "paracetamol",
+    "布洛芬": "ibuprofen"
+}
+
+# 常用化合物的 CAS 号 -> COMMON_NAMES 中的英文名（入库时把文献中的 CAS 号解析为结构）
+COMMON_CAS = {
+    "50-78-2": "aspirin",
+    "58-08-2": "caffeine",
+    "7732-18-5": "water",
+    "64-17-5": "ethanol",
+    "71-43-2": "benzene",
+    "74-82-8": "methane",
+    "7664-41-7": "ammonia",
+    "124-38-9": "carbon dioxide",
+    "50-99-7": "glucose",
+    "103-90-2": "paracetamol",
+    "15687-27-1": "ibuprofen"
+}
+
+ELEMENTS = set(
+    "H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn Ga Ge As Se Br Kr "
+    "Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb Te I Xe Cs Ba La Ce Pr Nd Pm Sm Eu Gd Tb Dy Ho Er Tm Yb "
+    "Lu Hf Ta W Re Os Ir Pt Au Hg Tl Pb Bi Po At Rn Fr Ra Ac Th Pa U Np Pu Am Cm Bk Cf Es Fm Md No Lr".split()
+)
+
+# CAS 登记号: 2~7 位-2 位-1 位校验码
+CAS_PATTERN = re.compile(r"(?<![\d-])(\d{2,7})-(\d{2})-(\d)(?![\d-])")
+# InChIKey: 14 位骨架哈希-8 位立体/同位素哈希 + 标准标记 + 版本-质子化标记
+INCHIKEY_PATTERN = re.compile(r"(?<![A-Z])[A-Z]{14}-[A-Z]{8}[SN][A-Z]-[A-Z](?![A-Z])")
+# 分子式候选，再逐个校验元素符号
+FORMULA_PATTERN = re.compile(r"(?<![A-Za-z0-9])(?:[A-Z][a-z]?\d*){2,}(?![A-Za-z0-9])")
+_ELEMENT_GROUP = re.compile(r"([A-Z][a-z]?)(\d*)")
+_SUBSCRIPTS = str.maketrans("₀₁₂₃₄₅₆₇₈₉", "0123456789")
+_CJK_CHAR = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+# SMILES 候选：由 SMILES 字符组成的连续片段，需含键、分支、方括号原子、立体标记或环闭合数字
+_SMILES_TOKEN = re.compile(r"[A-Za-z0-9@+\-\[\]()=#$/\\%.]{3,}")
+_SMILES_MARKER = re.compile(r"[=#()\[\]@/\\]|[A-Za-z]\d")
+
+_NAME_PATTERN = re.compile(
+    "|".join(
+        rf"(?<![a-z]){re.escape(name)}(?![a-z])" if name.isascii() else re.escape(name)
+        for name in sorted(list(COMMON_NAMES) + list(COMMON_NAME_ALIASES), key=len, reverse=True)
+    ),
+    re.IGNORECASE
+)
+
+def normalize_identifiers(text: str) -> str:
+    """下标数字转为普通数字（C₉H₈O₄ -> C9H8O4），使分子式在文档和查询中写法一致"""
+    return (text or "").translate(_SUBSCRIPTS)
+
+def is_valid_cas(number: str) -> bool:
+    """校验 CAS 号的校验位：除校验位外的数字从右往左依次乘以 1, 2, 3...，和模 10 等于校验位"""
+    digits = number.replace("-", "")
+    if not digits.isdigit() or len(digits) < 5:
+        return False
+    body, check = digits[:-1], int(digits[-1])
+    return sum(int(d) * (i + 1) for i, d in enumerate(reversed(body))) % 10 == check
+
+def is_formula(token: str) -> bool:
+    """分子式校验：全部为元素符号，且含数字或双字母元素（排除 CO、NO、OK 这类普通缩写）"""
+    groups = _ELEMENT_GROUP.findall(token)
+    if "".join(symbol + count for symbol, count in groups) != token:
+        return False
+    if not all(symbol in ELEMENTS for symbol, _ in groups):
+        return False
+    return any(count for _, count in groups) or any(len(symbol) == 2 for symbol, _ in groups)
+
+def detect_identifiers(text: str) -> List[Dict[str, str]]:
+    """识别文本中的化学标识符，返回 [{"type": cas|inchikey|formula|name, "value": 规范化后的值}]"""
+    text = normalize_identifiers(text)
+    found = []
+    seen = set()
+
+    def add(kind: str, value: str):
+        if (kind, value) not in seen:
+            seen.add((kind, value))
+            found.append({"type": kind, "value": value})
+
+    for match in CAS_PATTERN.finditer(text):
+        if is_valid_cas(match.group(0)):
+            add("cas", match.group(0))
+    for match in INCHIKEY_PATTERN.finditer(text):
+        add("inchikey", match.group(0).lower())
+    for match in FORMULA_PATTERN.finditer(text):
+        if is_formula(match.group(0)):
+            add("formula", match.group(0).lower())
+    for match in _NAME_PATTERN.finditer(text):
+        add("name", match.group(0).lower())
+    return found
+
+def smiles_candidates(text: str) -> List[str]:
+    """文本中可能是 SMILES 的片段（去掉句末标点和不成对的括号），是否为合法结构由 RDKit 判断"""
+    candidates = []
+    for token in _SMILES_TOKEN.findall(normalize_identifiers(text)):
+        # SMILES 不以分支开头，开头的括号属于正文
+        token = token.rstrip(".").lstrip("(")
+        if token.endswith(")") and token.count(")") > token.count("("):
+            token = token[:-1]
+        if len(token) < 3 or not _SMILES_MARKER.search(token) or not any(c.isalpha() for c in token):
+            continue
+        if is_formula(token) or CAS_PATTERN.fullmatch(token):
+            continue
+        candidates.append(token)
+    return list(dict.fromkeys(candidates))
+
+def identifier_phrase(value: str) -> str:
+    """标识符在词法索引中对应的短语：中文按单字切分，与索引端的分词方式一致"""
+    return " ".join(_CJK_CHAR.findall(value)) if _CJK_CHAR.search(value) else value
@@ -6,6 +6,7 @@ import base64
 import uuid
 import os
 from loguru import logger
+from app.services.chem_identifiers import COMMON_NAMES, COMMON_NAME_ALIASES
 import re
 import asyncio
 import functools
@@ -34,26 +35,11 @@ class ChemistryService:
             # 4. 最后尝试强制解析为 SMILES (作为兜底)
 
             # 1. 常用名检查
-            common_names = {
-                "aspirin": "CC(=O)OC1=CC=CC=C1C(=O)O",
-                "acetylsalicylic acid": "CC(=O)OC1=CC=CC=C1C(=O)O",
-                "caffeine": "CN1C=NC2=C1C(=O)N(C(=O)N2C)C",
-                "water": "O",
-                "ethanol": "CCO",
-                "benzene": "c1ccccc1",
-                "methane": "C",
-                "ammonia": "N",
-                "carbon dioxide": "O=C=O",
-                "glucose": "C(C1C(C(C(C(O1)O)O)O)O)O",
-                "paracetamol": "CC(=O)NC1=CC=C(O)C=C1",
-                "acetaminophen": "CC(=O)NC1=CC=C(O)C=C1",
-                "ibuprofen": "CC(C)CC1=CC=C(C=C1)C(C)C(=O)O"
-            }
-
             key = molecule_string.lower()
-            if key in common_names:
+            key = COMMON_NAME_ALIASES.get(key, key)
+            if key in COMMON_NAMES:
                 logger.info(f"命中常用名缓存: {key}")
-                return Chem.MolFromSmiles(common_names[key])
+                return Chem.MolFromSmiles(COMMON_NAMES[key])
 
             # 2. 启发式检查：如果包含空格，或者长度很短且全是字母，可能是名称而不是 SMILES
             # SMILES 通常包含特殊字符 = # ( ) [ ] @ 等，或者数字
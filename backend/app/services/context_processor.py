@@ -0,0 +1,196 @@
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import re
+import numpy as np
+from loguru import logger
+from app.core.config import settings
+from app.core.metrics import Histogram
+from app.services.text_utils import estimate_tokens
+
+# 句子切分：中文句末标点、英文句点/问号/叹号后跟空白、换行
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;])|(?<=[.?!])(?=\s)|\n+")
+_SPACES = re.compile(r"\s+")
+_SENTENCE_PUNCTUATION = "。！？；!?;.，,"
+# 没有 start_index 的旧片段通过文本比对查找重叠，重叠长度下限避免把常见短词误判为重叠
+MIN_OVERLAP_CHARS = 20
+# 过短的句子（标点、编号等）不参与去重
+MIN_SENTENCE_CHARS = 8
+
+SAVED_CHARS_BUCKETS = (0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+SAVED_TOKENS_BUCKETS = (0, 50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+context_chars_saved = Histogram(
+    "context_chars_saved", "每轮对话合并、去重和压缩检索片段节省的上下文字符数", SAVED_CHARS_BUCKETS
+)
+context_tokens_saved = Histogram(
+    "context_tokens_saved", "每轮对话合并、去重和压缩检索片段节省的估算 token 数", SAVED_TOKENS_BUCKETS
+)
+
+def _score(result: Dict[str, Any]) -> float:
+    return result.get("rerank_score", result.get("score", 0.0))
+
+def _group_key(result: Dict[str, Any]) -> Tuple:
+    metadata = result.get("metadata", {})
+    return (metadata.get("file_id", metadata.get("source")), metadata.get("page"))
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in (part.strip() for part in _SENTENCE_END.split(text or "")) if s]
+
+def text_overlap(left: str, right: str, max_overlap: int) -> int:
+    """left 的后缀与 right 的前缀的最长重合长度"""
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def _join(left: Dict[str, Any], right: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """尝试把 right 接到 left 后面，不相邻时返回 None"""
+    left_start = left["metadata"].get("start_index")
+    right_start = right["metadata"].get("start_index")
+    left_text, right_text = left["content"], right["content"]
+
+    if left_start is not None and right_start is not None:
+        left_end = left_start + len(left_text)
+        if right_start > left_end:
+            return None
+        # 切分时会去掉片段首尾空白，偏移量可能有几个字符的误差，以文本比对为准
+        overlap = text_overlap(left_text, right_text, settings.CHUNK_OVERLAP * 2) or max(left_end - right_start, 0)
+    else:
+        if right_text in left_text:
+            overlap = len(right_text)
+        else:
+            overlap = text_overlap(left_text, right_text, settings.CHUNK_OVERLAP * 2)
+            if not overlap:
+                return None
+
+    joined = {
+        **left,
+        "content": left_text + right_text[overlap:],
+        "score": max(left.get("score", 0.0), right.get("score", 0.0)),
+        "merged_ids": left.get("merged_ids", [left.get("id")]) + right.get("merged_ids", [right.get("id")]),
+    }
+    if "rerank_score" in left or "rerank_score" in right:
+        joined["rerank_score"] = max(_score(left), _score(right))
+    return joined
+
+def merge_adjacent(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """合并同一来源、同一页中相邻或重叠的片段；输出按各组最高得分排序"""
+    groups: Dict[Tuple, List[Dict[str, Any]]] = {}
+    for result in results:
+        groups.setdefault(_group_key(result), []).append(result)
+
+    merged = []
+    for items in groups.values():
+        items.sort(key=lambda r: (
+            r["metadata"].get("start_index", float("inf")),
+            r["metadata"].get("chunk_index", 0)
+        ))
+        current = items[0]
+        for item in items[1:]:
+            joined = _join(current, item)
+            if joined is None:
+                merged.append(current)
+                current = item
+            else:
+                current = joined
+        merged.append(current)
+
+    merged.sort(key=_score, reverse=True)
+    return merged
+
+def remove_duplicate_sentences(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """删除在得分更高的片段中已经出现过的句子（不同文件中的重复内容、页眉页脚等）"""
+    seen = set()
+    cleaned = []
+    for result in results:
+        kept = []
+        has_new_text = False
+        sentences = split_sentences(result["content"])
+        for sentence in sentences:
+            key = _SPACES.sub("", sentence).strip(_SENTENCE_PUNCTUATION)
+            if len(key) >= MIN_SENTENCE_CHARS:
+                if key in seen:
+                    continue
+                has_new_text = True
+            seen.add(key)
+            kept.append(sentence)
+        if len(kept) == len(sentences):
+            cleaned.append(result)
+        elif has_new_text:
+            cleaned.append({**result, "content": "\n".join(kept)})
+    return cleaned
+
+def select_sentences(
+    results: List[Dict[str, Any]],
+    query_embedding: List[float],
+    embed_documents: Callable[[List[str]], List[List[float]]],
+    min_score: float,
+    min_sentences: int
+) -> List[Dict[str, Any]]:
+    """按句子与问题的向量相似度做抽取式压缩：每个片段保留相似度不低于 min_score 的句子，
+    至少保留最相关的 min_sentences 句，保持原文顺序"""
+    per_result = [split_sentences(r["content"]) for r in results]
+    sentences = [s for group in per_result for s in group]
+    if not sentences:
+        return results
+
+    vectors = np.asarray(embed_documents(sentences), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+    scores = vectors @ query
+
+    compressed = []
+    offset = 0
+    for result, group in zip(results, per_result):
+        group_scores = scores[offset:offset + len(group)]
+        offset += len(group)
+        top = set(np.argsort(-group_scores)[:min_sentences].tolist())
+        kept = [s for i, s in enumerate(group) if i in top or group_scores[i] >= min_score]
+        compressed.append({**result, "content": "\n".join(kept)})
+    return compressed
+
+def process_context(
+    results: List[Dict[str, Any]],
+    query_embedding: Optional[List[float]] = None,
+    embed_documents: Optional[Callable[[List[str]], List[List[float]]]] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """合并相邻片段、去除重复句子，可选按句子相关度压缩；返回处理后的结果和节省统计"""
+    original = "\n\n".join(r["content"] for r in results)
+
+    processed = merge_adjacent(results)
+    processed = remove_duplicate_sentences(processed)
+    if settings.CONTEXT_SENTENCE_SELECTION and query_embedding is not None and embed_documents is not None:
+        try:
+            processed = select_sentences(
+                processed,
+                query_embedding,
+                embed_documents,
+                settings.CONTEXT_SENTENCE_MIN_SCORE,
+                settings.CONTEXT_MIN_SENTENCES
+            )
+        except Exception as e:
+            logger.warning(f"句子级压缩失败，保留完整片段: {str(e)}")
+
+    compressed = "\n\n".join(r["content"] for r in processed)
+    stats = {
+        "chunks_before": len(results),
+        "chunks_after": len(processed),
+        "chars_before": len(original),
+        "chars_after": len(compressed),
+        "tokens_before": estimate_tokens(original),
+        "tokens_after": estimate_tokens(compressed),
+    }
+    logger.info(
+        f"上下文压缩: {stats['chunks_before']} -> {stats['chunks_after']} 个片段, "
+        f"节省 {stats['chars_before'] - stats['chars_after']} 字符 / "
+        f"约 {stats['tokens_before'] - stats['tokens_after']} tokens"
+    )
+    return processed, stats
+
+def record_savings(stats: Dict[str, int]) -> None:
+    """把一轮对话的上下文节省量记入 /api/v1/metrics 的直方图"""
+    if not stats:
+        return
+    context_chars_saved.observe(stats["chars_before"] - stats["chars_after"])
+    context_tokens_saved.observe(stats["tokens_before"] - stats["tokens_after"])
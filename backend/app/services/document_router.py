@@ -0,0 +1,88 @@
+from typing import List, Dict, Any, Optional
+import numpy as np
+from loguru import logger
+from app.core.config import settings
+from app.services.vector_index import VectorIndex, normalize_rows
+
+DOCUMENT_COLLECTION_NAME = "chemistry_documents"
+
+def document_id(file_id: Any) -> str:
+    return f"file-{file_id}"
+
+def accumulate_centroids(
+    sums: Dict[Any, Dict[str, Any]],
+    vectors: List[List[float]],
+    metadatas: List[Dict[str, Any]]
+) -> None:
+    """把一批 chunk 向量按 file_id 累加到 sums（没有 file_id 的片段不参与文档路由）"""
+    if len(vectors) == 0:
+        return
+    normalized = normalize_rows(vectors)
+    for vector, metadata in zip(normalized, metadatas):
+        file_id = (metadata or {}).get("file_id")
+        if file_id is None:
+            continue
+        entry = sums.get(file_id)
+        if entry is None:
+            entry = sums[file_id] = {
+                "sum": np.zeros(len(vector), dtype=np.float64),
+                "count": 0,
+                "source": metadata.get("source", ""),
+                "namespace": metadata.get("namespace")
+            }
+        entry["sum"] += vector
+        entry["count"] += 1
+
+class DocumentRouter:
+    """两级检索的第一级：每个知识库文件一个质心向量（全部 chunk 向量归一化后的均值），
+    先选出与查询最相近的文件，再把 chunk 检索限制在这些文件内"""
+
+    def __init__(self, index: VectorIndex):
+        self.index = index
+
+    @staticmethod
+    def _metadata(file_id: Any, entry: Dict[str, Any]) -> Dict[str, Any]:
+        # 与 chunk 相同的文件级字段（namespace）也写入质心，检索过滤条件可以同时作用于两级
+        metadata = {"file_id": file_id, "source": entry["source"], "chunk_count": entry["count"]}
+        if entry.get("namespace") is not None:
+            metadata["namespace"] = entry["namespace"]
+        return metadata
+
+    def write(self, sums: Dict[Any, Dict[str, Any]]) -> int:
+        """写入（或覆盖）文件质心，返回写入的文件数"""
+        items = [(file_id, entry) for file_id, entry in sums.items() if entry["count"] > 0]
+        if not items:
+            return 0
+        ids = [document_id(file_id) for file_id, _ in items]
+        vectors = normalize_rows(np.stack([entry["sum"] / entry["count"] for _, entry in items]))
+        self.index.check_dimension(vectors.shape[1])
+        self.index.delete(ids)
+        self.index.add(
+            ids=ids,
+            embeddings=vectors,
+            documents=[entry["source"] for _, entry in items],
+            metadatas=[self._metadata(file_id, entry) for file_id, entry in items]
+        )
+        self.index.persist()
+        return len(items)
+
+    def delete_files(self, file_ids: List[Any]) -> None:
+        if file_ids:
+            self.index.delete([document_id(file_id) for file_id in file_ids])
+            self.index.persist()
+
+    def route(self, query_embedding: List[float], where: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """返回限制到候选文件的 where；文件数低于 DOCUMENT_ROUTING_MIN_FILES 或没有候选时原样返回"""
+        if self.index.count() < settings.DOCUMENT_ROUTING_MIN_FILES:
+            return where
+        try:
+            # where 中引用了 chunk 级字段（如 page）时文件质心不会命中，退回全量检索
+            files = self.index.query(query_embedding, settings.DOCUMENT_ROUTING_TOP_FILES, where)
+        except Exception as e:
+            logger.warning(f"文档路由失败，使用全量检索: {str(e)}")
+            return where
+        file_ids = [hit["metadata"]["file_id"] for hit in files if "file_id" in hit["metadata"]]
+        if not file_ids:
+            return where
+        route = {"file_id": {"$in": file_ids}}
+        return {"$and": [where, route]} if where else route
@@ -0,0 +1,204 @@
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta
+import os
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from app.core.config import settings
+from app.db.base import SessionLocal, engine
+from app.models.sql_models import EmbeddingCollection
+from app.services.document_router import DOCUMENT_COLLECTION_NAME
+from app.services.embeddings import SiliconFlowEmbeddings, TruncatedEmbeddings, create_local_embeddings
+
+# v1 沿用版本化之前的集合名，已有部署不需要搬迁数据
+BASE_COLLECTION_NAME = "chemistry_knowledge"
+
+PROVIDER_SILICONFLOW = "siliconflow"
+PROVIDER_LOCAL = "local"
+
+STATUS_BUILDING = "building"
+STATUS_ACTIVE = "active"
+STATUS_RETIRED = "retired"
+STATUS_FAILED = "failed"
+STATUS_DROPPED = "dropped"
+
+# 迁移任务租约超时（秒）：心跳超过该时间未更新视为任务中断，可由其他进程接手继续
+MIGRATION_LEASE_SECONDS = 300
+
+def siliconflow_api_key() -> str:
+    return getattr(settings, "SILICONFLOW_API_KEY", "") or os.getenv("SILICONFLOW_API_KEY") or ""
+
+def configured_spec() -> Dict[str, Any]:
+    """配置（环境变量）中指定的嵌入模型：配置了 SiliconFlow API Key 时使用远程模型，否则使用本地模型"""
+    if siliconflow_api_key():
+        provider, model = PROVIDER_SILICONFLOW, settings.SILICONFLOW_EMBEDDING_MODEL
+    else:
+        provider, model = PROVIDER_LOCAL, settings.EMBEDDING_MODEL
+    return {"provider": provider, "model": model, "dimensions": settings.EMBEDDING_DIMENSIONS}
+
+def collection_spec(row: EmbeddingCollection) -> Dict[str, Any]:
+    """集合建立时使用的嵌入模型"""
+    return {"provider": row.provider, "model": row.model, "dimensions": row.dimensions or 0}
+
+def same_model(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    return (a["provider"], a["model"], a.get("dimensions") or 0) == (b["provider"], b["model"], b.get("dimensions") or 0)
+
+def format_spec(spec: Dict[str, Any]) -> str:
+    truncation = f", 截断 {spec['dimensions']} 维" if spec.get("dimensions") else ""
+    return f"{spec['provider']}:{spec['model']}{truncation}"
+
+def create_embeddings(spec: Dict[str, Any]) -> Embeddings:
+    """按模型描述创建嵌入模型，入库和检索必须使用建立集合时的同一个模型"""
+    if spec["provider"] == PROVIDER_SILICONFLOW:
+        api_key = siliconflow_api_key()
+        if not api_key:
+            raise RuntimeError(f"嵌入集合使用 SiliconFlow 模型 {spec['model']}，但未配置 SILICONFLOW_API_KEY")
+        embeddings = SiliconFlowEmbeddings(
+            api_key=api_key,
+            model=spec["model"],
+            base_url=getattr(settings, "SILICONFLOW_API_BASE", "https://api.siliconflow.cn/v1")
+        )
+    elif spec["provider"] == PROVIDER_LOCAL:
+        embeddings = create_local_embeddings(spec["model"])
+    else:
+        raise ValueError(f"未知的嵌入模型来源: {spec['provider']}")
+
+    # 截断到建立集合时的维度，入库和检索使用同一个包装后的模型
+    if spec.get("dimensions"):
+        embeddings = TruncatedEmbeddings(embeddings, spec["dimensions"])
+    return embeddings
+
+def collection_names(version: int) -> Tuple[str, str]:
+    """版本对应的 chunk 集合名和文件质心集合名"""
+    if version <= 1:
+        return BASE_COLLECTION_NAME, DOCUMENT_COLLECTION_NAME
+    return f"{BASE_COLLECTION_NAME}_v{version}", f"{DOCUMENT_COLLECTION_NAME}_v{version}"
+
+def collection_tags(collection: Dict[str, Any]) -> Dict[str, Any]:
+    """写入向量集合 metadata 的嵌入模型标签（collection 为 describe 的结果）"""
+    tags = {
+        "embedding_provider": collection["provider"],
+        "embedding_model": collection["model"],
+        "embedding_version": collection["version"]
+    }
+    if collection.get("dimension"):
+        tags["embedding_dimension"] = collection["dimension"]
+    return tags
+
+def describe(row: EmbeddingCollection) -> Dict[str, Any]:
+    return {
+        "name": row.name,
+        "documents_name": row.documents_name,
+        "version": row.version,
+        "provider": row.provider,
+        "model": row.model,
+        "dimensions": row.dimensions or 0,
+        "dimension": row.dimension,
+        "status": row.status,
+        "previous": row.previous,
+        "total_chunks": row.total_chunks or 0,
+        "migrated_chunks": row.migrated_chunks or 0,
+        "error_message": row.error_message,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "activated_at": row.activated_at.isoformat() if row.activated_at else None,
+        "heartbeat_at": row.heartbeat_at.isoformat() if row.heartbeat_at else None
+    }
+
+def _bootstrap(bind) -> None:
+    """首次启动时把现有集合登记为 v1（模型取当前配置），在同一数据库的独立会话中提交，不影响调用方的事务"""
+    db = Session(bind=bind)
+    try:
+        if db.query(EmbeddingCollection.name).first() is not None:
+            return
+        name, documents_name = collection_names(1)
+        spec = configured_spec()
+        db.add(EmbeddingCollection(
+            name=name,
+            documents_name=documents_name,
+            version=1,
+            provider=spec["provider"],
+            model=spec["model"],
+            dimensions=spec["dimensions"],
+            status=STATUS_ACTIVE,
+            activated_at=datetime.now()
+        ))
+        db.commit()
+        logger.info(f"登记嵌入集合 v1: {name} ({format_spec(spec)})")
+    except IntegrityError:
+        # 多个 worker 同时启动，其他 worker 已登记
+        db.rollback()
+    finally:
+        db.close()
+
+def get_active(db: Session) -> EmbeddingCollection:
+    """当前生效的嵌入集合（查询和入库都使用它），不存在任何记录时登记 v1"""
+    row = db.query(EmbeddingCollection).filter(EmbeddingCollection.status == STATUS_ACTIVE).first()
+    if row is None:
+        _bootstrap(db.get_bind())
+        row = db.query(EmbeddingCollection).filter(EmbeddingCollection.status == STATUS_ACTIVE).first()
+    if row is None:
+        raise RuntimeError("没有生效的嵌入集合，请检查 embedding_collections 表")
+    return row
+
+def get_active_name(db: Session) -> str:
+    return get_active(db).name
+
+def active_collection_names() -> Tuple[str, str]:
+    """当前生效的 chunk 集合名和文件质心集合名（供离线脚本使用）"""
+    EmbeddingCollection.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        row = get_active(db)
+        return row.name, row.documents_name
+    finally:
+        db.close()
+
+def get_collection(db: Session, version: Optional[int] = None, name: Optional[str] = None) -> Optional[EmbeddingCollection]:
+    query = db.query(EmbeddingCollection)
+    if version is not None:
+        return query.filter(EmbeddingCollection.version == version).first()
+    return query.filter(EmbeddingCollection.name == name).first()
+
+def list_collections(db: Session) -> Dict[str, Any]:
+    """全部版本及配置中的模型是否与当前集合一致"""
+    active = get_active(db)
+    configured = configured_spec()
+    rows = db.query(EmbeddingCollection).order_by(EmbeddingCollection.version).all()
+    return {
+        "active": active.name,
+        "configured": configured,
+        "migration_needed": not same_model(configured, collection_spec(active)),
+        "collections": [describe(row) for row in rows]
+    }
+
+def next_version(db: Session) -> int:
+    return (db.query(func.max(EmbeddingCollection.version)).scalar() or 0) + 1
+
+def record_dimension(name: str, dimension: int) -> None:
+    """记录集合的实际向量维度（v1 在登记时还没有向量，首次看到向量时补记）"""
+    db = SessionLocal()
+    try:
+        db.query(EmbeddingCollection).filter(
+            EmbeddingCollection.name == name,
+            EmbeddingCollection.dimension.is_(None)
+        ).update({"dimension": dimension}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def lease_expired(row: EmbeddingCollection) -> bool:
+    return row.heartbeat_at is None or row.heartbeat_at < datetime.now() - timedelta(seconds=MIGRATION_LEASE_SECONDS)
+
+def get_building(db: Session, version: Optional[int] = None) -> Optional[EmbeddingCollection]:
+    """进行中的迁移（或回滚）任务的目标集合"""
+    query = db.query(EmbeddingCollection).filter(EmbeddingCollection.status == STATUS_BUILDING)
+    if version is not None:
+        query = query.filter(EmbeddingCollection.version == version)
+    return query.first()
+
+def migration_in_progress(db: Session) -> bool:
+    """有迁移任务正在执行（心跳未过期）时定时压缩跳过，避免替换正在被读取的源集合"""
+    row = get_building(db)
+    return row is not None and not lease_expired(row)
@@ -0,0 +1,445 @@
+from typing import List, Dict, Any, Optional, Set, Tuple
+from datetime import datetime, timedelta
+from functools import partial
+import asyncio
+import random
+import time
+from sqlalchemy.orm import Session
+from loguru import logger
+from app.core.config import settings
+from app.db.base import SessionLocal
+from app.models.sql_models import EmbeddingCollection, VectorCollectionState
+from app.services import embedding_collections, knowledge_registry
+from app.services.answer_cache import get_answer_cache
+from app.services.document_router import DocumentRouter, accumulate_centroids
+from app.services.embedding_collections import (
+    STATUS_BUILDING, STATUS_ACTIVE, STATUS_RETIRED, STATUS_FAILED, STATUS_DROPPED,
+    MIGRATION_LEASE_SECONDS, collection_spec, create_embeddings, describe, format_spec,
+    get_active, get_building, get_collection, lease_expired
+)
+from app.services.rag_service import RAGService, get_rag_service
+from app.services.vector_index import create_vector_index
+
+# 单批嵌入失败（例如远程 API 限流）时的重试次数和最长退避时间（秒）
+EMBED_RETRY_ATTEMPTS = 5
+EMBED_RETRY_MAX_DELAY = 60
+# 首轮嵌入完成后，补齐迁移期间新增/删除的 chunk 的最多轮数
+RECONCILE_PASSES = 5
+# 切换前自检：用新模型嵌入抽样 chunk 的文本做查询，前 SELF_CHECK_TOP_K 个结果中应包含该 chunk
+SELF_CHECK_SAMPLES = 20
+SELF_CHECK_TOP_K = 10
+SELF_CHECK_MIN_RECALL = 0.8
+# 等待正在进行的向量集合压缩结束的检查间隔（秒）
+COMPACTION_WAIT_INTERVAL = 30
+
+class MigrationCancelled(Exception):
+    """迁移任务已被取消"""
+
+async def _in_executor(func, *args, **kwargs):
+    return await asyncio.get_event_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+def _drop_collections(row: EmbeddingCollection) -> None:
+    for name in (row.name, row.documents_name):
+        try:
+            create_vector_index(name).drop()
+        except Exception as e:
+            logger.warning(f"删除集合 {name} 失败: {e}")
+
+class CollectionMigration:
+    """把源集合中的 chunk 用目标集合的嵌入模型重新嵌入后写入目标集合
+
+    文本和 metadata 直接从源集合读取（不重新解析文件），chunk ID 保持不变，chunk 注册表和词法索引不需要改动。
+    每轮按 ID 比对两个集合，只处理差异，任务中断后重新执行会从中断处继续。
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        row: EmbeddingCollection,
+        source_row: EmbeddingCollection,
+        embeddings,
+        rag_service: Optional[RAGService] = None
+    ):
+        self.db = db
+        self.name = row.name
+        self.source_name = source_row.name
+        self.dimension = row.dimension
+        tags = embedding_collections.collection_tags(describe(row))
+        # 文件型后端（numpy / hnswlib / int8 / binary）的索引状态在进程内存中，
+        # 必须与服务共用同一个索引对象才能看到迁移期间的写入
+        if rag_service is not None and rag_service.index is not None and rag_service.index.collection_name == source_row.name:
+            self.source = rag_service.index
+        else:
+            self.source = create_vector_index(source_row.name)
+        self.target = create_vector_index(row.name, tags=tags)
+        self.router = DocumentRouter(create_vector_index(row.documents_name, tags=tags)) if settings.DOCUMENT_ROUTING_ENABLED else None
+        self.embeddings = embeddings
+        self.batch_size = max(1, settings.EMBEDDING_MIGRATION_BATCH_SIZE)
+        self.max_per_minute = settings.EMBEDDING_MIGRATION_MAX_PER_MINUTE
+
+    def heartbeat(self, migrated: int = 0, total: Optional[int] = None) -> None:
+        """续租并记录进度；任务被取消（状态不再是 building）时抛出 MigrationCancelled"""
+        values: Dict[Any, Any] = {"heartbeat_at": datetime.now()}
+        if migrated:
+            values["migrated_chunks"] = EmbeddingCollection.migrated_chunks + migrated
+        if total is not None:
+            values["total_chunks"] = total
+        updated = self.db.query(EmbeddingCollection).filter(
+            EmbeddingCollection.name == self.name,
+            EmbeddingCollection.status == STATUS_BUILDING
+        ).update(values, synchronize_session=False)
+        self.db.commit()
+        if updated == 0:
+            raise MigrationCancelled(f"迁移任务 {self.name} 已取消")
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        """嵌入一批文本，失败时指数退避重试（远程 API 限流或短暂不可用）"""
+        for attempt in range(EMBED_RETRY_ATTEMPTS):
+            try:
+                vectors = await _in_executor(self.embeddings.embed_documents, texts)
+                if len(vectors) != len(texts):
+                    raise RuntimeError(f"嵌入模型返回 {len(vectors)} 个向量，期望 {len(texts)} 个")
+                return vectors
+            except Exception as e:
+                if attempt == EMBED_RETRY_ATTEMPTS - 1:
+                    raise
+                delay = min(2 ** attempt, EMBED_RETRY_MAX_DELAY)
+                logger.warning(f"嵌入失败（第 {attempt + 1} 次），{delay}s 后重试: {e}")
+                await asyncio.sleep(delay)
+
+    async def _throttle(self, count: int, started: float) -> None:
+        """按 EMBEDDING_MIGRATION_MAX_PER_MINUTE 限速，并让出事件循环，迁移期间查询不受影响"""
+        delay = 0.0
+        if self.max_per_minute > 0:
+            delay = count * 60.0 / self.max_per_minute - (time.monotonic() - started)
+        await asyncio.sleep(max(delay, 0.0))
+
+    async def copy(self, ids: List[str], track: bool = True) -> Tuple[int, Set[Any]]:
+        """嵌入 ids 对应的 chunk 并写入目标集合，返回写入数和涉及的 file_id（源集合中已删除的 ID 跳过）"""
+        copied = 0
+        file_ids: Set[Any] = set()
+        for start in range(0, len(ids), self.batch_size):
+            started = time.monotonic()
+            batch = await _in_executor(self.source.get, ids=ids[start:start + self.batch_size])
+            if batch["ids"]:
+                vectors = await self._embed(batch["documents"])
+                self.target.check_dimension(len(vectors[0]))
+                await _in_executor(
+                    self.target.add,
+                    ids=batch["ids"], embeddings=vectors, documents=batch["documents"], metadatas=batch["metadatas"]
+                )
+                copied += len(batch["ids"])
+                file_ids.update(m.get("file_id") for m in batch["metadatas"] if m.get("file_id") is not None)
+            if track:
+                self.heartbeat(migrated=len(batch["ids"]))
+            await self._throttle(len(batch["ids"]), started)
+        return copied, file_ids
+
+    async def _delete(self, ids: List[str]) -> Set[Any]:
+        """从目标集合删除 ids，返回涉及的 file_id"""
+        if not ids:
+            return set()
+        batch = await _in_executor(self.target.get, ids=ids)
+        await _in_executor(self.target.delete, ids)
+        return {m.get("file_id") for m in batch["metadatas"] if m.get("file_id") is not None}
+
+    async def sync(self, track: bool = True) -> Dict[str, Any]:
+        """一轮比对：补齐目标集合缺少的 chunk，删除源集合中已不存在的 chunk"""
+        source_ids = await _in_executor(self.source.all_ids)
+        target_ids = set(await _in_executor(self.target.all_ids))
+        source_set = set(source_ids)
+        missing = [chunk_id for chunk_id in source_ids if chunk_id not in target_ids]
+        extra = [chunk_id for chunk_id in target_ids if chunk_id not in source_set]
+        if track:
+            self.heartbeat(total=len(source_ids))
+        added, file_ids = await self.copy(missing, track=track)
+        file_ids |= await self._delete(extra)
+        await _in_executor(self.target.persist)
+        return {"source_ids": source_set, "added": added, "deleted": len(extra), "file_ids": file_ids}
+
+    async def reconcile_after_swap(self, pre_swap: Set[str]) -> Dict[str, int]:
+        """切换后、其他 worker 刷新前，入库和删除仍可能落在旧集合上：
+        补上切换后旧集合新增的 chunk，删除切换后从旧集合删除的 chunk"""
+        old_ids = set(await _in_executor(self.source.all_ids))
+        new_ids = set(await _in_executor(self.target.all_ids))
+        added_ids = [chunk_id for chunk_id in old_ids if chunk_id not in pre_swap and chunk_id not in new_ids]
+        removed_ids = [chunk_id for chunk_id in pre_swap if chunk_id not in old_ids and chunk_id in new_ids]
+        added, file_ids = await self.copy(added_ids, track=False)
+        file_ids |= await self._delete(removed_ids)
+        await _in_executor(self.target.persist)
+        if file_ids:
+            await _in_executor(self.refresh_centroids, file_ids)
+        return {"added": added, "deleted": len(removed_ids)}
+
+    def refresh_centroids(self, file_ids: Optional[Set[Any]] = None) -> int:
+        """用目标集合中的向量重新计算文件质心；file_ids 为空时全部重建"""
+        if self.router is None:
+            return 0
+        sums: Dict[Any, Dict[str, Any]] = {}
+        if file_ids is None:
+            for batch in self.target.iter_batches(include_embeddings=True):
+                accumulate_centroids(sums, batch["embeddings"], batch["metadatas"])
+            self.router.index.reset()
+        else:
+            data = self.target.get(where={"file_id": {"$in": list(file_ids)}}, include_embeddings=True)
+            accumulate_centroids(sums, data["embeddings"], data["metadatas"])
+            self.router.delete_files([file_id for file_id in file_ids if file_id not in sums])
+        return self.router.write(sums)
+
+    def verify(self) -> float:
+        """切换前自检：数量与源集合一致、维度与登记一致、抽样 chunk 能用新模型的查询向量检索回来，返回抽样召回率"""
+        source_count, target_count = self.source.count(), self.target.count()
+        if source_count != target_count:
+            raise RuntimeError(f"新集合向量数 {target_count} 与当前集合 {source_count} 不一致")
+        dimension = self.target.get_dimension()
+        if dimension is not None and self.dimension and dimension != self.dimension:
+            raise RuntimeError(f"新集合维度 {dimension} 与登记的模型维度 {self.dimension} 不一致")
+        if target_count == 0:
+            return 1.0
+
+        ids = random.sample(self.target.all_ids(), min(SELF_CHECK_SAMPLES, target_count))
+        sample = self.target.get(ids=ids)
+        hits = 0
+        for chunk_id, text in zip(sample["ids"], sample["documents"]):
+            results = self.target.query(self.embeddings.embed_query(text), SELF_CHECK_TOP_K)
+            # 内容完全相同的 chunk 得分相同，命中其中任意一个都算召回
+            if any(result["id"] == chunk_id or result["content"] == text for result in results):
+                hits += 1
+        recall = hits / max(len(sample["ids"]), 1)
+        if recall < SELF_CHECK_MIN_RECALL:
+            raise RuntimeError(f"新集合自检未通过: 抽样召回率 {recall:.0%} 低于 {SELF_CHECK_MIN_RECALL:.0%}")
+        return recall
+
+def start_migration(db: Session, spec: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """登记新版本集合（building），默认迁移到配置中的嵌入模型；嵌入和写入由 run_migration 在后台完成"""
+    spec = spec or embedding_collections.configured_spec()
+    active = get_active(db)
+    if embedding_collections.same_model(spec, collection_spec(active)):
+        raise ValueError(f"当前集合 {active.name} 已使用 {format_spec(spec)}，无需迁移")
+    building = get_building(db)
+    if building is not None:
+        raise ValueError(f"已有迁移任务进行中: {building.name}")
+
+    # 先调用一次新模型：确认模型可用（API Key、模型名），并得到实际向量维度
+    embeddings = create_embeddings(spec)
+    dimension = len(embeddings.embed_query("苯甲酸的分子式是 C7H6O2"))
+
+    version = embedding_collections.next_version(db)
+    name, documents_name = embedding_collections.collection_names(version)
+    row = EmbeddingCollection(
+        name=name,
+        documents_name=documents_name,
+        version=version,
+        provider=spec["provider"],
+        model=spec["model"],
+        dimensions=spec.get("dimensions") or 0,
+        dimension=dimension,
+        status=STATUS_BUILDING,
+        previous=active.name,
+        total_chunks=0,
+        migrated_chunks=0
+    )
+    db.add(row)
+    db.commit()
+    logger.info(f"登记嵌入集合迁移任务 v{version}: {active.name} -> {name} ({format_spec(spec)}, {dimension} 维)")
+    return describe(row)
+
+def prepare_rollback(db: Session) -> Dict[str, Any]:
+    """把上一个集合重新置为 building，由 run_migration 补齐切换后的增删（用它原来的模型嵌入）后切回"""
+    active = get_active(db)
+    previous = get_collection(db, name=active.previous) if active.previous else None
+    if previous is None or previous.status != STATUS_RETIRED:
+        raise ValueError("没有可回滚的集合（上一个集合不存在或已删除）")
+    building = get_building(db)
+    if building is not None:
+        raise ValueError(f"已有迁移任务进行中: {building.name}")
+    previous.status = STATUS_BUILDING
+    previous.error_message = None
+    previous.migrated_chunks = 0
+    previous.heartbeat_at = None
+    db.commit()
+    logger.info(f"准备回滚嵌入集合: {active.name} -> {previous.name}")
+    return describe(previous)
+
+def cancel_migration(db: Session, version: Optional[int] = None) -> Dict[str, Any]:
+    """取消进行中的迁移；执行中的任务在下一批结束时退出并删除新集合，没有任务在执行时立即删除"""
+    row = get_building(db, version)
+    if row is None:
+        raise ValueError("没有进行中的迁移任务")
+    running = not lease_expired(row)
+    # 曾经生效过的集合（回滚目标）保留为 retired，从未生效的新集合标记为 failed 并删除
+    row.status = STATUS_RETIRED if row.activated_at else STATUS_FAILED
+    row.error_message = "已取消"
+    row.heartbeat_at = None
+    db.commit()
+    if not running and row.status == STATUS_FAILED:
+        _drop_collections(row)
+    logger.info(f"已取消嵌入集合迁移任务: {row.name}")
+    return describe(row)
+
+def _fail(db: Session, name: str, error: Exception) -> None:
+    """迁移失败：当前生效集合保持不变；新集合标记为 failed 并删除，回滚目标恢复为 retired"""
+    db.rollback()
+    row = get_collection(db, name=name)
+    if row is None:
+        return
+    if row.status == STATUS_BUILDING:
+        row.status = STATUS_RETIRED if row.activated_at else STATUS_FAILED
+        row.error_message = str(error)
+    row.heartbeat_at = None
+    db.commit()
+    if row.status == STATUS_FAILED:
+        _drop_collections(row)
+
+def _swap(db: Session, migration: CollectionMigration) -> None:
+    """在同一事务中切换生效集合、初始化新集合的压缩计数并递增知识库版本号"""
+    now = datetime.now()
+    retired = db.query(EmbeddingCollection).filter(
+        EmbeddingCollection.name == migration.source_name,
+        EmbeddingCollection.status == STATUS_ACTIVE
+    ).update({"status": STATUS_RETIRED}, synchronize_session=False)
+    activated = db.query(EmbeddingCollection).filter(
+        EmbeddingCollection.name == migration.name,
+        EmbeddingCollection.status == STATUS_BUILDING
+    ).update({
+        "status": STATUS_ACTIVE,
+        "activated_at": now,
+        "previous": migration.source_name,
+        "error_message": None,
+        "heartbeat_at": None
+    }, synchronize_session=False)
+    if retired != 1 or activated != 1:
+        db.rollback()
+        raise RuntimeError("生效集合已被其他操作修改，放弃切换")
+
+    state = knowledge_registry.get_collection_state(db, migration.name)
+    state.live_vectors = migration.target.count()
+    state.deleted_vectors = 0
+    # 缓存答案的问题向量来自旧模型，与新模型的查询向量不可比较
+    knowledge_registry.bump_version(db)
+    db.commit()
+    get_answer_cache().clear(db)
+
+async def _wait_for_compaction(db: Session, migration: CollectionMigration) -> None:
+    """源集合正在压缩（会替换集合）时等待压缩结束；迁移开始后定时压缩会跳过"""
+    while True:
+        state = knowledge_registry.get_collection_state(db, migration.source_name)
+        db.commit()
+        started = state.compaction_started_at
+        if started is None or started < datetime.now() - timedelta(seconds=knowledge_registry.COMPACTION_LEASE_SECONDS):
+            return
+        logger.info(f"集合 {migration.source_name} 正在压缩，等待结束后开始迁移")
+        migration.heartbeat()
+        await asyncio.sleep(COMPACTION_WAIT_INTERVAL)
+
+async def run_migration(version: Optional[int] = None, rag_service: Optional[RAGService] = None) -> Optional[Dict[str, Any]]:
+    """执行（或继续）迁移任务：嵌入全部 chunk → 补齐迁移期间的增删 → 自检 → 原子切换 → 补齐切换窗口内落在旧集合上的写入
+
+    迁移期间查询和入库继续使用当前集合；任一步失败时当前集合保持生效，新集合被删除。
+    没有进行中的任务时返回 None，任务由其他进程执行时直接返回其状态。
+    """
+    db = SessionLocal()
+    try:
+        row = get_building(db, version)
+        if row is None:
+            return None
+        acquired = db.query(EmbeddingCollection).filter(
+            EmbeddingCollection.name == row.name,
+            EmbeddingCollection.status == STATUS_BUILDING,
+            (EmbeddingCollection.heartbeat_at.is_(None)) |
+            (EmbeddingCollection.heartbeat_at < datetime.now() - timedelta(seconds=MIGRATION_LEASE_SECONDS))
+        ).update({"heartbeat_at": datetime.now()}, synchronize_session=False)
+        db.commit()
+        if acquired != 1:
+            logger.info(f"嵌入集合迁移任务 {row.name} 正由其他进程执行")
+            db.refresh(row)
+            return describe(row)
+
+        name = row.name
+        source_row = get_active(db)
+        start = time.perf_counter()
+        try:
+            embeddings = await asyncio.get_event_loop().run_in_executor(None, create_embeddings, collection_spec(row))
+            migration = CollectionMigration(db, row, source_row, embeddings, rag_service)
+            await _wait_for_compaction(db, migration)
+            logger.info(f"开始迁移嵌入集合: {source_row.name} -> {name} ({format_spec(collection_spec(row))})")
+
+            result = await migration.sync()
+            logger.info(f"首轮嵌入完成: 写入 {result['added']} 个 chunk，耗时 {time.perf_counter() - start:.1f}s")
+            for _ in range(RECONCILE_PASSES):
+                if not result["added"] and not result["deleted"]:
+                    break
+                result = await migration.sync()
+                logger.info(f"补齐迁移期间的变更: 新增 {result['added']}，删除 {result['deleted']}")
+
+            centroids = await _in_executor(migration.refresh_centroids)
+            recall = await _in_executor(migration.verify)
+            logger.info(f"新集合自检通过: 抽样召回率 {recall:.0%}，文件质心 {centroids} 个")
+
+            # 切换前最后比对一次，切换窗口内的变更由 reconcile_after_swap 补齐
+            result = await migration.sync()
+            if result["file_ids"]:
+                await _in_executor(migration.refresh_centroids, result["file_ids"])
+            _swap(db, migration)
+        except MigrationCancelled as e:
+            logger.info(str(e))
+            _fail(db, name, e)
+            db.expire_all()
+            return describe(get_collection(db, name=name))
+        except Exception as e:
+            logger.error(f"嵌入集合迁移失败，继续使用 {source_row.name}: {str(e)}")
+            _fail(db, name, e)
+            db.expire_all()
+            return describe(get_collection(db, name=name))
+
+        db.expire_all()
+        collection = describe(get_collection(db, name=name))
+        logger.info(f"嵌入集合已切换到 {name}，总耗时 {time.perf_counter() - start:.1f}s")
+        if rag_service is not None:
+            try:
+                rag_service.switch_collection(collection, embeddings, migration.target, migration.router)
+            except Exception as e:
+                logger.error(f"本进程切换嵌入集合失败，将在下次检查时重试: {str(e)}")
+
+        # 等其他 worker 跟随切换后，再补齐它们切换前写入（或删除）旧集合的 chunk
+        await asyncio.sleep(settings.EMBEDDING_MIGRATION_GRACE_SECONDS)
+        try:
+            late = await migration.reconcile_after_swap(result["source_ids"])
+            if late["added"] or late["deleted"]:
+                logger.info(f"补齐切换窗口内旧集合上的变更: 新增 {late['added']}，删除 {late['deleted']}")
+        except Exception as e:
+            logger.error(f"补齐切换窗口内的变更失败，可重新上传受影响的文件: {str(e)}")
+        return collection
+    finally:
+        db.close()
+
+def drop_inactive(db: Session) -> List[str]:
+    """删除 retired 和 failed 版本的向量集合（释放空间，删除后无法回滚到这些版本），返回删除的集合名"""
+    rows = db.query(EmbeddingCollection).filter(
+        EmbeddingCollection.status.in_([STATUS_RETIRED, STATUS_FAILED])
+    ).order_by(EmbeddingCollection.version).all()
+    dropped = []
+    for row in rows:
+        _drop_collections(row)
+        db.query(VectorCollectionState).filter(VectorCollectionState.name == row.name).delete(synchronize_session=False)
+        row.status = STATUS_DROPPED
+        row.heartbeat_at = None
+        dropped.append(row.name)
+    db.commit()
+    if dropped:
+        logger.info(f"已删除不再使用的嵌入集合: {', '.join(dropped)}")
+    return dropped
+
+async def run_migration_supervisor():
+    """启动时接手未完成的迁移任务；任务由其他 worker 执行时定期检查，它中断（心跳过期）后接手继续"""
+    if not settings.EMBEDDING_MIGRATION_AUTO_RESUME:
+        return
+    while True:
+        try:
+            result = await run_migration(rag_service=get_rag_service())
+        except Exception as e:
+            logger.error(f"嵌入集合迁移任务执行失败: {str(e)}")
+            return
+        if result is None or result["status"] != STATUS_BUILDING:
+            return
+        await asyncio.sleep(MIGRATION_LEASE_SECONDS)
@@ -1,8 +1,12 @@
 from typing import List, Optional, Any
 from langchain_core.embeddings import Embeddings
 from pydantic import BaseModel, SecretStr, Field
+from loguru import logger
+import numpy as np
 import openai
+import json
 import os
+from app.core.config import settings
 
 class SiliconFlowEmbeddings(BaseModel, Embeddings):
     """SiliconFlow embedding models."""
@@ -55,3 +59,191 @@ class SiliconFlowEmbeddings(BaseModel, Embeddings):
             raise e
             print(f"Error embedding query: {e}")
             return []
+
+class OnnxEmbeddings(BaseModel, Embeddings):
+    """ONNX Runtime embeddings with int8 dynamic quantisation.
+
+    The Hugging Face model is exported to ONNX (and quantised) once and cached under
+    ``cache_dir``; later loads only need onnxruntime and tokenizers, not PyTorch.
+    Mean pooling over the attention mask matches the sentence-transformers pipeline.
+    """
+
+    model_config = {"protected_namespaces": ()}
+
+    model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    cache_dir: str = "./models/onnx"
+    quantize: bool = True
+    max_length: int = 128
+    batch_size: int = 32
+    num_threads: int = 0
+    normalize: bool = True
+    session: Any = None
+    tokenizer: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = self.export()
+        model_dir = os.path.dirname(model_path)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        with open(os.path.join(model_dir, "export.json"), "r", encoding="utf-8") as f:
+            pad = json.load(f)
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding(pad_id=pad["pad_id"], pad_token=pad["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+    @property
+    def model_dir(self) -> str:
+        return os.path.join(self.cache_dir, self.model_name.replace("/", "__"))
+
+    def export(self) -> str:
+        """Export (and quantise) the model if it is not cached yet; return the ONNX file to load."""
+        model_dir = self.model_dir
+        fp32_path = os.path.join(model_dir, "model.onnx")
+        int8_path = os.path.join(model_dir, "model.int8.onnx")
+        # export.json is written last, so its presence means the fp32 export and tokenizer are complete
+        exported = os.path.exists(os.path.join(model_dir, "export.json"))
+        target = int8_path if self.quantize else fp32_path
+        if exported and os.path.exists(target):
+            return target
+
+        # Only needed once, at export time
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        os.makedirs(model_dir, exist_ok=True)
+        if not exported:
+            hf_tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            model = AutoModel.from_pretrained(self.model_name).eval()
+
+            class Encoder(torch.nn.Module):
+                def __init__(self, base):
+                    super().__init__()
+                    self.base = base
+
+                def forward(self, input_ids, attention_mask, token_type_ids):
+                    return self.base(
+                        input_ids=input_ids,
+                        attention_mask=attention_mask,
+                        token_type_ids=token_type_ids
+                    ).last_hidden_state
+
+            dummy = hf_tokenizer(["export"], return_tensors="pt")
+            token_type_ids = dummy.get("token_type_ids", torch.zeros_like(dummy["input_ids"]))
+            dynamic = {0: "batch", 1: "sequence"}
+            # Several workers may export concurrently on first start; each writes its own temp file
+            tmp_path = f"{fp32_path}.{os.getpid()}.tmp"
+            with torch.no_grad():
+                torch.onnx.export(
+                    Encoder(model),
+                    (dummy["input_ids"], dummy["attention_mask"], token_type_ids),
+                    tmp_path,
+                    input_names=["input_ids", "attention_mask", "token_type_ids"],
+                    output_names=["last_hidden_state"],
+                    dynamic_axes={
+                        "input_ids": dynamic,
+                        "attention_mask": dynamic,
+                        "token_type_ids": dynamic,
+                        "last_hidden_state": dynamic
+                    },
+                    opset_version=14,
+                    do_constant_folding=True
+                )
+            os.replace(tmp_path, fp32_path)
+            hf_tokenizer.save_pretrained(model_dir)
+            with open(os.path.join(model_dir, "export.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "model_name": self.model_name,
+                    "pad_id": hf_tokenizer.pad_token_id,
+                    "pad_token": hf_tokenizer.pad_token
+                }, f)
+
+        if self.quantize and not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            tmp_path = f"{int8_path}.{os.getpid()}.tmp"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+        return target
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        input_names = {i.name for i in self.session.get_inputs()}
+        results = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+            hidden = self.session.run(None, feeds)[0]
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            results.extend(pooled.tolist())
+        return results
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs."""
+        return self._embed([t.replace("\n", " ") for t in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text."""
+        return self._embed([text.replace("\n", " ")])[0]
+
+class TruncatedEmbeddings(Embeddings):
+    """Keep the leading ``dimensions`` components of another model's vectors and re-normalise
+    (Matryoshka-style truncation), applied identically to documents and queries."""
+
+    def __init__(self, base: Embeddings, dimensions: int):
+        self.base = base
+        self.dimensions = dimensions
+
+    def _truncate(self, vectors: List[List[float]]) -> List[List[float]]:
+        if not vectors:
+            return vectors
+        if len(vectors[0]) < self.dimensions:
+            raise ValueError(f"EMBEDDING_DIMENSIONS={self.dimensions} exceeds model dimension {len(vectors[0])}")
+        matrix = np.asarray(vectors, dtype=np.float32)[:, :self.dimensions]
+        matrix /= np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+        return matrix.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs."""
+        return self._truncate(self.base.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text."""
+        return self._truncate([self.base.embed_query(text)])[0]
+
+def create_local_embeddings(model_name: Optional[str] = None) -> Embeddings:
+    """Create a local embedding model (default EMBEDDING_MODEL) on LOCAL_EMBEDDING_BACKEND (torch or onnx)."""
+    model_name = model_name or settings.EMBEDDING_MODEL
+    if settings.LOCAL_EMBEDDING_BACKEND == "onnx":
+        try:
+            embeddings = OnnxEmbeddings(
+                model_name=model_name,
+                cache_dir=settings.ONNX_MODEL_DIR,
+                quantize=settings.ONNX_QUANTIZE,
+                num_threads=settings.ONNX_NUM_THREADS
+            )
+            logger.info(f"使用 ONNX Runtime 嵌入模型: {model_name} (int8={settings.ONNX_QUANTIZE})")
+            return embeddings
+        except Exception as e:
+            logger.warning(f"ONNX 嵌入模型加载失败，回退到 PyTorch: {e}")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
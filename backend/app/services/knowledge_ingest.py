@@ -0,0 +1,234 @@
+from typing import List, Dict, Any, Optional
+from pathlib import Path
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from sqlalchemy.orm import Session
+from langchain_core.documents import Document
+from loguru import logger
+from app.core.config import settings
+from app.models.sql_models import KnowledgeFile
+from app.services import knowledge_registry
+from app.services.knowledge_namespaces import SHARED_NAMESPACE
+from app.services.rag_service import RAGService
+
+# 解析结果格式版本：更换解析器或改变页面 metadata 的处理方式时递增，旧缓存自动失效
+PARSER_VERSION = 1
+# 解析器写入的、与具体存储路径相关的 metadata，不进入缓存（入库时由文件记录重新填写）
+VOLATILE_METADATA = ("source", "file_path")
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+# 补建近重复片段时最多重复的轮数（重建一个文件会替换它的 chunk，可能让依赖它的文件也需要重建）
+RESTORE_PASSES = 5
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def parse_file(file_path: str) -> List[Document]:
+    """调用文档加载器解析文件，返回逐页文本（PDF 每页一个 Document）"""
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+
+    if Path(file_path).suffix.lower() == ".pdf":
+        loader = PyPDFLoader(file_path)
+    else:
+        loader = TextLoader(file_path, encoding="utf-8")
+    return loader.load()
+
+class ParsedTextCache:
+    """按文件内容哈希保存解析后的逐页文本和页面 metadata（gzip 压缩的 JSON）
+
+    同一内容只解析一次；修改 CHUNK_SIZE / CHUNK_OVERLAP 或更换嵌入模型后重建索引时直接读取缓存，
+    不再调用 PDF 解析器。目录按哈希前两位分桶，避免单个目录下文件过多。
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, content_hash: str) -> Path:
+        return self.root / content_hash[:2] / f"{content_hash}.json.gz"
+
+    def get(self, content_hash: Optional[str]) -> Optional[List[Document]]:
+        if not content_hash:
+            return None
+        path = self.path(content_hash)
+        if not path.exists():
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"解析缓存 {path} 读取失败，将重新解析: {e}")
+            return None
+        if data.get("parser_version") != PARSER_VERSION:
+            return None
+        return [Document(page_content=page["text"], metadata=page["metadata"]) for page in data["pages"]]
+
+    def put(self, content_hash: str, pages: List[Document]) -> None:
+        path = self.path(content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "parser_version": PARSER_VERSION,
+            "content_hash": content_hash,
+            "pages": [
+                {
+                    "text": page.page_content,
+                    "metadata": {k: v for k, v in page.metadata.items() if k not in VOLATILE_METADATA}
+                }
+                for page in pages
+            ]
+        }
+        # 先写临时文件再替换，并发解析同一内容时不会读到写了一半的缓存
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def delete(self, content_hash: str) -> None:
+        self.path(content_hash).unlink(missing_ok=True)
+
+    def hashes(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return [path.name[:-len(".json.gz")] for path in self.root.glob("*/*.json.gz")]
+
+def get_parsed_cache() -> Optional[ParsedTextCache]:
+    if not settings.PARSED_TEXT_CACHE_ENABLED:
+        return None
+    return ParsedTextCache(settings.PARSED_TEXT_CACHE_DIR or str(Path(settings.UPLOAD_DIR) / "knowledge_parsed"))
+
+def load_pages(file_record: KnowledgeFile, parse_missing: bool = True) -> Optional[List[Document]]:
+    """读取文件的逐页文本：优先读解析缓存，缺失时解析原文件并写入缓存；parse_missing 为 False 时缺失返回 None"""
+    cache = get_parsed_cache()
+    if cache is not None:
+        pages = cache.get(file_record.content_hash)
+        if pages is not None:
+            return pages
+    if not parse_missing:
+        return None
+
+    pages = parse_file(file_record.file_path)
+    if cache is not None:
+        if not file_record.content_hash:
+            # 内容哈希上线前上传的文件，补算哈希作为缓存键
+            file_record.content_hash = file_sha256(file_record.file_path)
+        try:
+            cache.put(file_record.content_hash, pages)
+        except Exception as e:
+            logger.warning(f"写入解析缓存失败: {e}")
+    return pages
+
+def build_documents(file_record: KnowledgeFile, pages: List[Document]) -> List[Document]:
+    """为逐页文本附加文件级 metadata，得到交给 RAGService 切分和嵌入的文档"""
+    documents = []
+    for page in pages:
+        metadata = {k: v for k, v in page.metadata.items() if k not in VOLATILE_METADATA}
+        metadata["source"] = file_record.filename
+        metadata["file_id"] = file_record.id
+        metadata["namespace"] = file_record.namespace or SHARED_NAMESPACE
+        documents.append(Document(page_content=page.page_content, metadata=metadata))
+    return documents
+
+def discard_parsed(db: Session, content_hash: Optional[str]) -> None:
+    """文件删除后，没有其他文件引用同一内容时删除解析缓存"""
+    cache = get_parsed_cache()
+    if cache is None or not content_hash:
+        return
+    if db.query(KnowledgeFile.id).filter(KnowledgeFile.content_hash == content_hash).first() is None:
+        cache.delete(content_hash)
+
+def prune_parsed_cache(db: Session) -> int:
+    """删除不再被任何文件引用的解析缓存，返回删除数量（扫描整个缓存目录）"""
+    cache = get_parsed_cache()
+    if cache is None:
+        return 0
+    referenced = {row[0] for row in db.query(KnowledgeFile.content_hash).filter(KnowledgeFile.content_hash.isnot(None)).all()}
+    removed = 0
+    for content_hash in cache.hashes():
+        if content_hash not in referenced:
+            cache.delete(content_hash)
+            removed += 1
+    return removed
+
+async def index_file(db: Session, rag_service: RAGService, file_record: KnowledgeFile, parse_missing: bool = True) -> int:
+    """解析（或读取缓存）并建立文件索引，登记 chunk 后提交，返回 chunk 数"""
+    pages = load_pages(file_record, parse_missing=parse_missing)
+    if pages is None:
+        raise FileNotFoundError(f"文件 {file_record.filename} 没有解析缓存")
+    duplicates = []
+    chunks = await rag_service.add_documents(build_documents(file_record, pages), duplicates=duplicates)
+    knowledge_registry.register_chunks(db, file_record.id, chunks)
+    file_record.duplicate_chunks = len(duplicates)
+    file_record.status = "indexed"
+    file_record.error_message = None
+    db.commit()
+    return len(chunks)
+
+async def reindex_file(db: Session, rag_service: RAGService, file_record: KnowledgeFile, parse_missing: bool = False) -> Dict[str, Any]:
+    """按当前切分和嵌入配置重建单个文件的索引：先写入新 chunk 再删除旧 chunk，重建期间检索不中断"""
+    pages = load_pages(file_record, parse_missing=parse_missing)
+    if pages is None:
+        return {"file_id": file_record.id, "status": "skipped", "reason": "no parsed cache"}
+
+    old_ids = knowledge_registry.get_file_chunk_ids(db, file_record.id)
+    if not old_ids:
+        # 注册表上线前索引的文件只能按 metadata 删除，必须在写入新 chunk 之前删除
+        deleted = await rag_service.delete_vectors_by_file(file_record.id)
+        knowledge_registry.remove_file_chunks(db, file_record.id, deleted)
+    duplicates = []
+    chunks = await rag_service.add_documents(build_documents(file_record, pages), duplicates=duplicates)
+    if old_ids:
+        deleted = await rag_service.delete_vectors(old_ids)
+        knowledge_registry.remove_file_chunks(db, file_record.id, deleted)
+    knowledge_registry.register_chunks(db, file_record.id, chunks)
+    file_record.duplicate_chunks = len(duplicates)
+    file_record.status = "indexed"
+    file_record.error_message = None
+    db.commit()
+    return {"file_id": file_record.id, "status": "indexed", "chunks": len(chunks), "duplicates": len(duplicates)}
+
+def dedup_ratio(chunks: int, duplicates: int) -> float:
+    """入库时跳过的近重复片段占切分出的片段总数的比例"""
+    total = chunks + duplicates
+    return round(duplicates / total, 4) if total else 0.0
+
+async def restore_near_duplicates(db: Session, rag_service: RAGService) -> Dict[str, Any]:
+    """重建入库时被判为近重复、但所依据的 chunk 已被删除的文件，让这些片段重新进入索引
+
+    删除文件、重置命名空间或重建文件索引后调用；从解析缓存读取文本，缓存缺失时解析原文件。
+    """
+    index = rag_service.near_duplicates
+    if index is None:
+        return {"reindexed": 0, "skipped": 0}
+    reindexed, skipped = set(), set()
+    for _ in range(RESTORE_PASSES):
+        file_ids = [file_id for file_id in index.orphaned_files() if file_id not in skipped]
+        if not file_ids:
+            break
+        for file_id in file_ids:
+            file_record = db.query(KnowledgeFile).filter(KnowledgeFile.id == file_id).first()
+            result = None
+            if file_record is not None and file_record.status == "indexed":
+                try:
+                    result = await reindex_file(db, rag_service, file_record, parse_missing=True)
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"重建文件 {file_id} 的近重复片段失败: {e}")
+            if result is not None and result["status"] == "indexed":
+                reindexed.add(file_id)
+            else:
+                # 文件已删除或无法重建，丢弃其跳过记录，避免每次都重试
+                index.forget_files([file_id])
+                skipped.add(file_id)
+    if reindexed:
+        logger.info(f"已重建 {len(reindexed)} 个文件以恢复依据已删除的近重复片段")
+    return {"reindexed": len(reindexed), "skipped": len(skipped)}
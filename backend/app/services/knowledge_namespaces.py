@@ -0,0 +1,87 @@
+from typing import List, Dict, Any, Optional
+import hashlib
+import re
+from sqlalchemy.orm import Session
+from app.models.sql_models import User, KnowledgeNamespace, KnowledgeNamespaceMember
+
+# 命名空间：shared 所有用户可检索（管理员维护），user:<id> 个人，team:<name> 团队成员可见
+SHARED_NAMESPACE = "shared"
+TEAM_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_\-]{1,64}$")
+
+def user_namespace(user_id: int) -> str:
+    return f"user:{user_id}"
+
+def team_namespace(name: str) -> str:
+    return f"team:{name}"
+
+def namespace_kind(namespace: str) -> str:
+    if namespace == SHARED_NAMESPACE:
+        return "shared"
+    return namespace.split(":", 1)[0] if ":" in namespace else "unknown"
+
+def team_memberships(db: Session, user_id: int) -> List[str]:
+    rows = db.query(KnowledgeNamespaceMember.namespace).filter(KnowledgeNamespaceMember.user_id == user_id).all()
+    return [row[0] for row in rows]
+
+def readable_namespaces(db: Session, user: Optional[User]) -> List[str]:
+    """用户可检索的命名空间"""
+    if user is None:
+        return [SHARED_NAMESPACE]
+    return [SHARED_NAMESPACE, user_namespace(user.id)] + sorted(team_memberships(db, user.id))
+
+def exists(db: Session, namespace: str) -> bool:
+    kind = namespace_kind(namespace)
+    if kind == "shared":
+        return True
+    if kind == "user":
+        user_id = namespace.split(":", 1)[1]
+        return user_id.isdigit() and db.query(User.id).filter(User.id == int(user_id)).first() is not None
+    if kind == "team":
+        return db.query(KnowledgeNamespace.name).filter(KnowledgeNamespace.name == namespace).first() is not None
+    return False
+
+def can_write(db: Session, user: User, namespace: str) -> bool:
+    """上传文件、删除自己上传的文件"""
+    if user.is_superuser:
+        return exists(db, namespace)
+    kind = namespace_kind(namespace)
+    if kind == "user":
+        return namespace == user_namespace(user.id)
+    if kind == "team":
+        return namespace in team_memberships(db, user.id)
+    return False
+
+def can_manage(db: Session, user: User, namespace: str) -> bool:
+    """重置命名空间、删除任意文件、管理团队成员"""
+    if user.is_superuser:
+        return exists(db, namespace)
+    kind = namespace_kind(namespace)
+    if kind == "user":
+        return namespace == user_namespace(user.id)
+    if kind == "team":
+        team = db.query(KnowledgeNamespace).filter(KnowledgeNamespace.name == namespace).first()
+        return team is not None and team.owner_id == user.id
+    return False
+
+def search_namespaces(db: Session, user: Optional[User], requested: Optional[List[str]] = None) -> List[str]:
+    """本次检索的命名空间：可检索命名空间（与请求指定的取交集）中非空的部分，读取维护好的计数器"""
+    from app.services import knowledge_registry
+
+    namespaces = readable_namespaces(db, user)
+    if requested:
+        namespaces = [namespace for namespace in namespaces if namespace in set(requested)]
+    stats = knowledge_registry.get_namespace_stats(db, namespaces)
+    return [namespace for namespace in namespaces if stats[namespace]["total_chunks"] > 0]
+
+def namespace_filter(namespaces: List[str]) -> Dict[str, Any]:
+    """向量检索的 metadata 过滤条件，在打分前把候选限制在给定命名空间内"""
+    if len(namespaces) == 1:
+        return {"namespace": namespaces[0]}
+    return {"namespace": {"$in": list(namespaces)}}
+
+def scope_fingerprint(fingerprint: str, namespaces: Optional[List[str]]) -> str:
+    """答案缓存作用域：使用知识库的回答只能在可检索命名空间完全相同的用户之间复用"""
+    if not namespaces:
+        return fingerprint
+    payload = fingerprint + "\n" + ",".join(sorted(namespaces))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,318 @@
+from typing import List, Dict, Any, Optional
+from collections import Counter
+from datetime import datetime, timedelta
+import asyncio
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from langchain_core.documents import Document
+from loguru import logger
+from app.core.config import settings
+from app.db.base import SessionLocal
+from app.models.sql_models import KnowledgeFile, KnowledgeChunk, KnowledgeStats, VectorCollectionState, AnswerCacheEntry
+from app.services import embedding_collections
+from app.services.rag_service import RAGService, get_rag_service
+
+GLOBAL_SCOPE = "global"
+# 压缩租约超时（秒）：多个 worker 共享同一向量库时只允许一个 worker 执行压缩
+COMPACTION_LEASE_SECONDS = 3600
+
+def get_collection_state(db: Session, name: Optional[str] = None) -> VectorCollectionState:
+    """获取向量集合状态记录（默认为当前生效的嵌入集合），不存在时创建"""
+    name = name or embedding_collections.get_active_name(db)
+    state = db.query(VectorCollectionState).filter(VectorCollectionState.name == name).first()
+    if not state:
+        state = VectorCollectionState(name=name, live_vectors=0, deleted_vectors=0)
+        db.add(state)
+        db.flush()
+    return state
+
+def get_stats_row(db: Session, scope: str = GLOBAL_SCOPE) -> KnowledgeStats:
+    """获取统计计数器记录，不存在时创建"""
+    stats = db.query(KnowledgeStats).filter(KnowledgeStats.scope == scope).first()
+    if not stats:
+        stats = KnowledgeStats(scope=scope, file_count=0, total_chunks=0)
+        db.add(stats)
+        db.flush()
+    return stats
+
+def get_stats(db: Session, scope: str = GLOBAL_SCOPE) -> Dict[str, Any]:
+    """读取知识库（或某个命名空间）统计信息（单行主键查询，与语料规模无关）"""
+    stats = db.query(KnowledgeStats).filter(KnowledgeStats.scope == scope).first()
+    if not stats:
+        return {"file_count": 0, "total_chunks": 0, "updated_at": None}
+    return {
+        "file_count": stats.file_count or 0,
+        "total_chunks": stats.total_chunks or 0,
+        "updated_at": stats.updated_at
+    }
+
+def get_namespace_stats(db: Session, namespaces: List[str]) -> Dict[str, Dict[str, Any]]:
+    """批量读取多个命名空间的统计信息"""
+    rows = {row.scope: row for row in db.query(KnowledgeStats).filter(KnowledgeStats.scope.in_(namespaces)).all()}
+    result = {}
+    for namespace in namespaces:
+        row = rows.get(namespace)
+        result[namespace] = {
+            "file_count": (row.file_count or 0) if row else 0,
+            "total_chunks": (row.total_chunks or 0) if row else 0,
+            "updated_at": row.updated_at if row else None
+        }
+    return result
+
+def _adjust_counts(db: Session, namespace: Optional[str], files: int, chunks: int) -> None:
+    """同时更新全局和命名空间计数器"""
+    scopes = [GLOBAL_SCOPE] + ([namespace] if namespace and namespace != GLOBAL_SCOPE else [])
+    for scope in scopes:
+        stats = get_stats_row(db, scope)
+        stats.file_count = max((stats.file_count or 0) + files, 0)
+        stats.total_chunks = max((stats.total_chunks or 0) + chunks, 0)
+
+def get_kb_version(db: Session) -> int:
+    """知识库内容版本号，每次建立索引或删除都会递增"""
+    stats = db.query(KnowledgeStats).filter(KnowledgeStats.scope == GLOBAL_SCOPE).first()
+    return (stats.version or 0) if stats else 0
+
+def bump_version(db: Session) -> int:
+    """递增知识库版本号，并清除基于旧版本生成的缓存答案（调用方负责 commit）"""
+    stats = get_stats_row(db)
+    stats.version = (stats.version or 0) + 1
+    # 不使用知识库的回答以 kb_version=-1 缓存，与知识库内容无关，不随版本清除
+    db.query(AnswerCacheEntry).filter(
+        AnswerCacheEntry.kb_version >= 0,
+        AnswerCacheEntry.kb_version < stats.version
+    ).delete(synchronize_session=False)
+    return stats.version
+
+def register_chunks(db: Session, file_id: int, chunks: List[Document]) -> int:
+    """登记文件写入向量库的 chunk 并更新统计计数（调用方负责 commit）"""
+    for chunk in chunks:
+        db.add(KnowledgeChunk(
+            id=chunk.metadata["chunk_id"],
+            file_id=file_id,
+            chunk_index=chunk.metadata.get("chunk_index"),
+            content_hash=chunk.metadata.get("content_hash")
+        ))
+
+    file_record = db.query(KnowledgeFile).filter(KnowledgeFile.id == file_id).first()
+    if file_record:
+        file_record.chunk_count = len(chunks)
+
+    # 与 recount_stats 口径一致：有 chunk 的文件才计入文件数（全部片段都是近重复时不计）
+    _adjust_counts(db, file_record.namespace if file_record else None, 1 if chunks else 0, len(chunks))
+    bump_version(db)
+
+    state = get_collection_state(db)
+    state.live_vectors = (state.live_vectors or 0) + len(chunks)
+    return len(chunks)
+
+def get_file_chunk_ids(db: Session, file_id: int) -> List[str]:
+    """获取文件对应的全部 chunk ID"""
+    rows = db.query(KnowledgeChunk.id).filter(KnowledgeChunk.file_id == file_id).all()
+    return [row[0] for row in rows]
+
+def remove_file_chunks(db: Session, file_id: int, deleted_count: int) -> None:
+    """删除文件的注册表记录并累计已删除向量数（调用方负责 commit）"""
+    db.query(KnowledgeChunk).filter(KnowledgeChunk.file_id == file_id).delete(synchronize_session=False)
+
+    if deleted_count:
+        namespace = db.query(KnowledgeFile.namespace).filter(KnowledgeFile.id == file_id).scalar()
+        _adjust_counts(db, namespace, -1, -deleted_count)
+        bump_version(db)
+
+    state = get_collection_state(db)
+    state.live_vectors = max((state.live_vectors or 0) - deleted_count, 0)
+    state.deleted_vectors = (state.deleted_vectors or 0) + deleted_count
+
+def reset_registry(db: Session) -> None:
+    """清空注册表（向量集合被整体清空后调用，调用方负责 commit）"""
+    db.query(KnowledgeChunk).delete(synchronize_session=False)
+    db.query(KnowledgeStats).filter(KnowledgeStats.scope != GLOBAL_SCOPE).delete(synchronize_session=False)
+
+    stats = get_stats_row(db)
+    stats.file_count = 0
+    stats.total_chunks = 0
+    bump_version(db)
+
+    state = get_collection_state(db)
+    state.live_vectors = 0
+    state.deleted_vectors = 0
+    state.last_compacted_at = datetime.now()
+
+async def delete_file_vectors(db: Session, rag_service: RAGService, file_id: int) -> int:
+    """删除文件在向量库中的全部向量，耗时只与该文件的 chunk 数相关"""
+    chunk_ids = get_file_chunk_ids(db, file_id)
+    if chunk_ids:
+        deleted = await rag_service.delete_vectors(chunk_ids)
+        await rag_service.delete_file_summaries([file_id])
+    else:
+        # 注册表上线前索引的文件没有登记记录，退回按 metadata 删除
+        deleted = await rag_service.delete_vectors_by_file(file_id)
+    await rag_service.forget_duplicate_records([file_id])
+
+    remove_file_chunks(db, file_id, deleted)
+    return deleted
+
+async def reset_namespace(db: Session, rag_service: RAGService, namespace: str) -> Dict[str, Any]:
+    """删除命名空间内的全部文件及其向量，耗时与该命名空间的 chunk 数相关（调用方负责删除磁盘文件）"""
+    files = db.query(KnowledgeFile).filter(KnowledgeFile.namespace == namespace).all()
+    deleted_vectors = 0
+    paths = []
+    for file_record in files:
+        deleted_vectors += await delete_file_vectors(db, rag_service, file_record.id)
+        paths.append(file_record.file_path)
+        db.delete(file_record)
+        # 每个文件单独提交，中途失败时已删除的文件不会残留计数
+        db.commit()
+
+    stats = get_stats_row(db, namespace)
+    stats.file_count = 0
+    stats.total_chunks = 0
+    bump_version(db)
+    db.commit()
+    logger.info(f"命名空间 {namespace} 已重置: {len(files)} 个文件, {deleted_vectors} 个向量")
+    return {"namespace": namespace, "deleted_files": len(files), "deleted_vectors": deleted_vectors, "paths": paths}
+
+def rebuild_namespace_stats(db: Session) -> Dict[str, Dict[str, int]]:
+    """按 knowledge_files 的 chunk_count 重新汇总各命名空间计数器（调用方负责 commit）"""
+    rows = db.query(
+        KnowledgeFile.namespace, func.count(KnowledgeFile.id), func.sum(KnowledgeFile.chunk_count)
+    ).filter(KnowledgeFile.chunk_count > 0).group_by(KnowledgeFile.namespace).all()
+
+    db.query(KnowledgeStats).filter(
+        KnowledgeStats.scope != GLOBAL_SCOPE
+    ).update({"file_count": 0, "total_chunks": 0}, synchronize_session=False)
+    result = {}
+    for namespace, file_count, chunk_count in rows:
+        if not namespace or namespace == GLOBAL_SCOPE:
+            continue
+        stats = get_stats_row(db, namespace)
+        stats.file_count = file_count
+        stats.total_chunks = int(chunk_count or 0)
+        result[namespace] = {"file_count": stats.file_count, "total_chunks": stats.total_chunks}
+    return result
+
+def recount_stats(db: Session, rag_service: RAGService) -> Dict[str, Any]:
+    """以向量库为准重新统计 chunk 数，校准计数器和注册表（管理任务，耗时与语料规模线性相关）"""
+    before = get_stats(db)
+
+    registered = {row[0] for row in db.query(KnowledgeChunk.id).all()}
+    file_ids = {row[0] for row in db.query(KnowledgeFile.id).all()}
+
+    counts = Counter()
+    seen = set()
+    backfilled = 0
+    orphan_chunks = 0
+    total_vectors = 0
+    for ids, metadatas in rag_service.iter_chunk_metadata():
+        total_vectors += len(ids)
+        for chunk_id, meta in zip(ids, metadatas):
+            file_id = (meta or {}).get("file_id")
+            if file_id not in file_ids:
+                orphan_chunks += 1
+                continue
+            counts[file_id] += 1
+            seen.add(chunk_id)
+            # 补登注册表上线前索引的 chunk
+            if chunk_id not in registered:
+                db.add(KnowledgeChunk(
+                    id=chunk_id,
+                    file_id=file_id,
+                    chunk_index=meta.get("chunk_index"),
+                    content_hash=meta.get("content_hash")
+                ))
+                backfilled += 1
+
+    # 删除向量库中已不存在的注册记录
+    stale_ids = list(registered - seen)
+    for i in range(0, len(stale_ids), 500):
+        db.query(KnowledgeChunk).filter(
+            KnowledgeChunk.id.in_(stale_ids[i:i + 500])
+        ).delete(synchronize_session=False)
+
+    for file_record in db.query(KnowledgeFile).all():
+        file_record.chunk_count = counts.get(file_record.id, 0)
+
+    stats = get_stats_row(db)
+    stats.file_count = sum(1 for count in counts.values() if count > 0)
+    stats.total_chunks = sum(counts.values())
+    rebuild_namespace_stats(db)
+
+    state = get_collection_state(db)
+    state.live_vectors = total_vectors
+    db.commit()
+
+    after = get_stats(db)
+    logger.info(f"知识库统计校准完成: {before} -> {after}")
+    return {
+        "before": before,
+        "after": after,
+        "backfilled_chunks": backfilled,
+        "stale_chunks": len(stale_ids),
+        "orphan_chunks": orphan_chunks
+    }
+
+def needs_compaction(state: VectorCollectionState) -> bool:
+    """已删除向量占比超过阈值时需要压缩"""
+    deleted = state.deleted_vectors or 0
+    total = deleted + (state.live_vectors or 0)
+    if deleted < settings.VECTOR_COMPACTION_MIN_DELETED or total == 0:
+        return False
+    return deleted / total >= settings.VECTOR_COMPACTION_THRESHOLD
+
+def acquire_compaction_lease(db: Session, name: Optional[str] = None) -> bool:
+    """原子地获取压缩租约（默认为当前生效的嵌入集合），已被其他 worker 持有且未过期时返回 False"""
+    name = name or embedding_collections.get_active_name(db)
+    now = datetime.now()
+    acquired = db.query(VectorCollectionState).filter(
+        VectorCollectionState.name == name,
+        (VectorCollectionState.compaction_started_at.is_(None)) |
+        (VectorCollectionState.compaction_started_at < now - timedelta(seconds=COMPACTION_LEASE_SECONDS))
+    ).update({"compaction_started_at": now}, synchronize_session=False)
+    db.commit()
+    return acquired == 1
+
+async def compact_if_needed(rag_service: RAGService, force: bool = False) -> bool:
+    """按已删除向量占比决定是否重建向量集合，返回是否执行了压缩"""
+    # 压缩的是本进程实际打开的集合，先跟上可能刚完成的嵌入集合切换
+    rag_service.sync_active_collection(force=True)
+    name = rag_service.collection["name"] if rag_service.collection else None
+    db = SessionLocal()
+    try:
+        state = get_collection_state(db, name)
+        db.commit()
+        if not force and not needs_compaction(state):
+            return False
+        if embedding_collections.migration_in_progress(db):
+            logger.info("嵌入集合迁移进行中，跳过压缩")
+            return False
+        if not acquire_compaction_lease(db, state.name):
+            logger.info("其他 worker 正在压缩向量集合，跳过")
+            return False
+
+        try:
+            db.refresh(state)
+            logger.info(f"向量集合已删除向量 {state.deleted_vectors}，存活向量 {state.live_vectors}，开始压缩")
+            live = await rag_service.compact_collection()
+            state.live_vectors = live
+            state.deleted_vectors = 0
+            state.last_compacted_at = datetime.now()
+        finally:
+            state.compaction_started_at = None
+            db.commit()
+        return True
+    finally:
+        db.close()
+
+async def run_compaction_scheduler():
+    """定时检查并压缩向量集合"""
+    interval = settings.VECTOR_COMPACTION_INTERVAL
+    if interval <= 0:
+        logger.info("向量集合定时压缩已关闭")
+        return
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await compact_if_needed(get_rag_service())
+        except Exception as e:
+            logger.error(f"向量集合压缩失败: {str(e)}")
@@ -0,0 +1,378 @@
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import json
+import shutil
+import time
+import numpy as np
+from sqlalchemy import DateTime
+from sqlalchemy.orm import Session
+from loguru import logger
+from app.core.config import settings
+from app.db.base import sync_id_sequence
+from app.models.sql_models import (
+    KnowledgeFile, KnowledgeChunk, KnowledgeNamespace, KnowledgeNamespaceMember, User
+)
+from app.services import embedding_collections, knowledge_registry
+from app.services.document_router import DocumentRouter, accumulate_centroids
+from app.services.lexical_index import LexicalIndex
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.molecule_index import MoleculeIndex
+from app.services.vector_index import VectorIndex
+
+SNAPSHOT_FORMAT = "chemistry-knowledge-snapshot"
+SNAPSHOT_VERSION = 1
+
+# 快照目录结构：
+#   manifest.json     格式版本、嵌入模型、向量维度、行数和校验和
+#   embeddings.f32    float32 小端行主序向量矩阵（已归一化），可直接 np.memmap
+#   chunks.jsonl      与向量逐行对应的 {"id", "document", "metadata"}
+#   files.jsonl       knowledge_files 记录
+#   namespaces.json   团队命名空间及成员
+#   lexical.db        词法索引的 SQLite 备份（可选，导入时省去分词）
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.f32"
+CHUNKS_FILE = "chunks.jsonl"
+FILES_FILE = "files.jsonl"
+NAMESPACES_FILE = "namespaces.json"
+LEXICAL_FILE = "lexical.db"
+
+# 校验和按块读取文件
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+def embedding_signature(db: Session) -> Dict[str, Any]:
+    """当前生效集合的嵌入模型标识；导入时与快照记录的模型不一致，检索结果将没有意义"""
+    active = embedding_collections.get_active(db)
+    return {"model": active.model, "dimensions": active.dimensions or 0}
+
+def snapshot_root() -> Path:
+    return Path(settings.SNAPSHOT_DIR)
+
+def resolve_snapshot(name: str) -> Path:
+    """快照名只能是 SNAPSHOT_DIR 下的一级目录，拒绝路径穿越"""
+    if not name or name in (".", "..") or "/" in name or "\\" in name:
+        raise ValueError(f"无效的快照名: {name}")
+    return snapshot_root() / name
+
+def _row_to_dict(row, columns) -> Dict[str, Any]:
+    data = {}
+    for column in columns:
+        value = getattr(row, column.name)
+        data[column.name] = value.isoformat() if isinstance(value, datetime) else value
+    return data
+
+def _dict_to_row(data: Dict[str, Any], columns) -> Dict[str, Any]:
+    row = {}
+    for column in columns:
+        if column.name not in data:
+            continue
+        value = data[column.name]
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        row[column.name] = value
+    return row
+
+def _file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def read_manifest(directory: Path) -> Dict[str, Any]:
+    manifest_file = directory / MANIFEST_FILE
+    if not manifest_file.exists():
+        raise ValueError(f"{directory} 不是知识库快照（缺少 {MANIFEST_FILE}）")
+    manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"未知的快照格式: {manifest.get('format')}")
+    if manifest.get("version", 0) > SNAPSHOT_VERSION:
+        raise ValueError(f"快照版本 {manifest.get('version')} 高于当前支持的版本 {SNAPSHOT_VERSION}，请升级后再导入")
+    return manifest
+
+def list_snapshots() -> List[Dict[str, Any]]:
+    """列出 SNAPSHOT_DIR 下的快照（只读取 manifest）"""
+    root = snapshot_root()
+    if not root.exists():
+        return []
+    snapshots = []
+    for directory in sorted(root.iterdir(), reverse=True):
+        if not directory.is_dir() or directory.name.endswith(".partial"):
+            continue
+        try:
+            manifest = read_manifest(directory)
+        except Exception as e:
+            logger.warning(f"跳过无法读取的快照 {directory}: {e}")
+            continue
+        snapshots.append({"name": directory.name, **manifest})
+    return snapshots
+
+def export_snapshot(
+    db: Session,
+    index: VectorIndex,
+    directory: Path,
+    lexical: Optional[LexicalIndex] = None,
+    batch_size: int = 1000
+) -> Dict[str, Any]:
+    """把 chunk 集合和知识库记录写成快照目录，返回 manifest
+
+    持有压缩租约期间导出，避免压缩替换集合导致分页遍历错位；先写入 <name>.partial 再改名，
+    中途失败不会留下看似完整的快照。导出期间仍有文件入库时 manifest 中 consistent 为 false。
+    """
+    directory = Path(directory)
+    if directory.exists():
+        raise ValueError(f"快照目录已存在: {directory}")
+    partial = directory.with_name(directory.name + ".partial")
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
+
+    knowledge_registry.get_collection_state(db)
+    db.commit()
+    if not knowledge_registry.acquire_compaction_lease(db):
+        shutil.rmtree(partial, ignore_errors=True)
+        raise RuntimeError("向量集合正在压缩，请稍后再导出")
+
+    start = time.perf_counter()
+    kb_version = knowledge_registry.get_kb_version(db)
+    try:
+        dimension = index.get_dimension()
+        embeddings_hash = hashlib.sha256()
+        chunks_hash = hashlib.sha256()
+        rows = 0
+        with open(partial / EMBEDDINGS_FILE, "wb") as vectors_out, \
+                open(partial / CHUNKS_FILE, "w", encoding="utf-8", newline="\n") as chunks_out:
+            for batch in index.iter_batches(batch_size, include_embeddings=True):
+                vectors = np.ascontiguousarray(batch["embeddings"], dtype="<f4")
+                if dimension is None:
+                    dimension = int(vectors.shape[1])
+                data = vectors.tobytes()
+                vectors_out.write(data)
+                embeddings_hash.update(data)
+                lines = "".join(
+                    json.dumps({"id": chunk_id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n"
+                    for chunk_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"])
+                )
+                chunks_out.write(lines)
+                chunks_hash.update(lines.encode("utf-8"))
+                rows += len(batch["ids"])
+
+        file_columns = KnowledgeFile.__table__.columns
+        with open(partial / FILES_FILE, "w", encoding="utf-8", newline="\n") as files_out:
+            files = db.query(KnowledgeFile).order_by(KnowledgeFile.id).all()
+            for file_record in files:
+                files_out.write(json.dumps(_row_to_dict(file_record, file_columns), ensure_ascii=False) + "\n")
+
+        namespaces = {
+            "namespaces": [_row_to_dict(row, KnowledgeNamespace.__table__.columns) for row in db.query(KnowledgeNamespace).all()],
+            "members": [_row_to_dict(row, KnowledgeNamespaceMember.__table__.columns) for row in db.query(KnowledgeNamespaceMember).all()]
+        }
+        (partial / NAMESPACES_FILE).write_text(json.dumps(namespaces, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        # 分词是导入时最耗时的一步（占重建时间的八成以上），词法索引整体备份进快照
+        if lexical is not None:
+            lexical.backup(str(partial / LEXICAL_FILE))
+
+        db.expire_all()
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "created_at": datetime.now().isoformat(),
+            "embedding": embedding_signature(db),
+            "backend": index.backend,
+            "dimension": dimension,
+            "chunks": rows,
+            "files": len(files),
+            "lexical": lexical is not None,
+            "kb_version": kb_version,
+            "consistent": knowledge_registry.get_kb_version(db) == kb_version,
+            "sha256": {EMBEDDINGS_FILE: embeddings_hash.hexdigest(), CHUNKS_FILE: chunks_hash.hexdigest()}
+        }
+        (partial / MANIFEST_FILE).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        partial.rename(directory)
+    except Exception:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    finally:
+        state = knowledge_registry.get_collection_state(db)
+        state.compaction_started_at = None
+        db.commit()
+
+    if not manifest["consistent"]:
+        logger.warning(f"导出快照 {directory.name} 期间知识库内容发生变化，快照可能不一致")
+    logger.info(f"知识库快照已导出到 {directory}: {rows} 个 chunk, {len(files)} 个文件, 耗时 {time.perf_counter() - start:.1f}s")
+    return manifest
+
+def verify_snapshot(directory: Path, manifest: Dict[str, Any], checksums: bool = False) -> None:
+    """校验向量文件大小与 manifest 一致；checksums 为 True 时同时校验 SHA-256（读取整个快照）"""
+    expected = manifest["chunks"] * (manifest["dimension"] or 0) * 4
+    actual = (directory / EMBEDDINGS_FILE).stat().st_size
+    if actual != expected:
+        raise ValueError(f"向量文件大小为 {actual} 字节，manifest 记录应为 {expected} 字节，快照已损坏")
+    if checksums:
+        for name, digest in manifest.get("sha256", {}).items():
+            if _file_sha256(directory / name) != digest:
+                raise ValueError(f"{name} 校验和不一致，快照已损坏")
+
+def _iter_chunk_batches(directory: Path, embeddings: np.ndarray, batch_size: int):
+    """按批读取 chunks.jsonl，与 memmap 中对应行的向量一起返回"""
+    ids, documents, metadatas = [], [], []
+    offset = 0
+    with open(directory / CHUNKS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            ids.append(record["id"])
+            documents.append(record["document"])
+            metadatas.append(record["metadata"] or {})
+            if len(ids) >= batch_size:
+                yield ids, documents, metadatas, embeddings[offset:offset + len(ids)]
+                offset += len(ids)
+                ids, documents, metadatas = [], [], []
+    if ids:
+        yield ids, documents, metadatas, embeddings[offset:offset + len(ids)]
+
+def import_snapshot(
+    db: Session,
+    index: VectorIndex,
+    directory: Path,
+    lexical: Optional[LexicalIndex] = None,
+    router: Optional[DocumentRouter] = None,
+    near_duplicates: Optional[NearDuplicateIndex] = None,
+    molecules: Optional[MoleculeIndex] = None,
+    batch_size: int = 1000,
+    verify: bool = False,
+    allow_model_mismatch: bool = False
+) -> Dict[str, Any]:
+    """把快照批量写入空的向量库和知识库记录，不调用嵌入模型
+
+    向量直接从内存映射的 embeddings.f32 按批切片写入；词法索引、文件质心、近重复签名、分子索引、chunk 注册表和
+    统计计数器在同一遍扫描中重建。目标向量库或 knowledge_files 非空时拒绝导入。
+    """
+    directory = Path(directory)
+    manifest = read_manifest(directory)
+    verify_snapshot(directory, manifest, checksums=verify)
+
+    current = embedding_signature(db)
+    if manifest.get("embedding") != current and not allow_model_mismatch:
+        raise ValueError(
+            f"快照的嵌入模型 {manifest.get('embedding')} 与当前配置 {current} 不一致，"
+            f"导入后查询向量与文档向量不可比较"
+        )
+    if index.count() > 0 or db.query(KnowledgeFile.id).first() is not None:
+        raise ValueError("目标知识库不为空，请先清空向量库和文件记录再导入快照")
+
+    knowledge_registry.get_collection_state(db)
+    db.commit()
+    if not knowledge_registry.acquire_compaction_lease(db):
+        raise RuntimeError("向量集合正在压缩，请稍后再导入")
+
+    start = time.perf_counter()
+    try:
+        # 先写入知识库记录（chunk 注册表引用 knowledge_files.id），保留原有 ID
+        user_ids = {row[0] for row in db.query(User.id).all()}
+        file_columns = KnowledgeFile.__table__.columns
+        files = []
+        with open(directory / FILES_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = _dict_to_row(json.loads(line), file_columns)
+                    if row.get("owner_id") not in user_ids:
+                        row["owner_id"] = None
+                    files.append(row)
+        db.bulk_insert_mappings(KnowledgeFile, files)
+        # 保留了原有 ID，之后上传的文件从最大 ID 之后继续编号
+        sync_id_sequence(db, KnowledgeFile.__tablename__)
+
+        namespaces_file = directory / NAMESPACES_FILE
+        if namespaces_file.exists():
+            data = json.loads(namespaces_file.read_text(encoding="utf-8"))
+            existing = {row[0] for row in db.query(KnowledgeNamespace.name).all()}
+            teams = [_dict_to_row(row, KnowledgeNamespace.__table__.columns) for row in data.get("namespaces", [])]
+            teams = [team for team in teams if team["name"] not in existing]
+            for team in teams:
+                if team.get("owner_id") not in user_ids:
+                    team["owner_id"] = None
+            db.bulk_insert_mappings(KnowledgeNamespace, teams)
+            # 新节点上不存在的用户不恢复成员关系
+            members = [
+                _dict_to_row(row, KnowledgeNamespaceMember.__table__.columns) for row in data.get("members", [])
+                if row.get("user_id") in user_ids and row.get("namespace") not in existing
+            ]
+            db.bulk_insert_mappings(KnowledgeNamespaceMember, members)
+        db.flush()
+
+        # 快照带有词法索引备份时直接恢复，否则逐批分词重建
+        restore_lexical = lexical is not None and manifest.get("lexical") and (directory / LEXICAL_FILE).exists()
+        if restore_lexical:
+            lexical.restore(str(directory / LEXICAL_FILE))
+
+        file_ids = {row["id"] for row in files}
+        embeddings = np.memmap(
+            directory / EMBEDDINGS_FILE, dtype="<f4", mode="r",
+            shape=(manifest["chunks"], manifest["dimension"] or 0)
+        )
+        centroids = {} if router is not None else None
+        rows = 0
+        for ids, documents, metadatas, vectors in _iter_chunk_batches(directory, embeddings, batch_size):
+            vectors = np.asarray(vectors, dtype=np.float32)
+            index.add(ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas)
+            if lexical is not None and not restore_lexical:
+                lexical.add(ids, documents, metadatas)
+            if near_duplicates is not None:
+                near_duplicates.add_texts(ids, documents, metadatas)
+            if molecules is not None:
+                molecules.add(ids, documents, metadatas)
+            if centroids is not None:
+                accumulate_centroids(centroids, vectors, metadatas)
+            db.bulk_insert_mappings(KnowledgeChunk, [
+                {
+                    "id": chunk_id,
+                    "file_id": metadata["file_id"],
+                    "chunk_index": metadata.get("chunk_index"),
+                    "content_hash": metadata.get("content_hash")
+                }
+                for chunk_id, metadata in zip(ids, metadatas) if metadata.get("file_id") in file_ids
+            ])
+            rows += len(ids)
+        if rows != manifest["chunks"]:
+            raise ValueError(f"chunks.jsonl 有 {rows} 行，manifest 记录为 {manifest['chunks']} 行，快照已损坏")
+        index.persist()
+        if centroids:
+            router.write(centroids)
+
+        # 计数器与 recount_stats 相同的口径：有 chunk 的文件才计入文件数
+        stats = knowledge_registry.get_stats_row(db)
+        stats.file_count = sum(1 for row in files if row.get("chunk_count"))
+        stats.total_chunks = sum(row.get("chunk_count") or 0 for row in files)
+        knowledge_registry.rebuild_namespace_stats(db)
+        knowledge_registry.bump_version(db)
+        state = knowledge_registry.get_collection_state(db)
+        state.live_vectors = index.count()
+        state.deleted_vectors = 0
+        db.commit()
+    except Exception:
+        db.rollback()
+        # 导入前目标为空，失败时清空已写入的部分，保持可以重新导入
+        index.reset()
+        if lexical is not None:
+            lexical.reset()
+        if router is not None:
+            router.index.reset()
+        if near_duplicates is not None:
+            near_duplicates.reset()
+        if molecules is not None:
+            molecules.reset()
+        raise
+    finally:
+        state = knowledge_registry.get_collection_state(db)
+        state.compaction_started_at = None
+        db.commit()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"已从快照 {directory} 导入 {rows} 个 chunk, {len(files)} 个文件, 耗时 {elapsed:.1f}s")
+    return {"snapshot": directory.name, "chunks": rows, "files": len(files), "seconds": round(elapsed, 2)}
@@ -0,0 +1,188 @@
+from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from pathlib import Path
+import json
+import sqlite3
+import threading
+from loguru import logger
+from app.core.config import settings
+from app.services.chem_identifiers import normalize_identifiers, identifier_phrase
+from app.services.text_utils import lexical_tokens
+from app.services.vector_index import match_where, split_key_filter
+
+# 按 chunk_id 删除时每条 SQL 的参数个数（SQLite 默认上限 999）
+DELETE_BATCH = 500
+
+def index_tokens(text: str) -> str:
+    """写入 FTS5 的分词结果：化学标识符整体保留（CAS 号、InChIKey 中的连字符不切分，下标数字转为普通数字），
+    中文输出单字和相邻两字，以空格连接后交给 unicode61 分词器"""
+    return " ".join(lexical_tokens(normalize_identifiers(text)))
+
+def match_expression(terms: List[str]) -> str:
+    """多个标识符按 OR 组成 FTS5 查询，每个标识符作为短语匹配"""
+    phrases = []
+    for term in terms:
+        phrase = identifier_phrase(term).replace('"', '""')
+        if phrase.strip():
+            phrases.append(f'"{phrase}"')
+    return " OR ".join(phrases)
+
+class LexicalIndex:
+    """基于 SQLite FTS5 的 chunk 倒排索引，与向量索引同时写入，用于按化学标识符精确检索
+
+    chunks 表保存原文和 metadata，chunks_fts 以相同 rowid 保存分词结果；按 chunk_id 删除时先经唯一索引
+    找到 rowid，避免扫描整个全文表。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # 多个 worker 共享同一个文件时读写互不阻塞
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                content TEXT,
+                metadata TEXT,
+                namespace TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                tokens, tokenize = "unicode61 remove_diacritics 0 tokenchars '-'"
+            );
+        """)
+        # 命名空间单独成列，检索时在 SQL 中先行过滤；早期创建的表在这里补列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        if "namespace" not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN namespace TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chunks_namespace ON chunks (namespace)")
+        self._conn.commit()
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        with self._lock, self._conn:
+            self._delete(ids)
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (chunk_id, content, metadata, namespace) VALUES (?, ?, ?, ?)",
+                    (chunk_id, document, json.dumps(metadata or {}, ensure_ascii=False), (metadata or {}).get("namespace"))
+                )
+                self._conn.execute(
+                    "INSERT INTO chunks_fts (rowid, tokens) VALUES (?, ?)",
+                    (cursor.lastrowid, index_tokens(document))
+                )
+
+    def _delete(self, ids: List[str]) -> None:
+        for i in range(0, len(ids), DELETE_BATCH):
+            batch = ids[i:i + DELETE_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = [row[0] for row in self._conn.execute(
+                f"SELECT rowid FROM chunks WHERE chunk_id IN ({placeholders})", batch
+            )]
+            if not rows:
+                continue
+            row_placeholders = ",".join("?" * len(rows))
+            self._conn.execute(f"DELETE FROM chunks_fts WHERE rowid IN ({row_placeholders})", rows)
+            self._conn.execute(f"DELETE FROM chunks WHERE rowid IN ({row_placeholders})", rows)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock, self._conn:
+            self._delete(ids)
+
+    def reset(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks_fts")
+            self._conn.execute("DELETE FROM chunks")
+
+    def backup(self, path: str) -> None:
+        """用 SQLite 在线备份把整个索引（含 FTS5 分词结果）复制到 path，导入时不必重新分词"""
+        with self._lock:
+            target = sqlite3.connect(path)
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+
+    def restore(self, path: str) -> None:
+        """用 backup() 生成的文件整体替换当前索引内容"""
+        with self._lock:
+            source = sqlite3.connect(path)
+            try:
+                source.backup(self._conn)
+            finally:
+                source.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, terms: List[str], k: int, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """按 BM25 返回包含任一标识符的片段；score 为相对最佳结果的 BM25 比值（0~1，越大越相关）"""
+        expression = match_expression(terms)
+        if not expression or k <= 0:
+            return []
+
+        # 命名空间条件在 SQL 中过滤；其余条件多取一些后在 Python 中按 metadata 过滤
+        namespaces, where = split_key_filter(where, "namespace")
+        if namespaces is not None and not namespaces:
+            return []
+        namespace_clause = ""
+        params: List[Any] = [expression]
+        if namespaces is not None:
+            namespace_clause = f"AND c.namespace IN ({','.join('?' * len(namespaces))})"
+            params.extend(namespaces)
+        params.append(k * 4 if where else k)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT c.chunk_id, c.content, c.metadata, bm25(chunks_fts) AS rank
+                FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid
+                WHERE chunks_fts MATCH ? {namespace_clause}
+                ORDER BY rank LIMIT ?
+                """,
+                params
+            ).fetchall()
+
+        results = []
+        for chunk_id, content, metadata, rank in rows:
+            metadata = json.loads(metadata) if metadata else {}
+            if not match_where(metadata, where):
+                continue
+            results.append({"id": chunk_id, "content": content, "metadata": metadata, "bm25": -rank, "match": "lexical"})
+            if len(results) >= k:
+                break
+
+        # FTS5 的 bm25() 越小越相关，这里取相反数后按最佳结果归一化
+        best = max((r["bm25"] for r in results), default=0.0)
+        for result in results:
+            result["score"] = result["bm25"] / best if best > 0 else 1.0
+        return results
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """倒数排名融合：每个结果在各列表中的得分为 1 / (k + 名次) 之和，与各列表原始得分的量纲无关"""
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            entry = fused.setdefault(result["id"], {**result, "fusion_score": 0.0})
+            entry["fusion_score"] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda r: r["fusion_score"], reverse=True)
+
+def fts5_available() -> bool:
+    try:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+@lru_cache(maxsize=1)
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """进程内共享的词法索引；未启用或 SQLite 未编译 FTS5 时返回 None"""
+    if not settings.LEXICAL_INDEX_ENABLED:
+        return None
+    if not fts5_available():
+        logger.warning("SQLite 不支持 FTS5，词法索引不可用")
+        return None
+    return LexicalIndex(settings.LEXICAL_INDEX_PATH)
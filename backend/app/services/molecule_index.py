@@ -0,0 +1,326 @@
+from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+from pathlib import Path
+import sqlite3
+import threading
+import numpy as np
+from loguru import logger
+from app.core.config import settings
+from app.services.chem_identifiers import COMMON_NAMES, COMMON_NAME_ALIASES, COMMON_CAS, detect_identifiers, smiles_candidates
+from app.services.vector_index import split_key_filter
+
+try:
+    from rdkit import Chem, DataStructs, RDLogger
+    from rdkit.Chem import rdFingerprintGenerator
+except ImportError:
+    Chem = None
+
+# 指纹位数和 Morgan 半径；修改后需运行 scripts/build_molecule_index.py 重建
+FINGERPRINT_BITS = 2048
+MORGAN_RADIUS = 2
+# 正文中的 SMILES 至少含这么多重原子才登记（排除单个原子、离子等误识别）
+MIN_SMILES_HEAVY_ATOMS = 2
+# 子结构检索时做 RDKit 精确匹配的候选上限（按与查询的相似度排序后截取）
+MAX_SUBSTRUCTURE_CANDIDATES = 2000
+# 每条 SQL 的参数个数上限（SQLite 默认 999）
+SQL_BATCH = 500
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+def popcount_rows(packed: np.ndarray) -> np.ndarray:
+    """按行统计打包指纹（uint8）中置位的个数"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed.view(np.uint64)).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[packed].sum(axis=1, dtype=np.int32)
+
+def rdkit_available() -> bool:
+    return Chem is not None
+
+@lru_cache(maxsize=1)
+def _morgan_generator():
+    return rdFingerprintGenerator.GetMorganGenerator(radius=MORGAN_RADIUS, fpSize=FINGERPRINT_BITS)
+
+def morgan_fingerprint(mol) -> np.ndarray:
+    """打包后的 Morgan 指纹（FINGERPRINT_BITS / 8 字节），用于 Tanimoto 相似度"""
+    return np.packbits(_morgan_generator().GetFingerprintAsNumPy(mol).astype(bool))
+
+def pattern_fingerprint(mol) -> np.ndarray:
+    """打包后的 RDKit Pattern 指纹，用于子结构预筛：子结构的置位一定是超结构置位的子集
+
+    Morgan 指纹在原子环境边界处不满足这一性质，不能用来做子结构预筛。
+    """
+    bits = np.zeros((FINGERPRINT_BITS,), dtype=np.uint8)
+    DataStructs.ConvertToNumpyArray(Chem.PatternFingerprint(mol, fpSize=FINGERPRINT_BITS), bits)
+    return np.packbits(bits.astype(bool))
+
+def parse_smiles(smiles: str):
+    """解析 SMILES，失败返回 None（不输出 RDKit 错误日志）"""
+    RDLogger.DisableLog("rdApp.*")
+    try:
+        return Chem.MolFromSmiles(smiles)
+    finally:
+        RDLogger.EnableLog("rdApp.*")
+
+def resolve_query(text: str):
+    """把查询解析为分子：先查本地名称表和 CAS 表，再按 SMILES 解析（不访问网络）"""
+    text = (text or "").strip()
+    if not text:
+        return None
+    key = text.lower()
+    key = COMMON_NAME_ALIASES.get(key, COMMON_CAS.get(key, key))
+    if key in COMMON_NAMES:
+        return parse_smiles(COMMON_NAMES[key])
+    return parse_smiles(text)
+
+def canonical_smiles(mol) -> str:
+    return Chem.MolToSmiles(mol)
+
+def extract_molecules(text: str) -> List[Dict[str, Any]]:
+    """识别文本中提到的分子：SMILES、本地名称表中的化合物名和 CAS 号，返回按规范 SMILES 去重的
+    [{"smiles": 规范 SMILES, "mol": RDKit 分子, "source": smiles|name|cas, "text": 原文写法}]"""
+    found: Dict[str, Dict[str, Any]] = {}
+
+    def add(mol, source: str, surface: str):
+        if mol is None:
+            return
+        smiles = canonical_smiles(mol)
+        if smiles and smiles not in found:
+            found[smiles] = {"smiles": smiles, "mol": mol, "source": source, "text": surface}
+
+    for identifier in detect_identifiers(text):
+        if identifier["type"] == "name":
+            name = COMMON_NAME_ALIASES.get(identifier["value"], identifier["value"])
+            if name in COMMON_NAMES:
+                add(parse_smiles(COMMON_NAMES[name]), "name", identifier["value"])
+        elif identifier["type"] == "cas" and identifier["value"] in COMMON_CAS:
+            add(parse_smiles(COMMON_NAMES[COMMON_CAS[identifier["value"]]]), "cas", identifier["value"])
+    for candidate in smiles_candidates(text):
+        mol = parse_smiles(candidate)
+        if mol is not None and mol.GetNumHeavyAtoms() >= MIN_SMILES_HEAVY_ATOMS:
+            add(mol, "smiles", candidate)
+    return list(found.values())
+
+class MoleculeIndex:
+    """分子 -> chunk 索引（SQLite），与向量索引同时写入，用于按结构检索文献片段
+
+    molecules 表按规范 SMILES 保存每个分子及其打包的 Morgan 指纹和 Pattern 指纹，mentions 表记录提到该分子的
+    chunk。检索时把全部指纹载入内存矩阵，Tanimoto 相似度和子结构预筛都是整矩阵的按位运算；其他 worker
+    写入后（SQLite data_version 变化）在下一次检索时重新载入。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # 多个 worker 共享同一个文件时读写互不阻塞
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS molecules (
+                id INTEGER PRIMARY KEY,
+                smiles TEXT NOT NULL UNIQUE,
+                inchikey TEXT,
+                heavy_atoms INTEGER,
+                morgan BLOB NOT NULL,
+                pattern BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_molecules_inchikey ON molecules (inchikey);
+            CREATE TABLE IF NOT EXISTS mentions (
+                molecule_id INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL,
+                file_id INTEGER,
+                namespace TEXT,
+                source TEXT,
+                text TEXT,
+                PRIMARY KEY (molecule_id, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS ix_mentions_chunk_id ON mentions (chunk_id);
+        """)
+        self._conn.commit()
+        # 内存中的指纹矩阵及其对应的数据库版本
+        self._loaded_version = None
+        self._ids = np.zeros((0,), dtype=np.int64)
+        self._smiles: List[str] = []
+        self._morgan = np.zeros((0, FINGERPRINT_BITS // 8), dtype=np.uint8)
+        self._morgan_bits = np.zeros((0,), dtype=np.int32)
+        self._pattern = np.zeros((0, FINGERPRINT_BITS // 8), dtype=np.uint8)
+        self._mols: Dict[int, Any] = {}
+
+    def _data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _molecule_id(self, molecule: Dict[str, Any]) -> int:
+        row = self._conn.execute("SELECT id FROM molecules WHERE smiles = ?", (molecule["smiles"],)).fetchone()
+        if row:
+            return row[0]
+        mol = molecule["mol"]
+        try:
+            inchikey = Chem.MolToInchiKey(mol) or None
+        except Exception:
+            inchikey = None
+        cursor = self._conn.execute(
+            "INSERT INTO molecules (smiles, inchikey, heavy_atoms, morgan, pattern) VALUES (?, ?, ?, ?, ?)",
+            (
+                molecule["smiles"], inchikey, mol.GetNumHeavyAtoms(),
+                morgan_fingerprint(mol).tobytes(), pattern_fingerprint(mol).tobytes()
+            )
+        )
+        return cursor.lastrowid
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        """识别片段中提到的分子并登记，返回登记的提及数"""
+        extracted = [extract_molecules(document or "") for document in documents]
+        mentions = 0
+        with self._lock, self._conn:
+            self._delete(ids)
+            for chunk_id, metadata, molecules in zip(ids, metadatas, extracted):
+                metadata = metadata or {}
+                for molecule in molecules:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO mentions (molecule_id, chunk_id, file_id, namespace, source, text) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            self._molecule_id(molecule), chunk_id, metadata.get("file_id"),
+                            metadata.get("namespace"), molecule["source"], molecule["text"]
+                        )
+                    )
+                    mentions += 1
+            self._loaded_version = None
+        return mentions
+
+    def _delete(self, ids: List[str]) -> None:
+        for i in range(0, len(ids), SQL_BATCH):
+            batch = ids[i:i + SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            molecule_ids = [row[0] for row in self._conn.execute(
+                f"SELECT DISTINCT molecule_id FROM mentions WHERE chunk_id IN ({placeholders})", batch
+            )]
+            if not molecule_ids:
+                continue
+            self._conn.execute(f"DELETE FROM mentions WHERE chunk_id IN ({placeholders})", batch)
+            # 不再被任何片段提到的分子从指纹矩阵中移除
+            self._conn.execute(
+                f"DELETE FROM molecules WHERE id IN ({','.join('?' * len(molecule_ids))}) "
+                f"AND NOT EXISTS (SELECT 1 FROM mentions WHERE mentions.molecule_id = molecules.id)",
+                molecule_ids
+            )
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock, self._conn:
+            self._delete(ids)
+            self._loaded_version = None
+
+    def reset(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM mentions")
+            self._conn.execute("DELETE FROM molecules")
+            self._loaded_version = None
+
+    def count(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "molecules": self._conn.execute("SELECT COUNT(*) FROM molecules").fetchone()[0],
+                "mentions": self._conn.execute("SELECT COUNT(*) FROM mentions").fetchone()[0]
+            }
+
+    def _ensure_loaded(self) -> None:
+        """数据库有变化时重新载入指纹矩阵（调用方持有锁）"""
+        version = self._data_version()
+        if version == self._loaded_version:
+            return
+        rows = self._conn.execute("SELECT id, smiles, morgan, pattern FROM molecules ORDER BY id").fetchall()
+        width = FINGERPRINT_BITS // 8
+        self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self._smiles = [row[1] for row in rows]
+        self._morgan = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.uint8).reshape(len(rows), width)
+        self._pattern = np.frombuffer(b"".join(row[3] for row in rows), dtype=np.uint8).reshape(len(rows), width)
+        self._morgan_bits = popcount_rows(self._morgan)
+        # 解析后的分子按 id 缓存，子结构精确匹配时复用
+        alive = set(self._ids.tolist())
+        self._mols = {molecule_id: mol for molecule_id, mol in self._mols.items() if molecule_id in alive}
+        self._loaded_version = version
+
+    def _match_molecules(self, query, mode: str, threshold: float) -> List[Tuple[int, str, float]]:
+        """返回 [(molecule_id, smiles, 与查询的 Tanimoto 相似度)]，按相似度降序"""
+        self._ensure_loaded()
+        if not len(self._ids):
+            return []
+        query_morgan = morgan_fingerprint(query)
+        common = popcount_rows(self._morgan & query_morgan)
+        union = self._morgan_bits + int(popcount_rows(query_morgan[None, :])[0]) - common
+        similarity = np.where(union > 0, common / np.maximum(union, 1), 0.0)
+
+        if mode == "substructure":
+            # 预筛：查询的 Pattern 指纹置位必须全部出现在候选分子中，再用 RDKit 做精确子结构匹配
+            query_pattern = pattern_fingerprint(query)
+            screen = np.flatnonzero(((self._pattern & query_pattern) == query_pattern).all(axis=1))
+            screen = screen[np.argsort(-similarity[screen], kind="stable")][:MAX_SUBSTRUCTURE_CANDIDATES]
+            matches = []
+            for row in screen.tolist():
+                molecule_id = int(self._ids[row])
+                mol = self._mols.get(molecule_id)
+                if mol is None:
+                    mol = self._mols[molecule_id] = parse_smiles(self._smiles[row])
+                if mol is not None and mol.HasSubstructMatch(query):
+                    matches.append((molecule_id, self._smiles[row], float(similarity[row])))
+            return matches
+
+        rows = np.flatnonzero(similarity >= threshold)
+        rows = rows[np.argsort(-similarity[rows], kind="stable")]
+        return [(int(self._ids[row]), self._smiles[row], float(similarity[row])) for row in rows.tolist()]
+
+    def search(
+        self,
+        query,
+        k: int,
+        mode: str = "similarity",
+        threshold: float = 0.5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """按结构检索提到相似分子（或包含查询子结构的分子）的片段
+
+        返回 [{"id": chunk_id, "score": 片段中最相似分子的相似度, "molecules": [...]}]，按 score 降序，最多 k 个片段。
+        threshold 只用于相似度检索；where 只支持命名空间条件。
+        """
+        namespaces, _ = split_key_filter(where, "namespace")
+        if (namespaces is not None and not namespaces) or k <= 0:
+            return []
+        with self._lock:
+            matches = self._match_molecules(query, mode, threshold)
+            chunks: Dict[str, Dict[str, Any]] = {}
+            # 按相似度从高到低分批取提及，凑满 k 个片段即停止
+            for i in range(0, len(matches), SQL_BATCH):
+                batch = matches[i:i + SQL_BATCH]
+                scores = {molecule_id: (smiles, score) for molecule_id, smiles, score in batch}
+                params: List[Any] = list(scores)
+                namespace_clause = ""
+                if namespaces is not None:
+                    namespace_clause = f"AND namespace IN ({','.join('?' * len(namespaces))})"
+                    params.extend(namespaces)
+                rows = self._conn.execute(
+                    f"SELECT molecule_id, chunk_id, file_id, source, text FROM mentions "
+                    f"WHERE molecule_id IN ({','.join('?' * len(batch))}) {namespace_clause}",
+                    params
+                ).fetchall()
+                rows.sort(key=lambda row: -scores[row[0]][1])
+                for molecule_id, chunk_id, file_id, source, text in rows:
+                    smiles, score = scores[molecule_id]
+                    entry = chunks.get(chunk_id)
+                    if entry is None:
+                        if len(chunks) >= k:
+                            continue
+                        entry = chunks[chunk_id] = {"id": chunk_id, "file_id": file_id, "score": score, "molecules": []}
+                    entry["molecules"].append({"smiles": smiles, "similarity": round(score, 4), "source": source, "text": text})
+                if len(chunks) >= k:
+                    break
+        return sorted(chunks.values(), key=lambda c: c["score"], reverse=True)
+
+@lru_cache(maxsize=1)
+def get_molecule_index() -> Optional[MoleculeIndex]:
+    """进程内共享的分子索引；未启用或未安装 RDKit 时返回 None"""
+    if not settings.MOLECULE_INDEX_ENABLED:
+        return None
+    if not rdkit_available():
+        logger.warning("未安装 RDKit，分子结构索引不可用")
+        return None
+    return MoleculeIndex(settings.MOLECULE_INDEX_PATH)
@@ -0,0 +1,325 @@
+from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+from pathlib import Path
+import hashlib
+import re
+import sqlite3
+import threading
+import zlib
+import numpy as np
+from langchain_core.documents import Document
+from loguru import logger
+from app.core.config import settings
+from app.services.knowledge_namespaces import SHARED_NAMESPACE
+
+# 每条 SQL 的参数个数上限（SQLite 默认 999）
+SQL_BATCH = 500
+# 置换哈希 (a * x + b) mod p 的模数（梅森素数 2^61 - 1），a < 2^31、x < 2^32 时乘积不会溢出 uint64
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+# 置换参数的随机种子，写入索引元数据；同一索引内的签名必须使用相同的置换
+MINHASH_SEED = 1
+# shingle 数少于该值的短片段（标题、页眉等）不参与去重，避免误判
+MIN_SHINGLES = 10
+
+_WHITESPACE = re.compile(r"\s+")
+
+def shingles(text: str, size: int) -> List[str]:
+    """字符级 shingle：统一小写并合并空白后按固定长度滑动切分，中英文混排的文本都适用"""
+    text = _WHITESPACE.sub(" ", text.lower()).strip()
+    if len(text) < size:
+        return [text] if text else []
+    return list({text[i:i + size] for i in range(len(text) - size + 1)})
+
+def optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """选取 LSH 分段数 b 和每段行数 r（b * r <= num_perm），使阈值两侧的误报和漏报概率之和最小
+
+    相似度为 s 的两段文本至少一段完全相同的概率为 1 - (1 - s^r)^b。
+    """
+    best, best_error = (1, num_perm), float("inf")
+    below = np.linspace(0.0, threshold, 200)
+    above = np.linspace(threshold, 1.0, 200)
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positive = (1 - (1 - below ** rows) ** bands).mean() * threshold
+            false_negative = ((1 - above ** rows) ** bands).mean() * (1 - threshold)
+            error = false_positive + false_negative
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+class MinHasher:
+    """MinHash 签名：每个 shingle 先用 CRC32 映射为 32 位整数，再经 num_perm 个随机置换取最小值"""
+
+    def __init__(self, num_perm: int, shingle_size: int, seed: int = MINHASH_SEED):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """计算文本的签名（uint32，长度 num_perm）；shingle 太少时返回 None"""
+        items = shingles(text, self.shingle_size)
+        if len(items) < MIN_SHINGLES:
+            return None
+        hashes = np.fromiter((zlib.crc32(item.encode("utf-8")) for item in items), dtype=np.uint64, count=len(items))
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """由两个签名估计 Jaccard 相似度"""
+    return float(np.mean(a == b))
+
+class NearDuplicateIndex:
+    """基于 MinHash LSH 的近重复 chunk 索引（SQLite），覆盖整个知识库，与向量索引同时写入
+
+    signatures 表保存每个已入库 chunk 的签名，bands 表保存签名各段的哈希（同一段哈希相同的 chunk 为候选）；
+    候选再按完整签名估计 Jaccard 相似度，超过阈值才视为重复。入库时被跳过的片段记录在 duplicates 表，
+    被引用的 chunk 删除后这些记录标记为 orphaned，由 knowledge_ingest.restore_near_duplicates 重建所在文件。
+    签名参数（置换数、shingle 长度、分段方式）写入 meta 表，已有签名时沿用原参数，修改配置后运行
+    scripts/build_near_duplicate_index.py 重建。
+    """
+
+    def __init__(self, path: str, threshold: float, num_perm: int, shingle_size: int):
+        self.path = path
+        self.threshold = threshold
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # 多个 worker 共享同一个文件时读写互不阻塞
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                chunk_id TEXT PRIMARY KEY,
+                file_id INTEGER,
+                namespace TEXT,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                key INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_bands_key ON bands (key);
+            CREATE INDEX IF NOT EXISTS ix_bands_chunk_id ON bands (chunk_id);
+            CREATE TABLE IF NOT EXISTS duplicates (
+                file_id INTEGER NOT NULL,
+                chunk_index INTEGER,
+                duplicate_of TEXT NOT NULL,
+                similarity REAL,
+                orphaned INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS ix_duplicates_file_id ON duplicates (file_id);
+            CREATE INDEX IF NOT EXISTS ix_duplicates_duplicate_of ON duplicates (duplicate_of);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._conn.commit()
+        self._configure(num_perm, shingle_size)
+
+    def _configure(self, num_perm: int, shingle_size: int) -> None:
+        """读取索引已使用的签名参数；空索引按配置（重新）写入"""
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        has_signatures = self._conn.execute("SELECT 1 FROM signatures LIMIT 1").fetchone() is not None
+        if has_signatures and meta:
+            params = (int(meta["num_perm"]), int(meta["shingle_size"]), int(meta["bands"]), int(meta["rows"]), int(meta["seed"]))
+            if params[:2] != (num_perm, shingle_size):
+                logger.warning(
+                    f"近重复索引使用 num_perm={params[0]}, shingle={params[1]}，与配置不一致，"
+                    f"继续沿用；运行 scripts/build_near_duplicate_index.py 按新配置重建"
+                )
+        else:
+            bands, rows = optimal_bands(self.threshold, num_perm)
+            params = (num_perm, shingle_size, bands, rows, MINHASH_SEED)
+            with self._conn:
+                self._conn.execute("DELETE FROM meta")
+                self._conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", zip(
+                    ("num_perm", "shingle_size", "bands", "rows", "seed"), map(str, params)
+                ))
+        num_perm, shingle_size, self.bands, self.rows, seed = params
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+
+    def band_keys(self, signature: np.ndarray) -> List[int]:
+        """签名每段的哈希（段号参与哈希，不同段的相同取值不会碰撞），取 64 位有符号整数存入 SQLite"""
+        keys = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(
+                band.to_bytes(2, "big") + signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                digest_size=8
+            ).digest()
+            keys.append(int.from_bytes(digest, "big", signed=True))
+        return keys
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        return self.hasher.signature(text)
+
+    def _candidates(self, keys: List[int], namespaces: List[str], exclude_file_id: Optional[int]):
+        placeholders = ",".join("?" * len(keys))
+        namespace_placeholders = ",".join("?" * len(namespaces))
+        params: List[Any] = keys + namespaces
+        exclude_clause = ""
+        if exclude_file_id is not None:
+            exclude_clause = "AND (s.file_id IS NULL OR s.file_id != ?)"
+            params.append(exclude_file_id)
+        return self._conn.execute(
+            f"""
+            SELECT DISTINCT s.chunk_id, s.signature
+            FROM bands b JOIN signatures s ON s.chunk_id = b.chunk_id
+            WHERE b.key IN ({placeholders}) AND s.namespace IN ({namespace_placeholders}) {exclude_clause}
+            """,
+            params
+        ).fetchall()
+
+    def filter_chunks(self, chunks: List[Document]) -> Tuple[List[Document], Dict[str, np.ndarray], List[Dict[str, Any]]]:
+        """找出与已入库片段（或本批中靠前的片段）近重复的片段
+
+        返回 (保留的片段, 保留片段的签名, 跳过的片段记录)。新片段只与同一命名空间和 shared 中的片段比较：
+        shared 对所有用户可见，跳过后不会让任何有权访问新片段的用户丢失内容。已入库片段中与新片段属于
+        同一文件的不参与比较，重建文件索引时旧 chunk 尚未删除，不能把新 chunk 判为它们的重复。
+        """
+        kept, signatures, duplicates = [], {}, []
+        # 本批已保留片段的分段哈希 -> [(chunk_id, 命名空间, 签名)]
+        batch_buckets: Dict[int, List[Tuple[str, str, np.ndarray]]] = {}
+        with self._lock:
+            for chunk in chunks:
+                chunk_id = chunk.metadata["chunk_id"]
+                signature = self.signature(chunk.page_content)
+                if signature is None:
+                    kept.append(chunk)
+                    continue
+                namespace = chunk.metadata.get("namespace") or SHARED_NAMESPACE
+                namespaces = sorted({namespace, SHARED_NAMESPACE})
+                keys = self.band_keys(signature)
+
+                best_id, best_similarity = None, 0.0
+                candidates = self._candidates(keys, namespaces, chunk.metadata.get("file_id"))
+                candidates += [
+                    (other_id, other_signature)
+                    for key in keys for other_id, other_namespace, other_signature in batch_buckets.get(key, [])
+                    if other_namespace in namespaces
+                ]
+                for other_id, other_signature in candidates:
+                    if isinstance(other_signature, bytes):
+                        other_signature = np.frombuffer(other_signature, dtype=np.uint32)
+                    similarity = jaccard(signature, other_signature)
+                    if similarity > best_similarity:
+                        best_id, best_similarity = other_id, similarity
+
+                if best_id is not None and best_similarity >= self.threshold:
+                    duplicates.append({
+                        "chunk_id": chunk_id,
+                        "file_id": chunk.metadata.get("file_id"),
+                        "chunk_index": chunk.metadata.get("chunk_index"),
+                        "duplicate_of": best_id,
+                        "similarity": best_similarity
+                    })
+                    continue
+                kept.append(chunk)
+                signatures[chunk_id] = signature
+                for key in keys:
+                    batch_buckets.setdefault(key, []).append((chunk_id, namespace, signature))
+        return kept, signatures, duplicates
+
+    def add(self, ids: List[str], metadatas: List[Dict[str, Any]], signatures: Dict[str, np.ndarray]) -> None:
+        """登记已写入向量库的 chunk 的签名（没有签名的短片段忽略）"""
+        with self._lock, self._conn:
+            self._delete(ids)
+            for chunk_id, metadata in zip(ids, metadatas):
+                signature = signatures.get(chunk_id)
+                if signature is None:
+                    continue
+                self._conn.execute(
+                    "INSERT INTO signatures (chunk_id, file_id, namespace, signature) VALUES (?, ?, ?, ?)",
+                    (chunk_id, metadata.get("file_id"), metadata.get("namespace") or SHARED_NAMESPACE, signature.tobytes())
+                )
+                self._conn.executemany(
+                    "INSERT INTO bands (key, chunk_id) VALUES (?, ?)",
+                    [(key, chunk_id) for key in self.band_keys(signature)]
+                )
+
+    def add_texts(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """计算签名并登记（重建索引、导入快照时使用，不做去重判断）"""
+        signatures = {}
+        for chunk_id, document in zip(ids, documents):
+            signature = self.signature(document)
+            if signature is not None:
+                signatures[chunk_id] = signature
+        self.add(ids, metadatas, signatures)
+
+    def record_duplicates(self, file_ids: List[int], duplicates: List[Dict[str, Any]]) -> None:
+        """记录文件入库时跳过的片段（先清除这些文件之前的记录）"""
+        with self._lock, self._conn:
+            self._forget_files(file_ids)
+            self._conn.executemany(
+                "INSERT INTO duplicates (file_id, chunk_index, duplicate_of, similarity) VALUES (?, ?, ?, ?)",
+                [
+                    (d["file_id"], d["chunk_index"], d["duplicate_of"], d["similarity"])
+                    for d in duplicates if d.get("file_id") is not None
+                ]
+            )
+
+    def _forget_files(self, file_ids: List[int]) -> None:
+        file_ids = [file_id for file_id in file_ids if file_id is not None]
+        for i in range(0, len(file_ids), SQL_BATCH):
+            batch = file_ids[i:i + SQL_BATCH]
+            self._conn.execute(f"DELETE FROM duplicates WHERE file_id IN ({','.join('?' * len(batch))})", batch)
+
+    def forget_files(self, file_ids: List[int]) -> None:
+        """删除文件的跳过记录（文件删除后调用）"""
+        with self._lock, self._conn:
+            self._forget_files(file_ids)
+
+    def _delete(self, ids: List[str]) -> None:
+        for i in range(0, len(ids), SQL_BATCH):
+            batch = ids[i:i + SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM bands WHERE chunk_id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM signatures WHERE chunk_id IN ({placeholders})", batch)
+
+    def delete(self, ids: List[str]) -> None:
+        """删除 chunk 的签名，并把以这些 chunk 为依据跳过的记录标记为 orphaned"""
+        with self._lock, self._conn:
+            self._delete(ids)
+            for i in range(0, len(ids), SQL_BATCH):
+                batch = ids[i:i + SQL_BATCH]
+                self._conn.execute(
+                    f"UPDATE duplicates SET orphaned = 1 WHERE duplicate_of IN ({','.join('?' * len(batch))})", batch
+                )
+
+    def orphaned_files(self) -> List[int]:
+        """被跳过的片段所依据的 chunk 已删除、需要重建索引的文件"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT file_id FROM duplicates WHERE orphaned = 1")]
+
+    def reset(self, num_perm: Optional[int] = None, shingle_size: Optional[int] = None, keep_duplicates: bool = False) -> None:
+        """清空索引；指定参数时按新参数重新配置签名，keep_duplicates 时保留跳过记录（只重建签名）"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM bands")
+                self._conn.execute("DELETE FROM signatures")
+                if not keep_duplicates:
+                    self._conn.execute("DELETE FROM duplicates")
+            if num_perm is not None:
+                self._configure(num_perm, shingle_size or self.hasher.shingle_size)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def duplicate_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM duplicates").fetchone()[0]
+
+@lru_cache(maxsize=1)
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """进程内共享的近重复索引；未启用时返回 None"""
+    if not settings.NEAR_DUPLICATE_ENABLED:
+        return None
+    return NearDuplicateIndex(
+        settings.NEAR_DUPLICATE_INDEX_PATH,
+        threshold=settings.NEAR_DUPLICATE_THRESHOLD,
+        num_perm=settings.NEAR_DUPLICATE_NUM_PERM,
+        shingle_size=settings.NEAR_DUPLICATE_SHINGLE_SIZE
+    )
@@ -1,24 +1,48 @@
-from typing import List, Dict, Any, Optional
-import os
+from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+import time
+import uuid
+import hashlib
 import asyncio
 from pathlib import Path
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, DirectoryLoader
 from langchain_core.documents import Document
 from app.core.config import settings
+from app.services.vector_index import VectorIndex, create_vector_index
+from app.services.reranker import rerank
+from app.services.context_processor import process_context
+from app.db.base import SessionLocal
+from app.services import embedding_collections
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.lexical_index import LexicalIndex, get_lexical_index, reciprocal_rank_fusion
+from app.services.near_duplicates import NearDuplicateIndex, get_near_duplicate_index
+from app.services.molecule_index import MoleculeIndex, get_molecule_index
+from app.services.chem_identifiers import detect_identifiers
+from app.services.document_router import DocumentRouter, accumulate_centroids
 from loguru import logger
-import chromadb
-from chromadb.config import Settings as ChromaSettings
+
+# v1 集合名；实际使用的集合由 embedding_collections 中生效的版本决定
+COLLECTION_NAME = embedding_collections.BASE_COLLECTION_NAME
+# 向量库初始化失败（例如 Chroma 服务尚未就绪）后的重试间隔（秒）
+INDEX_RETRY_INTERVAL = 10
 
 class RAGService:
     """RAG (Retrieval-Augmented Generation) 服务"""
     
     def __init__(self):
         self.embeddings = None
-        self.vectorstore = None
+        self.batcher: Optional[EmbeddingBatcher] = None
+        self.index: Optional[VectorIndex] = None
+        self.lexical: Optional[LexicalIndex] = None
+        self.near_duplicates: Optional[NearDuplicateIndex] = None
+        self.molecules: Optional[MoleculeIndex] = None
+        self.router: Optional[DocumentRouter] = None
+        # 当前使用的嵌入集合（embedding_collections.describe 的结果），模型与集合始终成对切换
+        self.collection: Optional[Dict[str, Any]] = None
         self.text_splitter = None
+        self._last_init_attempt = time.monotonic()
+        self._last_collection_check = time.monotonic()
         self._initialize()
     
     def _initialize(self):
@@ -31,43 +55,43 @@ class RAGService:
                 chunk_size=settings.CHUNK_SIZE,
                 chunk_overlap=settings.CHUNK_OVERLAP,
                 length_function=len,
+                add_start_index=True,
                 separators=["\n\n", "\n", "。", "！", "？", ";", ":", "，", " ", ""]
             )
             
-            # 初始化嵌入模型
-            # 优先尝试使用 SiliconFlow API，如果配置了 API Key
-            silicon_key = getattr(settings, 'SILICONFLOW_API_KEY', '') or os.getenv('SILICONFLOW_API_KEY')
-            
-            if silicon_key:
-                try:
-                    from app.services.embeddings import SiliconFlowEmbeddings
-                    # 获取配置的模型名称，默认为 BGE-M3
-                    embedding_model = getattr(settings, 'SILICONFLOW_EMBEDDING_MODEL', 'BAAI/bge-m3')
-                    logger.info(f"使用 SiliconFlow 嵌入模型: {embedding_model}")
-                    
-                    self.embeddings = SiliconFlowEmbeddings(
-                        api_key=silicon_key,
-                        model=embedding_model,
-                        base_url=getattr(settings, 'SILICONFLOW_API_BASE', 'https://api.siliconflow.cn/v1')
-                    )
-                except Exception as e:
-                    logger.warning(f"SiliconFlow 嵌入模型初始化失败，回退到本地模型: {e}")
-                    self.embeddings = HuggingFaceEmbeddings(
-                        model_name=settings.EMBEDDING_MODEL,
-                        model_kwargs={'device': 'cpu'},
-                        encode_kwargs={'normalize_embeddings': True}
-                    )
-            else:
-                logger.info("使用本地 HuggingFace 嵌入模型...")
-                self.embeddings = HuggingFaceEmbeddings(
-                    model_name=settings.EMBEDDING_MODEL,
-                    model_kwargs={'device': 'cpu'},
-                    encode_kwargs={'normalize_embeddings': True}
+            # 嵌入模型由当前生效的集合决定（而不是直接读配置）：修改模型配置后，
+            # 查询继续使用旧模型和旧集合，直到迁移任务建好新集合并切换
+            self.collection = self._load_active_collection()
+            configured = embedding_collections.configured_spec()
+            if not embedding_collections.same_model(configured, self.collection):
+                logger.warning(
+                    f"配置的嵌入模型 {embedding_collections.format_spec(configured)} 与当前集合 "
+                    f"{self.collection['name']} 的模型 {embedding_collections.format_spec(self.collection)} 不一致，"
+                    f"继续使用当前集合；请运行 scripts/migrate_embeddings.py start 迁移"
                 )
+            self._set_embeddings(embedding_collections.create_embeddings(self.collection))
             
             # 初始化向量数据库
             self._initialize_vectorstore()
             
+            # 化学标识符词法索引，初始化失败不影响向量检索
+            try:
+                self.lexical = get_lexical_index()
+            except Exception as e:
+                logger.warning(f"词法索引初始化失败: {str(e)}")
+            
+            # 近重复片段索引，初始化失败时不去重
+            try:
+                self.near_duplicates = get_near_duplicate_index()
+            except Exception as e:
+                logger.warning(f"近重复索引初始化失败: {str(e)}")
+            
+            # 分子结构索引，初始化失败不影响文本检索
+            try:
+                self.molecules = get_molecule_index()
+            except Exception as e:
+                logger.warning(f"分子结构索引初始化失败: {str(e)}")
+            
             logger.info("RAG服务初始化完成")
             
         except Exception as e:
@@ -76,39 +100,125 @@ class RAGService:
             # 我们允许 RAG 服务降级运行（即没有向量库功能）
             # raise 
     
-    def _initialize_vectorstore(self):
-        """初始化向量数据库"""
+    def _load_active_collection(self) -> Dict[str, Any]:
+        """读取当前生效的嵌入集合；数据库不可用时按配置使用 v1 集合"""
         try:
-            # 确保向量数据库目录存在
-            os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
-            
-            # 配置Chroma客户端
-            chroma_client = chromadb.PersistentClient(
-                path=settings.VECTOR_DB_PATH,
-                settings=ChromaSettings(
-                    anonymized_telemetry=False,
-                    allow_reset=True
-                )
+            db = SessionLocal()
+            try:
+                return embedding_collections.describe(embedding_collections.get_active(db))
+            finally:
+                db.close()
+        except Exception as e:
+            logger.warning(f"读取嵌入集合记录失败，按配置使用 v1 集合: {str(e)}")
+            name, documents_name = embedding_collections.collection_names(1)
+            return {"name": name, "documents_name": documents_name, "version": 1, **embedding_collections.configured_spec()}
+    
+    def _set_embeddings(self, embeddings) -> None:
+        """替换嵌入模型；本地模型在 CPU 上推理，合并并发查询做批量前向推理"""
+        logger.info(f"使用嵌入模型: {embedding_collections.format_spec(self.collection)}")
+        self.embeddings = embeddings
+        if not settings.EMBEDDING_BATCH_ENABLED or self.collection["provider"] != embedding_collections.PROVIDER_LOCAL:
+            self.batcher = None
+        elif self.batcher is not None:
+            # 已在合批中的查询仍由旧模型完成，之后的批次使用新模型
+            self.batcher.embeddings = embeddings
+        else:
+            self.batcher = EmbeddingBatcher(
+                embeddings,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS
             )
-            
-            # 初始化向量存储
+            logger.info(
+                f"启用查询嵌入微批处理: 批大小 {settings.EMBEDDING_BATCH_MAX_SIZE}, "
+                f"最长等待 {settings.EMBEDDING_BATCH_MAX_WAIT_MS}ms"
+            )
+    
+    def _open_collection(self, collection: Dict[str, Any]):
+        """打开嵌入集合对应的 chunk 索引和文件质心索引"""
+        tags = embedding_collections.collection_tags(collection)
+        index = create_vector_index(collection["name"], tags=tags)
+        router = None
+        if settings.DOCUMENT_ROUTING_ENABLED:
             try:
-                self.vectorstore = Chroma(
-                    client=chroma_client,
-                    collection_name="chemistry_knowledge",
-                    embedding_function=self.embeddings
-                )
-                logger.info(f"向量数据库初始化完成，路径: {settings.VECTOR_DB_PATH}")
+                router = DocumentRouter(create_vector_index(collection["documents_name"], tags=tags))
             except Exception as e:
-                logger.error(f"ChromaDB 初始化失败: {e}")
-                # 尝试重置或重建
-                logger.warning("尝试重建 ChromaDB 客户端...")
-                # 这里可以添加重建逻辑，或者只是记录错误
-                raise e
-            
+                logger.warning(f"文件质心索引初始化失败，使用全量检索: {str(e)}")
+        return index, router
+    
+    def _initialize_vectorstore(self):
+        """初始化向量数据库"""
+        try:
+            self.index, self.router = self._open_collection(self.collection)
+            logger.info(f"向量数据库初始化完成，后端: {self.index.backend}，集合: {self.index.collection_name}")
         except Exception as e:
             logger.error(f"向量数据库初始化失败: {str(e)}")
             raise
+        
+        if not self.collection.get("dimension"):
+            dimension = self.index.get_dimension()
+            if dimension:
+                try:
+                    embedding_collections.record_dimension(self.collection["name"], dimension)
+                    self.collection["dimension"] = dimension
+                except Exception as e:
+                    logger.warning(f"记录集合维度失败: {str(e)}")
+    
+    def switch_collection(
+        self,
+        collection: Dict[str, Any],
+        embeddings=None,
+        index: Optional[VectorIndex] = None,
+        router: Optional[DocumentRouter] = None
+    ) -> None:
+        """切换到新的嵌入集合：先创建模型和索引，再一起替换引用，进行中的请求继续使用旧对象完成
+
+        同一进程内的迁移任务传入它已打开的模型和索引，文件型后端不能对同一目录打开两个索引对象。
+        """
+        if embeddings is None:
+            embeddings = embedding_collections.create_embeddings(collection)
+        if index is None:
+            index, router = self._open_collection(collection)
+        previous = self.collection["name"] if self.collection else None
+        self.collection = collection
+        self.index, self.router = index, router
+        self._set_embeddings(embeddings)
+        logger.info(f"嵌入集合已切换: {previous} -> {collection['name']} (v{collection['version']})")
+    
+    def sync_active_collection(self, force: bool = False) -> None:
+        """按 EMBEDDING_COLLECTION_REFRESH_SECONDS 检查生效集合，迁移任务（可能在其他进程）切换后跟随切换"""
+        now = time.monotonic()
+        if not force and now - self._last_collection_check < settings.EMBEDDING_COLLECTION_REFRESH_SECONDS:
+            return
+        self._last_collection_check = now
+        if self.collection is None or self.embeddings is None:
+            return
+        active = self._load_active_collection()
+        if active["name"] == self.collection["name"]:
+            return
+        try:
+            self.switch_collection(active)
+        except Exception as e:
+            logger.error(f"切换到嵌入集合 {active['name']} 失败，继续使用 {self.collection['name']}: {str(e)}")
+    
+    def _ensure_index(self) -> Optional[VectorIndex]:
+        """向量库不可用时按间隔重新连接，避免共享实例因启动顺序问题永久降级"""
+        if self.index is None and self.embeddings is not None:
+            now = time.monotonic()
+            if now - self._last_init_attempt >= INDEX_RETRY_INTERVAL:
+                self._last_init_attempt = now
+                try:
+                    self._initialize_vectorstore()
+                except Exception:
+                    pass
+        elif self.index is not None:
+            self.sync_active_collection()
+        return self.index
+    
+    def health(self) -> Dict[str, Any]:
+        """向量库健康检查"""
+        if self._ensure_index() is None:
+            return {"status": "unavailable", "backend": settings.VECTOR_BACKEND}
+        return self.index.health()
     
     async def load_documents_from_directory(self, directory_path: str) -> List[Document]:
         """从目录加载文档"""
@@ -166,10 +276,16 @@ class RAGService:
     async def clear_database(self) -> bool:
         """清空向量数据库"""
         try:
-            if self.vectorstore:
-                # 删除集合并重新初始化
-                self.vectorstore.delete_collection()
-                self._initialize_vectorstore()
+            if self._ensure_index() is not None:
+                await asyncio.get_event_loop().run_in_executor(None, self.index.reset)
+                if self.lexical is not None:
+                    await asyncio.get_event_loop().run_in_executor(None, self.lexical.reset)
+                if self.router is not None:
+                    await asyncio.get_event_loop().run_in_executor(None, self.router.index.reset)
+                if self.near_duplicates is not None:
+                    await asyncio.get_event_loop().run_in_executor(None, self.near_duplicates.reset)
+                if self.molecules is not None:
+                    await asyncio.get_event_loop().run_in_executor(None, self.molecules.reset)
                 logger.info("向量数据库已清空")
                 return True
             return False
@@ -177,41 +293,75 @@ class RAGService:
             logger.error(f"清空数据库失败: {str(e)}")
             return False
 
-    async def get_database_stats(self) -> Dict[str, Any]:
-        """获取数据库统计信息"""
-        try:
-            if not self.vectorstore:
-                return {"count": 0, "files": []}
-            
-            # 获取所有数据
-            data = self.vectorstore.get()
-            metadatas = data.get("metadatas", [])
-            
-            files = {}
-            for meta in metadatas:
-                if meta and "file_name" in meta:
-                    fname = meta["file_name"]
-                    if fname not in files:
-                        files[fname] = {"count": 0, "source": meta.get("source")}
-                    files[fname]["count"] += 1
-            
-            file_list = [{"name": k, "chunks": v["count"], "path": v["source"]} for k, v in files.items()]
-            
-            return {
-                "total_chunks": len(metadatas),
-                "file_count": len(files),
-                "files": file_list
-            }
-        except Exception as e:
-            logger.error(f"获取数据库统计失败: {str(e)}")
-            return {"error": str(e)}
+    def iter_chunk_metadata(self, batch_size: int = 1000):
+        """分页遍历向量库中的 chunk ID 和 metadata（用于统计校准，耗时与语料规模线性相关）"""
+        if self.index is None:
+            return
+        
+        for batch in self.index.iter_batches(batch_size):
+            yield batch["ids"], batch["metadatas"]
+    
+    @staticmethod
+    def _clean_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """向量库 metadata 只保留标量值"""
+        return {
+            key: value for key, value in metadata.items()
+            if isinstance(value, (str, int, float, bool))
+        }
+    
+    def _add_batch(
+        self,
+        chunks: List[Document],
+        centroids: Optional[Dict[Any, Dict[str, Any]]] = None,
+        signatures: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """嵌入一批片段并写入向量索引，同时把向量按文件累加到 centroids，登记片段的 MinHash 签名"""
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = self.embeddings.embed_documents(texts)
+        if len(vectors) != len(texts):
+            raise RuntimeError(f"嵌入模型返回 {len(vectors)} 个向量，期望 {len(texts)} 个")
+        if vectors:
+            self.index.check_dimension(len(vectors[0]))
+        ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+        metadatas = [self._clean_metadata(chunk.metadata) for chunk in chunks]
+        self.index.add(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+        if self.lexical is not None:
+            # 词法索引只是加速路径，写入失败时记录日志，可用 scripts/build_lexical_index.py 重建
+            try:
+                self.lexical.add(ids, texts, metadatas)
+            except Exception as e:
+                logger.error(f"写入词法索引失败: {str(e)}")
+        if self.molecules is not None:
+            # 分子索引同样只是附加检索路径，可用 scripts/build_molecule_index.py 重建
+            try:
+                self.molecules.add(ids, texts, metadatas)
+            except Exception as e:
+                logger.error(f"写入分子结构索引失败: {str(e)}")
+        if signatures:
+            # 签名缺失只会让之后的近重复片段照常入库，可用 scripts/build_near_duplicate_index.py 重建
+            try:
+                self.near_duplicates.add(ids, metadatas, signatures)
+            except Exception as e:
+                logger.error(f"写入近重复索引失败: {str(e)}")
+        if centroids is not None:
+            accumulate_centroids(centroids, vectors, metadatas)
     
-    async def add_documents(self, documents: List[Document]) -> None:
-        """添加文档到向量数据库"""
+    async def add_documents(
+        self,
+        documents: List[Document],
+        duplicates: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Document]:
+        """添加文档到向量数据库，返回写入的片段（metadata 中带有 chunk_id 和 content_hash）
+
+        与已入库片段近重复的片段在嵌入前跳过，跳过记录追加到 duplicates（chunk_index 保持切分时的编号）。
+        """
         try:
             if not documents:
                 logger.warning("没有文档需要添加")
-                return
+                return []
+            
+            if self._ensure_index() is None:
+                raise RuntimeError("向量数据库未初始化")
             
             logger.info(f"开始处理 {len(documents)} 个文档")
             
@@ -221,76 +371,305 @@ class RAGService:
                 splits = self.text_splitter.split_documents([doc])
                 split_documents.extend(splits)
             
+            # 为每个片段分配 chunk ID，供 chunk 注册表按文件删除向量
+            for index, chunk in enumerate(split_documents):
+                chunk.metadata["chunk_id"] = str(uuid.uuid4())
+                chunk.metadata["chunk_index"] = index
+                chunk.metadata["content_hash"] = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+            
             logger.info(f"文档分割完成，共 {len(split_documents)} 个片段")
             
+            # 近重复片段在嵌入前跳过；去重失败时全部入库
+            signatures = None
+            skipped = []
+            if self.near_duplicates is not None:
+                try:
+                    split_documents, signatures, skipped = await asyncio.get_event_loop().run_in_executor(
+                        None, self.near_duplicates.filter_chunks, split_documents
+                    )
+                except Exception as e:
+                    logger.error(f"近重复检测失败，全部片段照常入库: {str(e)}")
+                if skipped:
+                    logger.info(f"跳过 {len(skipped)} 个近重复片段，剩余 {len(split_documents)} 个片段")
+            
             # 批量添加到向量数据库
             batch_size = 100
+            centroids = {} if self.router is not None else None
             for i in range(0, len(split_documents), batch_size):
                 batch = split_documents[i:i + batch_size]
-                await asyncio.get_event_loop().run_in_executor(
-                    None, self.vectorstore.add_documents, batch
-                )
+                await asyncio.get_event_loop().run_in_executor(None, self._add_batch, batch, centroids, signatures)
                 logger.info(f"已添加批次 {i//batch_size + 1}/{(len(split_documents)-1)//batch_size + 1}")
+            await asyncio.get_event_loop().run_in_executor(None, self.index.persist)
+            
+            if self.near_duplicates is not None:
+                file_ids = list({doc.metadata.get("file_id") for doc in documents})
+                try:
+                    await asyncio.get_event_loop().run_in_executor(
+                        None, self.near_duplicates.record_duplicates, file_ids, skipped
+                    )
+                except Exception as e:
+                    logger.error(f"记录近重复片段失败: {str(e)}")
+            if duplicates is not None:
+                duplicates.extend(skipped)
+            
+            # 文件质心只是路由加速，写入失败时可用 scripts/build_document_index.py 重建
+            if centroids:
+                try:
+                    await asyncio.get_event_loop().run_in_executor(None, self.router.write, centroids)
+                except Exception as e:
+                    logger.error(f"写入文件质心失败: {str(e)}")
             
             logger.info("文档添加完成")
+            return split_documents
             
         except Exception as e:
             logger.error(f"添加文档失败: {str(e)}")
             raise
+
+    async def delete_vectors(self, ids: List[str]) -> int:
+        """按 chunk ID 删除向量，返回删除数量"""
+        if self._ensure_index() is None:
+            raise RuntimeError("向量数据库未初始化")
+        if not ids:
+            return 0
+        
+        batch_size = 500
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i + batch_size]
+            await asyncio.get_event_loop().run_in_executor(None, self.index.delete, batch)
+            if self.lexical is not None:
+                await asyncio.get_event_loop().run_in_executor(None, self.lexical.delete, batch)
+            if self.near_duplicates is not None:
+                await asyncio.get_event_loop().run_in_executor(None, self.near_duplicates.delete, batch)
+            if self.molecules is not None:
+                await asyncio.get_event_loop().run_in_executor(None, self.molecules.delete, batch)
+        await asyncio.get_event_loop().run_in_executor(None, self.index.persist)
+        logger.info(f"已从向量数据库删除 {len(ids)} 个向量")
+        return len(ids)
+
+    async def delete_vectors_by_file(self, file_id: int) -> int:
+        """按 metadata 中的 file_id 删除向量（用于注册表上线之前索引的旧文件）"""
+        if self._ensure_index() is None:
+            raise RuntimeError("向量数据库未初始化")
+        
+        data = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: self.index.get(where={"file_id": file_id})
+        )
+        deleted = await self.delete_vectors(data["ids"])
+        await self.delete_file_summaries([file_id])
+        return deleted
+
+    async def delete_file_summaries(self, file_ids: List[int]) -> None:
+        """删除文件的质心向量"""
+        if self.router is not None and file_ids:
+            await asyncio.get_event_loop().run_in_executor(None, self.router.delete_files, file_ids)
+
+    async def forget_duplicate_records(self, file_ids: List[int]) -> None:
+        """删除文件入库时的近重复跳过记录"""
+        if self.near_duplicates is not None and file_ids:
+            await asyncio.get_event_loop().run_in_executor(None, self.near_duplicates.forget_files, file_ids)
+
+    async def compact_collection(self) -> int:
+        """重建向量集合，返回保留的向量数"""
+        if self._ensure_index() is None:
+            raise RuntimeError("向量数据库未初始化")
+        
+        logger.info("开始压缩向量集合...")
+        count = await asyncio.get_event_loop().run_in_executor(None, self.index.compact)
+        if self.router is not None:
+            await asyncio.get_event_loop().run_in_executor(None, self.router.index.compact)
+        logger.info(f"向量集合压缩完成，保留 {count} 个向量")
+        return count
+    
+    async def embed_query(self, text: str) -> List[float]:
+        """计算查询向量（可传给 search_documents 复用，避免重复调用嵌入模型）"""
+        if self.embeddings is None:
+            raise RuntimeError("嵌入模型未初始化")
+        if self.batcher is not None:
+            return await self.batcher.embed(text)
+        return await asyncio.get_event_loop().run_in_executor(None, self.embeddings.embed_query, text)
+    
+    def _search(
+        self,
+        query: str,
+        top_k: int,
+        where: Optional[Dict[str, Any]],
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        if query_embedding is None:
+            query_embedding = self.embeddings.embed_query(query)
+        self.index.check_dimension(len(query_embedding))
+        if self.router is not None:
+            where = self.router.route(query_embedding, where)
+        return self.index.query(query_embedding, top_k, where)
     
     async def search_documents(
         self, 
         query: str, 
         top_k: int = 5,
-        score_threshold: float = 0.0
+        score_threshold: Optional[float] = None,
+        where: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
-        """搜索相关文档"""
+        """搜索相关文档（score 为余弦相似度，越大越相关）"""
         try:
             logger.info(f"搜索查询: {query[:100]}...")
             
-            if not self.vectorstore:
+            if self._ensure_index() is None:
                 logger.error("向量数据库未初始化")
                 return []
             
+            if query_embedding is None and self.batcher is not None:
+                query_embedding = await self.embed_query(query)
+            
             # 执行相似性搜索
             results = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.vectorstore.similarity_search_with_score(
-                    query, k=top_k
-                )
+                None, self._search, query, top_k, where, query_embedding
             )
             
-            # 过滤结果并格式化
-            filtered_results = []
-            for doc, score in results:
-                if score >= score_threshold:
-                    filtered_results.append({
-                        'content': doc.page_content,
-                        'metadata': doc.metadata,
-                        'score': score
-                    })
+            # 过滤结果
+            if score_threshold is not None:
+                results = [result for result in results if result["score"] >= score_threshold]
             
-            logger.info(f"搜索完成，返回 {len(filtered_results)} 个结果")
-            return filtered_results
+            logger.info(f"搜索完成，返回 {len(results)} 个结果")
+            return results
             
         except Exception as e:
             logger.error(f"文档搜索失败: {str(e)}")
             return []
-    
+
+    def has_exact_identifiers(self, query: str) -> bool:
+        """查询中是否含 CAS 号、分子式、InChIKey 等精确标识符（词法索引启用时才可能跳过向量检索）"""
+        if self.lexical is None:
+            return False
+        return any(identifier["type"] != "name" for identifier in detect_identifiers(query))
+
+    async def hybrid_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        where: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """含化学标识符的查询先查词法索引：CAS 号、分子式、InChIKey 命中足够多时直接返回，不再计算查询向量；
+        否则（命中不足或只识别出化合物名称）与向量检索结果做倒数排名融合"""
+        identifiers = detect_identifiers(query) if self.lexical is not None else []
+        if not identifiers:
+            return await self.search_documents(query, top_k=top_k, where=where, query_embedding=query_embedding)
+
+        terms = [identifier["value"] for identifier in identifiers]
+        try:
+            lexical_results = await asyncio.get_event_loop().run_in_executor(
+                None, self.lexical.search, terms, top_k, where
+            )
+        except Exception as e:
+            logger.error(f"词法检索失败: {str(e)}")
+            lexical_results = []
+
+        exact = any(identifier["type"] != "name" for identifier in identifiers)
+        if exact and len(lexical_results) >= min(top_k, settings.LEXICAL_MIN_HITS):
+            logger.info(f"标识符 {terms} 词法命中 {len(lexical_results)} 个片段，跳过向量检索")
+            return lexical_results
+
+        vector_results = await self.search_documents(query, top_k=top_k, where=where, query_embedding=query_embedding)
+        if not lexical_results:
+            return vector_results
+        fused = reciprocal_rank_fusion([lexical_results, vector_results], k=settings.LEXICAL_FUSION_K)
+        logger.info(f"标识符 {terms} 词法命中 {len(lexical_results)} 个片段，与向量检索结果融合")
+        return fused[:top_k]
+
+    async def search_by_structure(
+        self,
+        molecule,
+        top_k: int = 10,
+        mode: str = "similarity",
+        threshold: float = 0.5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """按结构检索提到相似分子的片段（不调用嵌入模型），结果附带片段原文和匹配到的分子"""
+        if self.molecules is None:
+            raise RuntimeError("分子结构索引未启用")
+        hits = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: self.molecules.search(molecule, top_k, mode=mode, threshold=threshold, where=where)
+        )
+        if not hits or self._ensure_index() is None:
+            return hits
+        data = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: self.index.get(ids=[hit["id"] for hit in hits])
+        )
+        documents = {chunk_id: (document, metadata) for chunk_id, document, metadata in zip(data["ids"], data["documents"], data["metadatas"])}
+        results = []
+        for hit in hits:
+            # 分子索引与向量库不一致时（例如向量已删除）跳过该片段
+            if hit["id"] not in documents:
+                continue
+            document, metadata = documents[hit["id"]]
+            results.append({**hit, "content": document, "metadata": metadata or {}, "match": "structure"})
+        return results
+
+    async def retrieve(
+        self,
+        query: str,
+        top_k: Optional[int] = None,
+        where: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """宽召回 + 重排序：先取 RERANK_CANDIDATES 个候选，重排序后只保留超过阈值的前 top_k 个"""
+        top_k = top_k or settings.RERANK_TOP_N
+        if settings.RERANK_MODE == "none":
+            return await self.hybrid_search(query, top_k=top_k, where=where, query_embedding=query_embedding)
+
+        candidates = await self.hybrid_search(
+            query,
+            top_k=max(top_k, settings.RERANK_CANDIDATES),
+            where=where,
+            query_embedding=query_embedding
+        )
+        # 全部来自标识符精确匹配时只用重排序决定顺序，不按得分阈值丢弃
+        exact = bool(candidates) and all(c.get("match") == "lexical" for c in candidates)
+        try:
+            return await rerank(query, candidates, top_n=top_k, score_cutoff=0.0 if exact else None)
+        except Exception as e:
+            logger.error(f"重排序失败，使用检索结果: {str(e)}")
+            return candidates[:top_k]
+
+    async def build_context(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        query_embedding: Optional[List[float]] = None
+    ) -> Tuple[str, Dict[str, int]]:
+        """把检索结果整理为提示词上下文：合并相邻片段、去重，按配置做句子级压缩
+
+        返回上下文和节省统计（process_context 的 stats，未处理时为空字典）
+        """
+        if not results:
+            return "", {}
+        if not settings.CONTEXT_MERGE_ENABLED:
+            return "\n\n".join(result["content"] for result in results), {}
+
+        if settings.CONTEXT_SENTENCE_SELECTION and query_embedding is None and self.embeddings is not None:
+            query_embedding = await self.embed_query(query)
+        embed_documents = self.embeddings.embed_documents if self.embeddings is not None else None
+        processed, stats = await asyncio.get_event_loop().run_in_executor(
+            None, process_context, results, query_embedding, embed_documents
+        )
+        return "\n\n".join(result["content"] for result in processed), stats
+
     async def get_collection_stats(self) -> Dict[str, Any]:
         """获取集合统计信息"""
         try:
-            if not self.vectorstore:
+            if self._ensure_index() is None:
                 return {"error": "向量数据库未初始化"}
             
-            # 获取集合信息
-            collection = self.vectorstore._collection
-            count = collection.count()
+            count = await asyncio.get_event_loop().run_in_executor(None, self.index.count)
             
             return {
                 "document_count": count,
-                "collection_name": collection.name,
-                "embedding_model": settings.EMBEDDING_MODEL
+                "collection_name": self.index.collection_name,
+                "backend": self.index.backend,
+                "embedding_model": self.collection["model"],
+                "embedding_version": self.collection["version"]
             }
             
         except Exception as e:
@@ -299,18 +678,12 @@ class RAGService:
     
     async def clear_collection(self) -> bool:
         """清空集合"""
-        try:
-            if not self.vectorstore:
-                logger.error("向量数据库未初始化")
-                return False
-            
-            # 删除所有文档
-            collection = self.vectorstore._collection
-            collection.delete()
-            
-            logger.info("集合已清空")
-            return True
-            
-        except Exception as e:
-            logger.error(f"清空集合失败: {str(e)}")
-            return False
\ No newline at end of file
+        if self.index is None:
+            logger.error("向量数据库未初始化")
+            return False
+        return await self.clear_database()
+
+@lru_cache(maxsize=1)
+def get_rag_service() -> RAGService:
+    """进程内共享的 RAGService 实例，避免每个请求重复加载嵌入模型和向量索引"""
+    return RAGService()
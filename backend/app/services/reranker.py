@@ -0,0 +1,89 @@
+from typing import List, Dict, Any, Optional
+from collections import Counter
+from functools import lru_cache
+import asyncio
+import math
+from loguru import logger
+from app.core.config import settings
+from app.services.text_utils import lexical_tokens
+
+class LexicalOverlapReranker:
+    """词法重叠打分：按候选集内的 IDF 加权统计查询词覆盖率，得分范围 [0, 1]"""
+    name = "lexical"
+
+    def score(self, query: str, passages: List[str]) -> List[float]:
+        query_tokens = set(lexical_tokens(query))
+        if not query_tokens or not passages:
+            return [0.0] * len(passages)
+
+        passage_counts = [Counter(lexical_tokens(p)) for p in passages]
+        n = len(passages)
+        idf = {
+            token: math.log(1 + (n + 1) / (1 + sum(1 for counts in passage_counts if token in counts)))
+            for token in query_tokens
+        }
+        total = sum(idf.values())
+
+        scores = []
+        for counts in passage_counts:
+            # tf 饱和：同一个词出现多次只带来有限加成
+            covered = sum(idf[t] * counts[t] / (counts[t] + 0.5) for t in query_tokens if t in counts)
+            scores.append(covered / total)
+        return scores
+
+class CrossEncoderReranker:
+    """本地交叉编码器打分（CPU 批量推理），logit 经 sigmoid 映射到 [0, 1]"""
+    name = "cross_encoder"
+
+    def __init__(self, model_name: str, batch_size: int):
+        from sentence_transformers import CrossEncoder
+        logger.info(f"加载重排序模型: {model_name}")
+        self.model = CrossEncoder(model_name, device="cpu", max_length=512)
+        self.batch_size = batch_size
+
+    def score(self, query: str, passages: List[str]) -> List[float]:
+        if not passages:
+            return []
+        logits = self.model.predict(
+            [(query, p) for p in passages],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+            apply_softmax=False
+        )
+        return [1.0 / (1.0 + math.exp(-float(x))) for x in logits]
+
+@lru_cache(maxsize=1)
+def get_reranker():
+    """按配置创建重排序器，交叉编码器不可用时回退到词法打分"""
+    if settings.RERANK_MODE == "cross_encoder":
+        try:
+            return CrossEncoderReranker(settings.RERANK_MODEL, settings.RERANK_BATCH_SIZE)
+        except Exception as e:
+            logger.warning(f"重排序模型加载失败，回退到词法打分: {e}")
+    return LexicalOverlapReranker()
+
+async def rerank(
+    query: str,
+    results: List[Dict[str, Any]],
+    top_n: Optional[int] = None,
+    score_cutoff: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """对检索结果重新打分，按得分降序返回不低于阈值的前 top_n 个（结果中增加 rerank_score）"""
+    top_n = top_n or settings.RERANK_TOP_N
+    score_cutoff = settings.RERANK_SCORE_CUTOFF if score_cutoff is None else score_cutoff
+    if not results:
+        return []
+
+    reranker = get_reranker()
+    scores = await asyncio.get_event_loop().run_in_executor(
+        None, reranker.score, query, [r["content"] for r in results]
+    )
+
+    ranked = sorted(
+        ({**r, "rerank_score": s} for r, s in zip(results, scores)),
+        key=lambda r: r["rerank_score"],
+        reverse=True
+    )
+    kept = [r for r in ranked if r["rerank_score"] >= score_cutoff][:top_n]
+    logger.info(f"重排序({reranker.name}): {len(results)} 个候选 -> {len(kept)} 个")
+    return kept
@@ -0,0 +1,117 @@
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+from pathlib import Path
+import json
+import re
+import threading
+from sqlalchemy.orm import Session
+from loguru import logger
+from app.core.config import settings
+from app.services import knowledge_registry
+
+# 意图规则：只用正则，不引入额外模型，每条消息的判断开销在微秒级
+CHITCHAT_PATTERN = re.compile(
+    r"^(你好|您好|嗨|哈喽|hi|hello|hey|在吗|在不在|谢谢|多谢|感谢|thanks|thank you|thx|好的|好滴|ok|okay|嗯+|哦+|"
+    r"再见|拜拜|bye|早上好|中午好|晚上好|晚安|你是谁|你叫什么|你能做什么|你会什么|who are you)[\s!！。.~～?？]*$",
+    re.IGNORECASE
+)
+# 工具类请求：绘制结构、计算性质、3D 结构、谱图峰值分析
+TOOL_ACTION_PATTERN = re.compile(
+    r"(画出?|绘制|展示|显示|生成|给我|看看|查看).{0,20}(结构|结构式|结构图|3d|三维|分子模型)"
+    r"|(计算|算一下|求).{0,20}(分子量|分子质量|摩尔质量|logp|tpsa|氢键|性质|属性)"
+    r"|(分子量|分子质量|摩尔质量|logp|tpsa)(是多少|多少|为多少)"
+    r"|(分析|解析|预测).{0,10}(谱图|光谱|图谱|nmr|核磁|红外|ir|质谱|峰)",
+    re.IGNORECASE
+)
+# 出现这些词说明需要知识性解释，即使同时请求工具也保留检索
+KNOWLEDGE_PATTERN = re.compile(
+    r"为什么|为何|原理|机理|机制|解释|区别|比较|对比|应用|用途|安全|危害|毒性|反应条件|如何制备|怎么制备|合成路线|历史|"
+    r"why|how does|explain|mechanism|difference",
+    re.IGNORECASE
+)
+# 纯 SMILES 输入
+SMILES_PATTERN = re.compile(r"^[A-Za-z0-9@+\-\[\]\(\)=#$/\\%.:]{2,}$")
+
+_log_lock = threading.Lock()
+
+def classify_intent(message: str, has_image: bool = False) -> Dict[str, str]:
+    """本地意图分类，返回 {"intent": knowledge|tool|chitchat, "rule": 命中的规则}"""
+    text = (message or "").strip()
+    if not text:
+        return {"intent": "tool" if has_image else "chitchat", "rule": "empty"}
+    if KNOWLEDGE_PATTERN.search(text):
+        return {"intent": "knowledge", "rule": "knowledge_keyword"}
+    if CHITCHAT_PATTERN.match(text):
+        return {"intent": "chitchat", "rule": "chitchat"}
+    if SMILES_PATTERN.match(text) and any(c in text for c in "=()[]#@"):
+        return {"intent": "tool", "rule": "smiles"}
+    if TOOL_ACTION_PATTERN.search(text):
+        return {"intent": "tool", "rule": "tool_action"}
+    return {"intent": "knowledge", "rule": "default"}
+
+def decide(db: Session, message: str, has_image: bool = False, namespaces: Optional[List[str]] = None) -> Dict[str, Any]:
+    """判断本轮是否需要检索知识库；给定 namespaces 时只看这些命名空间是否有内容"""
+    intent = classify_intent(message, has_image)
+    decision = {"retrieve": True, "reason": "knowledge", **intent}
+
+    if not settings.RETRIEVAL_GATE_ENABLED:
+        decision["reason"] = "gate_disabled"
+        return decision
+
+    if namespaces is not None:
+        stats = knowledge_registry.get_namespace_stats(db, namespaces)
+        total_chunks = sum(entry["total_chunks"] for entry in stats.values())
+    else:
+        total_chunks = knowledge_registry.get_stats(db)["total_chunks"]
+
+    if total_chunks == 0:
+        decision.update(retrieve=False, reason="empty_collection")
+    elif intent["intent"] != "knowledge":
+        decision.update(retrieve=False, reason=intent["intent"])
+    return decision
+
+def _score(result: Dict[str, Any]) -> float:
+    # 融合结果中各片段的 score 来自不同的检索方式，不可直接比较
+    if "rerank_score" in result:
+        return result["rerank_score"]
+    return result.get("fusion_score", result.get("score", 0.0))
+
+def adapt_top_k(results: List[Dict[str, Any]], min_gap: Optional[float] = None, min_k: int = 1) -> List[Dict[str, Any]]:
+    """在相邻得分出现明显断层的位置截断：断层之后的片段与问题的相关度明显低于前面的片段"""
+    min_gap = settings.RETRIEVAL_GATE_SCORE_GAP if min_gap is None else min_gap
+    if len(results) <= min_k or min_gap <= 0:
+        return results
+
+    scores = [_score(r) for r in results]
+    for i in range(max(min_k, 1), len(scores)):
+        if scores[i - 1] - scores[i] >= min_gap:
+            return results[:i]
+    return results
+
+def log_decision(
+    conversation_id: str,
+    message: str,
+    decision: Dict[str, Any],
+    results: Optional[List[Dict[str, Any]]] = None,
+    kept: Optional[int] = None
+) -> None:
+    """把门控决策追加写入 JSONL，便于离线调整规则和阈值"""
+    logger.info(f"检索门控: retrieve={decision['retrieve']} reason={decision['reason']} rule={decision['rule']}")
+    if not settings.RETRIEVAL_GATE_LOG:
+        return
+
+    record = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "conversation_id": conversation_id,
+        "message": (message or "")[:200],
+        **decision,
+        "scores": [round(_score(r), 4) for r in results] if results else [],
+        "kept": kept,
+    }
+    try:
+        path = Path(settings.RETRIEVAL_GATE_LOG)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning(f"写入检索门控日志失败: {e}")
@@ -0,0 +1,22 @@
+from typing import List
+import re
+
+_CJK = r"㐀-䶿一-鿿豈-﫿"
+_CJK_RUN = re.compile(f"[{_CJK}]+")
+_WORD = re.compile(r"[a-z0-9][a-z0-9\-]*")
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = sum(len(run) for run in _CJK_RUN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def lexical_tokens(text: str) -> List[str]:
+    """词法匹配用的分词：英文/数字按词切分，中文同时输出单字和相邻两字（化学中单字词很常见，如“苯”“醛”）"""
+    text = (text or "").lower()
+    tokens = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
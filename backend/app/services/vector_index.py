@@ -0,0 +1,1191 @@
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Iterator, Callable, Tuple
+from functools import lru_cache
+from pathlib import Path
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from loguru import logger
+from app.core.config import settings
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """按行 L2 归一化（零向量保持不变）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def truncate_rows(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """保留前 dimensions 维并重新归一化（Matryoshka 式截断）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    if dimensions <= 0 or dimensions >= vectors.shape[1]:
+        return normalize_rows(vectors)
+    return normalize_rows(vectors[:, :dimensions])
+
+def match_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """判断 metadata 是否满足过滤条件（支持 Chroma where 语法的常用子集）"""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match_where(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+                if op == "$gt" and not (value is not None and value > operand):
+                    return False
+                if op == "$gte" and not (value is not None and value >= operand):
+                    return False
+                if op == "$lt" and not (value is not None and value < operand):
+                    return False
+                if op == "$lte" and not (value is not None and value <= operand):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+# NumPy 系索引为这些 metadata 字段维护按行编码的数组，按它们过滤时不逐行比对 metadata
+INDEXED_METADATA_KEYS = ("file_id", "namespace")
+
+def split_key_filter(where: Optional[Dict[str, Any]], key: str) -> Tuple[Optional[List[Any]], Optional[Dict[str, Any]]]:
+    """拆出 where 中对 key 的等值或 $in 条件，返回 (取值列表, 其余条件)；没有时取值列表为 None"""
+    if not where:
+        return None, where
+
+    def values(condition):
+        if isinstance(condition, dict):
+            if set(condition) == {"$in"}:
+                return list(condition["$in"])
+            if set(condition) == {"$eq"}:
+                return [condition["$eq"]]
+            return None
+        return [condition]
+
+    if key in where:
+        found = values(where[key])
+        if found is not None:
+            rest = {k: v for k, v in where.items() if k != key}
+            return found, rest or None
+    if set(where) == {"$and"}:
+        for i, sub in enumerate(where["$and"]):
+            if set(sub) == {key}:
+                found = values(sub[key])
+                if found is not None:
+                    others = where["$and"][:i] + where["$and"][i + 1:]
+                    if not others:
+                        return found, None
+                    return found, others[0] if len(others) == 1 else {"$and": others}
+    return None, where
+
+class VectorIndex(ABC):
+    """向量索引抽象：按 chunk ID 存储向量、文本和 metadata，按余弦相似度检索"""
+    backend: str = ""
+
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """写入向量"""
+        pass
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        """按 ID 删除向量"""
+        pass
+
+    @abstractmethod
+    def query(
+        self,
+        embedding: List[float],
+        k: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """检索最相似的 k 个向量，返回 id/content/metadata/score（score 为余弦相似度，越大越相关）"""
+        pass
+
+    @abstractmethod
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        include_embeddings: bool = False
+    ) -> Dict[str, Any]:
+        """读取向量记录，返回 ids/documents/metadatas（以及可选的 embeddings 矩阵）"""
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        """存活向量数"""
+        pass
+
+    @abstractmethod
+    def reset(self) -> None:
+        """清空索引"""
+        pass
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """替换已有向量的 metadata（向量和文本不变）；默认实现读出原向量后按相同 ID 重新写入"""
+        if not ids:
+            return
+        replacements = dict(zip(ids, metadatas))
+        batch = self.get(ids=ids, include_embeddings=True)
+        if batch["ids"]:
+            self.add(
+                ids=batch["ids"],
+                embeddings=batch["embeddings"],
+                documents=batch["documents"],
+                metadatas=[replacements[chunk_id] for chunk_id in batch["ids"]]
+            )
+
+    def compact(self) -> int:
+        """回收已删除向量占用的空间，返回保留的向量数"""
+        return self.count()
+
+    @abstractmethod
+    def rewrite(self, transform: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> int:
+        """用存活向量重建索引（可先对向量矩阵做变换，例如降维），返回保留的向量数"""
+        pass
+
+    def get_dimension(self) -> Optional[int]:
+        """索引中向量的维度，空索引返回 None"""
+        return None
+
+    def check_dimension(self, dimension: int) -> None:
+        """写入或检索前校验向量维度，不一致时拒绝操作"""
+        expected = self.get_dimension()
+        if expected is not None and expected != dimension:
+            raise ValueError(
+                f"向量维度不匹配: 集合 {self.collection_name} 为 {expected} 维，当前嵌入为 {dimension} 维。"
+                f"请检查 EMBEDDING_DIMENSIONS 或运行 scripts/reproject_embeddings.py 迁移集合"
+            )
+
+    def persist(self) -> None:
+        """将内存中的索引结构写入磁盘"""
+        pass
+
+    def drop(self) -> None:
+        """删除整个集合（不再使用的嵌入集合版本）"""
+        self.reset()
+
+    def all_ids(self, batch_size: int = 5000) -> List[str]:
+        """全部存活向量的 ID"""
+        ids = []
+        for batch in self.iter_batches(batch_size):
+            ids.extend(batch["ids"])
+        return ids
+
+    def get_tags(self) -> Dict[str, Any]:
+        """集合上记录的嵌入模型标签（模型名、维度）"""
+        return {}
+
+    def set_tags(self, tags: Dict[str, Any]) -> None:
+        """记录集合的嵌入模型标签"""
+        pass
+
+    def memory_bytes(self) -> Optional[int]:
+        """查询时需要常驻内存的索引数据大小（估算），未知时返回 None"""
+        return None
+
+    def health(self) -> Dict[str, Any]:
+        """健康检查"""
+        return {"status": "ok", "backend": self.backend}
+
+    def iter_batches(self, batch_size: int = 1000, include_embeddings: bool = False) -> Iterator[Dict[str, Any]]:
+        """分页遍历全部记录"""
+        offset = 0
+        while True:
+            batch = self.get(limit=batch_size, offset=offset, include_embeddings=include_embeddings)
+            if not batch["ids"]:
+                break
+            yield batch
+            offset += len(batch["ids"])
+
+class ChromaVectorIndex(VectorIndex):
+    """Chroma 向量索引（嵌入式 PersistentClient 或 HTTP 客户端）
+
+    collection_name 是逻辑名称，实际读写的 Chroma 集合由数据库中的指针（vector_collections.physical_name）决定。
+    压缩把存活向量复制到带版本后缀的新集合后切换指针；共享同一个 Chroma 服务的其他进程写入前、
+    读取时按间隔或遇到集合不存在时按名称重新解析，不会一直读写已删除的集合。
+    """
+    backend = "chroma"
+    # 读取时重新解析指针的间隔（秒）；写入前每次都解析，压缩期间的写入才能同时进入目标集合
+    POINTER_REFRESH_SECONDS = 10
+
+    def __init__(self, collection_name: str, client=None, tags: Optional[Dict[str, Any]] = None):
+        super().__init__(collection_name)
+        self.client = client or get_chroma_client()
+        self._dimension: Optional[int] = None
+        self.physical_name, self.compaction_target = load_collection_pointer(collection_name) or (collection_name, None)
+        self._resolved_at = time.monotonic()
+        # 新集合使用余弦距离并记录嵌入模型标签；旧集合保留原有 metadata，检索时按原距离类型换算为相似度
+        self.collection = self.client.get_or_create_collection(
+            self.physical_name, metadata={"hnsw:space": "cosine", **(tags or {})}
+        )
+
+    @property
+    def space(self) -> str:
+        return (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+    def _distance_to_score(self, distance: float) -> float:
+        if self.space == "l2":
+            # Chroma 的 l2 为平方欧氏距离，对归一化向量有 d = 2 - 2cos
+            return 1.0 - distance / 2.0
+        return 1.0 - distance
+
+    def _resolve(self, force: bool = False) -> None:
+        """按数据库指针打开当前使用的集合；force 时即使指针未变也重新打开（集合被删除后重建）"""
+        now = time.monotonic()
+        if not force and now - self._resolved_at < self.POINTER_REFRESH_SECONDS:
+            return
+        self._resolved_at = now
+        physical, target = load_collection_pointer(self.collection_name) or (self.physical_name, self.compaction_target)
+        if force or physical != self.physical_name:
+            self.collection = self.client.get_collection(physical)
+            if physical != self.physical_name:
+                logger.info(f"向量集合 {self.collection_name} 已切换到 {physical}")
+                self.physical_name = physical
+                self._dimension = None
+        self.compaction_target = target
+
+    def _read(self, operation: Callable[[Any], Any]) -> Any:
+        self._resolve()
+        try:
+            return operation(self.collection)
+        except Exception as e:
+            if not is_missing_collection(e):
+                raise
+            # 集合已被其他进程压缩替换，按名称重新解析后重试一次
+            logger.info(f"向量集合 {self.physical_name} 已不存在，重新解析 {self.collection_name}")
+            self._resolve(force=True)
+            return operation(self.collection)
+
+    def _write(self, operation: Callable[[Any], Any]) -> None:
+        """写入当前集合；压缩复制期间同时写入目标集合，复制开始后的写入不会在切换时丢失"""
+        self._resolved_at = 0.0
+        self._read(operation)
+        target = self.compaction_target
+        if not target or target == self.physical_name:
+            return
+        try:
+            operation(self.client.get_collection(target))
+        except Exception as e:
+            # 目标集合已被删除：压缩已失败放弃，或已切换完成且指针在本次写入前刚刚更新
+            if not is_missing_collection(e):
+                raise
+
+    def add(self, ids, embeddings, documents, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        self._write(lambda collection: collection.add(
+            ids=ids,
+            embeddings=vectors,
+            documents=documents,
+            metadatas=metadatas
+        ))
+        if self._dimension is None and len(embeddings) > 0:
+            self._dimension = len(embeddings[0])
+
+    def delete(self, ids):
+        if ids:
+            self._write(lambda collection: collection.delete(ids=ids))
+
+    def update_metadata(self, ids, metadatas):
+        if ids:
+            self._write(lambda collection: collection.update(ids=ids, metadatas=metadatas))
+
+    def query(self, embedding, k, where=None):
+        if k <= 0:
+            return []
+        result = self._read(lambda collection: collection.query(
+            query_embeddings=[np.asarray(embedding, dtype=np.float32)],
+            n_results=k,
+            where=where or None,
+            include=["documents", "metadatas", "distances"]
+        ))
+        hits = []
+        for chunk_id, document, metadata, distance in zip(
+            result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+        ):
+            hits.append({
+                "id": chunk_id,
+                "content": document,
+                "metadata": metadata or {},
+                "score": self._distance_to_score(distance)
+            })
+        return hits
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include_embeddings=False):
+        include = ["documents", "metadatas"]
+        if include_embeddings:
+            include.append("embeddings")
+        result = self._read(lambda collection: collection.get(
+            ids=ids,
+            where=where or None,
+            limit=limit,
+            offset=offset or None,
+            include=include
+        ))
+        batch = {
+            "ids": result["ids"],
+            "documents": result["documents"],
+            "metadatas": [m or {} for m in result["metadatas"]]
+        }
+        if include_embeddings:
+            batch["embeddings"] = np.asarray(result["embeddings"], dtype=np.float32)
+        return batch
+
+    def count(self):
+        return self._read(lambda collection: collection.count())
+
+    def all_ids(self, batch_size: int = 5000):
+        return self._read(lambda collection: collection_ids(collection, batch_size))
+
+    def get_tags(self):
+        return {key: value for key, value in (self.collection.metadata or {}).items() if not key.startswith("hnsw:")}
+
+    def _delete_collection(self, name: str) -> None:
+        try:
+            self.client.delete_collection(name)
+        except Exception as e:
+            logger.warning(f"删除集合 {name} 失败: {e}")
+
+    def drop(self):
+        physical, target = load_collection_pointer(self.collection_name) or (self.physical_name, self.compaction_target)
+        for name in {physical, target} - {None}:
+            self._delete_collection(name)
+        save_collection_pointer(self.collection_name, physical_name=None, compaction_target=None)
+        self._dimension = None
+
+    def health(self):
+        start = time.perf_counter()
+        try:
+            self.client.heartbeat()
+            status = "ok"
+        except Exception as e:
+            logger.warning(f"Chroma 心跳检查失败: {e}")
+            status = "unavailable"
+        return {
+            "status": status,
+            "backend": self.backend,
+            "mode": settings.CHROMA_MODE,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+
+    def reset(self):
+        # 重建同名集合，其他进程遇到集合不存在时按名称重新打开
+        self._resolve(force=True)
+        metadata = self.collection.metadata
+        self.client.delete_collection(self.physical_name)
+        self.collection = self.client.create_collection(self.physical_name, metadata=metadata)
+        self._dimension = None
+
+    def get_dimension(self):
+        if self._dimension is None:
+            sample = self._read(lambda collection: collection.get(limit=1, include=["embeddings"]))
+            embeddings = sample.get("embeddings")
+            if embeddings is not None and len(embeddings) > 0:
+                self._dimension = len(embeddings[0])
+        return self._dimension
+
+    def compact(self):
+        """将存活向量复制到新集合并切换指针，回收 HNSW 索引中已删除向量占用的空间"""
+        return self.rewrite()
+
+    def rewrite(self, transform=None):
+        """复制存活向量到带版本后缀的新集合，再在数据库中切换指针
+
+        不做变换时复制期间各进程的写入同时进入新集合（见 _write）；复制完成后再按 ID 比对补齐，
+        覆盖在目标集合登记之前就已开始的写入。旧集合在 VECTOR_COMPACTION_GRACE_SECONDS 后删除，
+        之后仍使用它的进程遇到集合不存在时按名称重新解析。
+        """
+        self._resolve(force=True)
+        source, source_name = self.collection, self.physical_name
+        if self.compaction_target:
+            # 上次压缩中断留下的目标集合
+            self._delete_collection(self.compaction_target)
+        target_name = next_compaction_name(self.collection_name, source_name)
+        try:
+            self.client.delete_collection(target_name)
+        except Exception:
+            pass
+        target = self.client.create_collection(target_name, metadata=source.metadata)
+        # 降维等变换后的向量与其他进程写入的向量维度不同，不能转发，只靠复制后的比对补齐
+        forward = target_name if transform is None else None
+        save_collection_pointer(self.collection_name, physical_name=source_name, compaction_target=forward)
+
+        try:
+            # 分批复制已有向量，不重新调用嵌入模型
+            copied = 0
+            for batch in collection_batches(source, include_embeddings=True):
+                copy_batch(target, batch, transform)
+                copied += len(batch["ids"])
+            reconciled = reconcile_collections(source, target, transform)
+            save_collection_pointer(self.collection_name, physical_name=target_name, compaction_target=None)
+        except Exception:
+            save_collection_pointer(self.collection_name, physical_name=source_name, compaction_target=None)
+            self._delete_collection(target_name)
+            self.compaction_target = None
+            raise
+
+        self.collection, self.physical_name, self.compaction_target = target, target_name, None
+        self._resolved_at = time.monotonic()
+        self._dimension = None
+        logger.info(
+            f"向量集合 {self.collection_name} 已切换: {source_name} -> {target_name}，"
+            f"复制 {copied} 个向量，补齐复制期间的变更 {reconciled} 个"
+        )
+
+        # 等其他进程重新解析指针后再删除旧集合
+        if settings.VECTOR_COMPACTION_GRACE_SECONDS > 0:
+            time.sleep(settings.VECTOR_COMPACTION_GRACE_SECONDS)
+        self._delete_collection(source_name)
+        return target.count()
+
+def is_missing_collection(error: Exception) -> bool:
+    """Chroma 集合不存在：新版本抛 NotFoundError，旧版本抛 InvalidCollectionException 或 ValueError"""
+    if type(error).__name__ in ("NotFoundError", "InvalidCollectionException"):
+        return True
+    return isinstance(error, ValueError) and "does not exist" in str(error)
+
+def next_compaction_name(name: str, current: str) -> str:
+    """压缩目标集合名：逻辑名称加递增的版本后缀"""
+    prefix = f"{name}__v"
+    suffix = current[len(prefix):] if current.startswith(prefix) else ""
+    return f"{prefix}{int(suffix) + 1 if suffix.isdigit() else 2}"
+
+def collection_ids(collection, batch_size: int = 5000) -> List[str]:
+    ids = []
+    offset = 0
+    while True:
+        batch = collection.get(limit=batch_size, offset=offset or None, include=[])["ids"]
+        if not batch:
+            return ids
+        ids.extend(batch)
+        offset += len(batch)
+
+def collection_batches(
+    collection,
+    batch_size: int = 1000,
+    include_embeddings: bool = False,
+    ids: Optional[List[str]] = None
+) -> Iterator[Dict[str, Any]]:
+    """分页读取 Chroma 集合（给定 ids 时按 ID 分批读取）"""
+    include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+    offset = 0
+    while True:
+        if ids is not None:
+            if offset >= len(ids):
+                return
+            result = collection.get(ids=ids[offset:offset + batch_size], include=include)
+            offset += batch_size
+        else:
+            result = collection.get(limit=batch_size, offset=offset or None, include=include)
+            if not result["ids"]:
+                return
+            offset += len(result["ids"])
+        if result["ids"]:
+            yield result
+
+def copy_batch(target, batch: Dict[str, Any], transform=None) -> None:
+    embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+    target.upsert(
+        ids=batch["ids"],
+        embeddings=transform(embeddings) if transform else embeddings,
+        documents=batch["documents"],
+        metadatas=batch["metadatas"]
+    )
+
+def reconcile_collections(source, target, transform=None) -> int:
+    """按 ID 比对，补齐只写入了源集合的新增和删除，返回补齐的向量数"""
+    source_ids = set(collection_ids(source))
+    target_ids = set(collection_ids(target))
+    stale = list(target_ids - source_ids)
+    if stale:
+        target.delete(ids=stale)
+    missing = list(source_ids - target_ids)
+    for batch in collection_batches(source, include_embeddings=True, ids=missing):
+        copy_batch(target, batch, transform)
+    return len(stale) + len(missing)
+
+def load_collection_pointer(name: str) -> Optional[Tuple[str, Optional[str]]]:
+    """数据库中登记的 (当前使用的 Chroma 集合, 压缩中的目标集合)；读取失败时返回 None"""
+    from app.db.base import SessionLocal
+    from app.models.sql_models import VectorCollectionState
+    try:
+        db = SessionLocal()
+        try:
+            row = db.query(VectorCollectionState.physical_name, VectorCollectionState.compaction_target).filter(
+                VectorCollectionState.name == name
+            ).first()
+        finally:
+            db.close()
+    except Exception as e:
+        logger.warning(f"读取向量集合 {name} 的指针失败: {e}")
+        return None
+    if row is None:
+        return name, None
+    return row.physical_name or name, row.compaction_target
+
+def save_collection_pointer(name: str, physical_name: Optional[str], compaction_target: Optional[str]) -> None:
+    """更新向量集合指针，记录不存在时创建；physical_name 与逻辑名称相同时记为 NULL"""
+    from app.db.base import SessionLocal
+    from app.models.sql_models import VectorCollectionState
+    values = {
+        "physical_name": None if physical_name == name else physical_name,
+        "compaction_target": compaction_target
+    }
+    db = SessionLocal()
+    try:
+        updated = db.query(VectorCollectionState).filter(VectorCollectionState.name == name).update(
+            values, synchronize_session=False
+        )
+        if not updated:
+            db.add(VectorCollectionState(name=name, live_vectors=0, deleted_vectors=0, **values))
+        db.commit()
+    finally:
+        db.close()
+
+class NumpyFlatVectorIndex(VectorIndex):
+    """NumPy 精确检索索引：float32 向量保存在内存映射文件中，适合小规模语料
+
+    目录结构：
+      vectors.f32    按行追加的 float32 向量（已归一化）
+      records.jsonl  追加写入的操作日志（add/delete），启动时回放
+      meta.json      向量维度和嵌入模型标签
+    """
+    backend = "numpy"
+
+    def __init__(self, collection_name: str, path: Optional[str] = None):
+        super().__init__(collection_name)
+        self.path = Path(path or Path(settings.VECTOR_DB_PATH) / self.backend / collection_name)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._load()
+
+    @property
+    def _vectors_file(self) -> Path:
+        return self.path / "vectors.f32"
+
+    @property
+    def _records_file(self) -> Path:
+        return self.path / "records.jsonl"
+
+    @property
+    def _meta_file(self) -> Path:
+        return self.path / "meta.json"
+
+    def _load(self):
+        self.dimension: Optional[int] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._alive: List[bool] = []
+        self._rows: Dict[str, int] = {}
+        # 每行在 INDEXED_METADATA_KEYS 上的取值，以及由它们和 _alive 生成的 NumPy 数组缓存（增删时失效）
+        self._key_values: Dict[str, List[Any]] = {key: [] for key in INDEXED_METADATA_KEYS}
+        self._arrays: Dict[str, Any] = {}
+        self._vectors: Optional[np.ndarray] = None
+
+        self.tags: Dict[str, Any] = {}
+        if self._meta_file.exists():
+            meta = json.loads(self._meta_file.read_text(encoding="utf-8"))
+            self.dimension = meta.get("dimension")
+            self.tags = meta.get("tags", {})
+
+        if self._records_file.exists():
+            with open(self._records_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record["op"] == "add":
+                        self._append_row(record["id"], record["document"], record["metadata"])
+                    elif record["op"] == "delete":
+                        row = self._rows.pop(record["id"], None)
+                        if row is not None:
+                            self._alive[row] = False
+
+        self._remap()
+
+    def _append_row(self, chunk_id: str, document: str, metadata: Dict[str, Any]):
+        previous = self._rows.get(chunk_id)
+        if previous is not None:
+            self._alive[previous] = False
+        self._rows[chunk_id] = len(self._ids)
+        for key in INDEXED_METADATA_KEYS:
+            self._key_values[key].append((metadata or {}).get(key))
+        self._arrays.clear()
+        self._ids.append(chunk_id)
+        self._documents.append(document)
+        self._metadatas.append(metadata or {})
+        self._alive.append(True)
+
+    def _remap(self):
+        """重新映射向量文件（写入新行之后调用）"""
+        rows = len(self._ids)
+        if rows == 0 or not self.dimension:
+            self._vectors = np.zeros((0, self.dimension or 0), dtype=np.float32)
+            return
+        self._vectors = np.memmap(self._vectors_file, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+
+    def _write_meta(self):
+        self._meta_file.write_text(json.dumps({"dimension": self.dimension, "tags": self.tags}), encoding="utf-8")
+
+    def add(self, ids, embeddings, documents, metadatas):
+        if not ids:
+            return
+        vectors = normalize_rows(embeddings)
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+                self._write_meta()
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"向量维度不匹配: 索引为 {self.dimension}，写入为 {vectors.shape[1]}")
+
+            start = len(self._ids)
+            replaced = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+            with open(self._vectors_file, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._records_file, "a", encoding="utf-8") as f:
+                for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                    f.write(json.dumps({"op": "add", "id": chunk_id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n")
+                    self._append_row(chunk_id, document, metadata)
+            self._remap()
+            self._on_rows_added(start, vectors)
+            if replaced:
+                # 重复写入的 ID 以最新一行为准
+                self._on_rows_deleted(replaced)
+
+    def _on_rows_added(self, start: int, vectors: np.ndarray):
+        """子类钩子：新行写入之后调用"""
+        pass
+
+    def delete(self, ids):
+        with self._lock:
+            deleted = []
+            for chunk_id in ids:
+                row = self._rows.pop(chunk_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    deleted.append((chunk_id, row))
+            if not deleted:
+                return
+            self._arrays.clear()
+            with open(self._records_file, "a", encoding="utf-8") as f:
+                for chunk_id, _ in deleted:
+                    f.write(json.dumps({"op": "delete", "id": chunk_id}) + "\n")
+            self._on_rows_deleted([row for _, row in deleted])
+
+    def _on_rows_deleted(self, rows: List[int]):
+        """子类钩子：行被删除之后调用"""
+        pass
+
+    def _alive_array(self) -> np.ndarray:
+        if "alive" not in self._arrays:
+            self._arrays["alive"] = np.asarray(self._alive, dtype=bool)
+        return self._arrays["alive"]
+
+    def _key_mask(self, key: str, values: List[Any]) -> np.ndarray:
+        """metadata[key] 属于 values 的行（按取值编码后用 np.isin 比较）"""
+        if key not in self._arrays:
+            codes: Dict[Any, int] = {}
+            encoded = np.fromiter(
+                (codes.setdefault(value, len(codes)) for value in self._key_values[key]),
+                dtype=np.int32, count=len(self._key_values[key])
+            )
+            self._arrays[key] = (codes, encoded)
+        codes, encoded = self._arrays[key]
+        wanted = [codes[value] for value in values if value in codes]
+        return np.isin(encoded, wanted)
+
+    def _candidate_mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        mask = self._alive_array()
+        for key in INDEXED_METADATA_KEYS:
+            values, where = split_key_filter(where, key)
+            if values is not None:
+                mask = mask & self._key_mask(key, values)
+        if where:
+            mask = mask.copy()
+            for row in np.flatnonzero(mask):
+                if not match_where(self._metadatas[row], where):
+                    mask[row] = False
+        return mask
+
+    def _hit(self, row: int, score: float) -> Dict[str, Any]:
+        return {
+            "id": self._ids[row],
+            "content": self._documents[row],
+            "metadata": self._metadatas[row],
+            "score": float(score)
+        }
+
+    def query(self, embedding, k, where=None):
+        with self._lock:
+            if k <= 0 or not self._ids or self.dimension is None:
+                return []
+            query = normalize_rows(embedding)[0]
+            mask = self._candidate_mask(where)
+            candidates = np.flatnonzero(mask)
+            if len(candidates) == 0:
+                return []
+            if len(candidates) == len(self._ids):
+                scores = self._vectors @ query
+            else:
+                scores = self._vectors[candidates] @ query
+            k = min(k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            rows = top if len(candidates) == len(self._ids) else candidates[top]
+            return [self._hit(int(row), scores[i]) for row, i in zip(rows, top)]
+
+    def _alive_rows(self, ids=None, where=None) -> List[int]:
+        if ids is None:
+            return np.flatnonzero(self._candidate_mask(where)).tolist()
+        rows = [self._rows[i] for i in ids if i in self._rows]
+        if where:
+            rows = [row for row in rows if match_where(self._metadatas[row], where)]
+        return rows
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include_embeddings=False):
+        with self._lock:
+            if ids is None:
+                # 分页遍历大集合时先在行号数组上切片，只把当前页转换为 Python 列表
+                rows = np.flatnonzero(self._candidate_mask(where))
+                rows = (rows[offset:offset + limit] if limit is not None else rows[offset:]).tolist()
+            else:
+                rows = self._alive_rows(ids, where)
+                rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+            batch = {
+                "ids": [self._ids[row] for row in rows],
+                "documents": [self._documents[row] for row in rows],
+                "metadatas": [self._metadatas[row] for row in rows]
+            }
+            if include_embeddings:
+                if rows:
+                    batch["embeddings"] = np.asarray(self._vectors[rows], dtype=np.float32)
+                else:
+                    batch["embeddings"] = np.zeros((0, self.dimension or 0), dtype=np.float32)
+            return batch
+
+    def count(self):
+        return len(self._rows)
+
+    def all_ids(self, batch_size: int = 5000):
+        with self._lock:
+            return list(self._rows)
+
+    def memory_bytes(self):
+        return self._vectors.nbytes if self._vectors is not None else 0
+
+    def reset(self):
+        with self._lock:
+            tags = self.tags
+            self._vectors = None
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._load()
+            if tags:
+                self.tags = tags
+                self._write_meta()
+
+    def drop(self):
+        with self._lock:
+            self._vectors = None
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def get_tags(self):
+        return dict(self.tags)
+
+    def set_tags(self, tags):
+        with self._lock:
+            self.tags = dict(tags)
+            self._write_meta()
+
+    def get_dimension(self):
+        return self.dimension
+
+    def compact(self):
+        """重写向量文件和操作日志，只保留存活行"""
+        return self.rewrite()
+
+    def rewrite(self, transform=None):
+        with self._lock:
+            rows = self._alive_rows()
+            vectors = np.asarray(self._vectors[rows], dtype=np.float32) if rows else None
+            if vectors is not None and transform is not None:
+                vectors = np.asarray(transform(vectors), dtype=np.float32)
+            records = [(self._ids[r], self._documents[r], self._metadatas[r]) for r in rows]
+            dimension = int(vectors.shape[1]) if vectors is not None else self.dimension
+
+            self._vectors = None
+            tmp_path = self.path.with_name(self.path.name + "__compact")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            tmp_path.mkdir(parents=True)
+            if vectors is not None:
+                with open(tmp_path / "vectors.f32", "wb") as f:
+                    f.write(vectors.tobytes())
+            with open(tmp_path / "records.jsonl", "w", encoding="utf-8") as f:
+                for chunk_id, document, metadata in records:
+                    f.write(json.dumps({"op": "add", "id": chunk_id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n")
+            if dimension or self.tags:
+                (tmp_path / "meta.json").write_text(json.dumps({"dimension": dimension, "tags": self.tags}), encoding="utf-8")
+
+            shutil.rmtree(self.path)
+            os.replace(tmp_path, self.path)
+            self._load()
+            return len(rows)
+
+class HnswlibVectorIndex(NumpyFlatVectorIndex):
+    """hnswlib 近似检索索引：向量与记录沿用 NumPy 索引的存储，额外维护 HNSW 图（index.bin）"""
+    backend = "hnswlib"
+
+    def __init__(
+        self,
+        collection_name: str,
+        path: Optional[str] = None,
+        M: Optional[int] = None,
+        ef_construction: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("使用 hnswlib 向量索引需要先安装 hnswlib: pip install hnswlib")
+        self._hnswlib = hnswlib
+        self.M = M or settings.HNSW_M
+        self.ef_construction = ef_construction or settings.HNSW_EF_CONSTRUCTION
+        self.ef_search = ef_search or settings.HNSW_EF_SEARCH
+        self._graph = None
+        super().__init__(collection_name, path)
+
+    @property
+    def _graph_file(self) -> Path:
+        return self.path / "index.bin"
+
+    def _load(self):
+        super()._load()
+        self._graph = None
+        if self.dimension is None:
+            return
+
+        self._graph = self._hnswlib.Index(space="cosine", dim=self.dimension)
+        rows = len(self._ids)
+        if self._graph_file.exists():
+            self._graph.load_index(str(self._graph_file), max_elements=max(rows, 1))
+        else:
+            self._graph.init_index(max_elements=max(rows, 1024), M=self.M, ef_construction=self.ef_construction)
+
+        # 图文件落后于向量文件时（进程在 persist 之前退出），补齐缺失的行
+        indexed = self._graph.get_current_count()
+        if indexed < rows:
+            self._graph.resize_index(max(rows, self._graph.get_max_elements()))
+            self._graph.add_items(np.asarray(self._vectors[indexed:rows]), np.arange(indexed, rows))
+        for row, alive in enumerate(self._alive):
+            if not alive:
+                try:
+                    self._graph.mark_deleted(row)
+                except RuntimeError:
+                    pass
+        self._graph.set_ef(self.ef_search)
+
+    def _on_rows_added(self, start, vectors):
+        if self._graph is None:
+            self._graph = self._hnswlib.Index(space="cosine", dim=self.dimension)
+            self._graph.init_index(max_elements=max(len(vectors) * 2, 1024), M=self.M, ef_construction=self.ef_construction)
+            self._graph.set_ef(self.ef_search)
+        needed = start + len(vectors)
+        if needed > self._graph.get_max_elements():
+            self._graph.resize_index(max(needed, self._graph.get_max_elements() * 2))
+        self._graph.add_items(vectors, np.arange(start, needed))
+
+    def _on_rows_deleted(self, rows):
+        for row in rows:
+            self._graph.mark_deleted(row)
+
+    def persist(self):
+        with self._lock:
+            if self._graph is not None:
+                self._graph.save_index(str(self._graph_file))
+
+    def query(self, embedding, k, where=None):
+        with self._lock:
+            alive_count = len(self._rows)
+            if k <= 0 or alive_count == 0 or self._graph is None:
+                return []
+            query = normalize_rows(embedding)
+            k = min(k, alive_count)
+            self._graph.set_ef(max(self.ef_search, k))
+            metadatas = self._metadatas
+            row_filter = (lambda row: match_where(metadatas[row], where)) if where else None
+            try:
+                labels, distances = self._graph.knn_query(query, k=k, filter=row_filter)
+            except RuntimeError:
+                # 过滤后可用元素不足 k 个
+                return super().query(embedding, k, where)
+            return [self._hit(int(row), 1.0 - float(d)) for row, d in zip(labels[0], distances[0])]
+
+    def memory_bytes(self):
+        # HNSW 第 0 层每个元素: 向量 + 2M 个邻居 ID + 计数和标签
+        if self._graph is None:
+            return 0
+        return self._graph.get_current_count() * (self.dimension * 4 + 2 * self.M * 4 + 12)
+
+    def reset(self):
+        self._graph = None
+        super().reset()
+
+    def rewrite(self, transform=None):
+        self._graph = None
+        if self._graph_file.exists():
+            self._graph_file.unlink()
+        count = super().rewrite(transform)
+        self.persist()
+        return count
+
+# 每个字节中 1 的个数，用于计算二值编码的汉明距离
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+class QuantizedVectorIndex(NumpyFlatVectorIndex):
+    """量化向量索引：第一阶段在 int8 或二值编码上粗排，候选集再用内存映射的 float32 原始向量精排
+
+    在 NumPy 索引的目录结构上增加：
+      codes.i8 / codes.bin  每行向量的 int8 编码（每维 1 字节）或符号位编码（每维 1 bit）
+      scales.f32            int8 编码的每行缩放系数
+    查询时顺序扫描的只有编码（float32 的 1/4 或 1/32），原始向量只读取候选行。
+    """
+    MODES = ("int8", "binary")
+    # 精排候选数 = k * rescore_factor；二值编码丢失的信息更多，需要更大的候选集
+    DEFAULT_RESCORE_FACTOR = {"int8": 4, "binary": 16}
+    # 粗排按块扫描：int8 -> float32 的临时块保持在 CPU 缓存大小附近
+    SCAN_ROWS = 1024
+
+    def __init__(
+        self,
+        collection_name: str,
+        path: Optional[str] = None,
+        mode: str = "int8",
+        rescore_factor: Optional[int] = None
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的量化方式: {mode}")
+        self.mode = mode
+        self.backend = mode
+        self.rescore_factor = rescore_factor or settings.VECTOR_RESCORE_FACTOR or self.DEFAULT_RESCORE_FACTOR[mode]
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        super().__init__(collection_name, path)
+
+    @property
+    def _codes_file(self) -> Path:
+        return self.path / ("codes.i8" if self.mode == "int8" else "codes.bin")
+
+    @property
+    def _scales_file(self) -> Path:
+        return self.path / "scales.f32"
+
+    @property
+    def _code_width(self) -> int:
+        return self.dimension if self.mode == "int8" else (self.dimension + 7) // 8
+
+    def _encode(self, vectors: np.ndarray):
+        if self.mode == "int8":
+            scales = np.abs(vectors).max(axis=1)
+            scales[scales == 0] = 1.0
+            codes = np.round(vectors / scales[:, None] * 127).astype(np.int8)
+            return codes, (scales / 127).astype(np.float32)
+        return np.packbits(vectors > 0, axis=1), None
+
+    def _append_codes(self, vectors: np.ndarray):
+        codes, scales = self._encode(vectors)
+        with open(self._codes_file, "ab") as f:
+            f.write(codes.tobytes())
+        if scales is not None:
+            with open(self._scales_file, "ab") as f:
+                f.write(scales.tobytes())
+
+    def _encoded_rows(self) -> int:
+        rows = self._codes_file.stat().st_size // self._code_width if self._codes_file.exists() else 0
+        if self.mode == "int8":
+            scale_rows = self._scales_file.stat().st_size // 4 if self._scales_file.exists() else 0
+            rows = min(rows, scale_rows)
+        return rows
+
+    def _remap(self):
+        super()._remap()
+        # 精排只随机读取少量行，关闭预读
+        mapped = getattr(self._vectors, "_mmap", None)
+        if mapped is not None and hasattr(mmap, "MADV_RANDOM"):
+            mapped.madvise(mmap.MADV_RANDOM)
+
+    def _remap_codes(self):
+        rows = len(self._ids)
+        if rows == 0 or not self.dimension:
+            self._codes = None
+            self._scales = None
+            return
+        dtype = np.int8 if self.mode == "int8" else np.uint8
+        self._codes = np.memmap(self._codes_file, dtype=dtype, mode="r", shape=(rows, self._code_width))
+        if self.mode == "int8":
+            self._scales = np.memmap(self._scales_file, dtype=np.float32, mode="r", shape=(rows,))
+
+    def _load(self):
+        super()._load()
+        self._codes = None
+        self._scales = None
+        if self.dimension is None:
+            return
+
+        # 编码文件落后于向量文件时（首次切换到量化索引，或进程在写入编码前退出），从原始向量补齐
+        rows = len(self._ids)
+        encoded = self._encoded_rows()
+        if encoded < rows:
+            for target, width in ((self._codes_file, self._code_width), (self._scales_file, 4)):
+                if target.exists():
+                    os.truncate(target, encoded * width)
+            for start in range(encoded, rows, self.SCAN_ROWS):
+                end = min(start + self.SCAN_ROWS, rows)
+                self._append_codes(np.asarray(self._vectors[start:end], dtype=np.float32))
+        self._remap_codes()
+
+    def _on_rows_added(self, start, vectors):
+        self._append_codes(vectors)
+        self._remap_codes()
+
+    def _coarse_scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """粗排得分；rows 为 None 时扫描全部行，否则只计算给定行（顺序与 rows 一致）"""
+        total = len(self._ids) if rows is None else len(rows)
+        scores = np.empty(total, dtype=np.float32)
+        if self.mode == "binary":
+            query_bits = np.packbits(query > 0)
+        for start in range(0, total, self.SCAN_ROWS):
+            end = min(start + self.SCAN_ROWS, total)
+            selected = slice(start, end) if rows is None else rows[start:end]
+            block = self._codes[selected]
+            if self.mode == "int8":
+                scores[start:end] = (block.astype(np.float32) @ query) * self._scales[selected]
+            else:
+                scores[start:end] = -POPCOUNT[np.bitwise_xor(block, query_bits)].sum(axis=1, dtype=np.int32)
+        return scores
+
+    def query(self, embedding, k, where=None):
+        with self._lock:
+            if k <= 0 or not self._rows or self._codes is None:
+                return []
+            query = normalize_rows(embedding)[0]
+            mask = self._candidate_mask(where)
+            available = int(mask.sum())
+            if available == 0:
+                return []
+            k = min(k, available)
+            shortlist_size = min(available, k * self.rescore_factor)
+
+            if available <= shortlist_size:
+                # 过滤后的候选不多于精排数量，直接精排
+                shortlist = np.flatnonzero(mask)
+            elif available * 2 < len(self._ids):
+                # 过滤条件只保留少部分行（例如按文件路由），只对这些行粗排
+                candidates = np.flatnonzero(mask)
+                coarse = self._coarse_scores(query, candidates)
+                shortlist = candidates[np.argpartition(-coarse, shortlist_size - 1)[:shortlist_size]]
+                shortlist.sort()
+            else:
+                coarse = self._coarse_scores(query)
+                coarse[~mask] = -np.inf
+                shortlist = np.argpartition(-coarse, shortlist_size - 1)[:shortlist_size]
+                # 按行号顺序读取内存映射的原始向量
+                shortlist.sort()
+            exact = np.asarray(self._vectors[shortlist], dtype=np.float32) @ query
+            top = np.argpartition(-exact, k - 1)[:k]
+            top = top[np.argsort(-exact[top])]
+            return [self._hit(int(shortlist[i]), exact[i]) for i in top]
+
+    def memory_bytes(self) -> int:
+        """查询时常驻内存的编码大小（原始向量只按需读取候选行）"""
+        total = self._codes.nbytes if self._codes is not None else 0
+        return total + (self._scales.nbytes if self._scales is not None else 0)
+
+    def reset(self):
+        self._codes = None
+        self._scales = None
+        super().reset()
+
+    def rewrite(self, transform=None):
+        # 重建后的目录不含编码文件，重新加载时从原始向量重建
+        self._codes = None
+        self._scales = None
+        return super().rewrite(transform)
+
+def create_chroma_client():
+    """根据配置创建 Chroma 客户端（嵌入式或 HTTP）"""
+    import chromadb
+    from chromadb.config import Settings as ChromaSettings
+
+    chroma_settings = ChromaSettings(anonymized_telemetry=False, allow_reset=True)
+    if settings.CHROMA_MODE == "http":
+        logger.info(f"连接 Chroma 服务: {settings.CHROMA_HOST}:{settings.CHROMA_PORT}")
+        headers = {"Authorization": f"Bearer {settings.CHROMA_AUTH_TOKEN}"} if settings.CHROMA_AUTH_TOKEN else None
+        return chromadb.HttpClient(
+            host=settings.CHROMA_HOST,
+            port=settings.CHROMA_PORT,
+            ssl=settings.CHROMA_SSL,
+            headers=headers,
+            settings=chroma_settings
+        )
+
+    os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
+    return chromadb.PersistentClient(path=settings.VECTOR_DB_PATH, settings=chroma_settings)
+
+@lru_cache(maxsize=1)
+def get_chroma_client():
+    """进程内共享的 Chroma 客户端，HTTP 模式下复用同一个连接池"""
+    return create_chroma_client()
+
+def create_vector_index(
+    collection_name: str,
+    backend: Optional[str] = None,
+    tags: Optional[Dict[str, Any]] = None
+) -> VectorIndex:
+    """根据配置创建向量索引；tags 为新集合记录的嵌入模型标签（已有集合的标签不变）"""
+    backend = backend or settings.VECTOR_BACKEND
+    if backend == "chroma":
+        return ChromaVectorIndex(collection_name, tags=tags)
+    if backend == "numpy":
+        index = NumpyFlatVectorIndex(collection_name)
+    elif backend == "hnswlib":
+        index = HnswlibVectorIndex(collection_name)
+    elif backend in QuantizedVectorIndex.MODES:
+        index = QuantizedVectorIndex(collection_name, mode=backend)
+    else:
+        raise ValueError(f"不支持的向量索引后端: {backend}")
+    if tags and not index.get_tags():
+        index.set_tags(tags)
+    return index
@@ -0,0 +1,56 @@
+"""汇总检索门控日志：各规则的命中次数、跳过率，以及得分断层截断后保留的片段数
+
+示例:
+  python scripts/analyze_retrieval_gate.py
+  python scripts/analyze_retrieval_gate.py --log logs/retrieval_gate.jsonl --show tool_action
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+
+def main():
+    parser = argparse.ArgumentParser(description="检索门控日志汇总")
+    parser.add_argument("--log", default=settings.RETRIEVAL_GATE_LOG, help="门控日志路径")
+    parser.add_argument("--show", help="打印命中该规则的消息，便于人工检查误判")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        raise SystemExit(f"日志不存在: {args.log}")
+
+    with open(args.log, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        raise SystemExit("日志为空")
+
+    total = len(records)
+    skipped = sum(1 for r in records if not r["retrieve"])
+    print(f"决策总数: {total}, 跳过检索: {skipped} ({skipped / total:.1%})")
+
+    print("\n按原因:")
+    for reason, count in Counter(r["reason"] for r in records).most_common():
+        print(f"  {reason:<20}{count:>8}")
+
+    print("\n按规则:")
+    for rule, count in Counter(r["rule"] for r in records).most_common():
+        print(f"  {rule:<20}{count:>8}")
+
+    retrieved = [r for r in records if r["retrieve"] and r.get("scores")]
+    if retrieved:
+        before = sum(len(r["scores"]) for r in retrieved) / len(retrieved)
+        after = sum(r["kept"] or 0 for r in retrieved) / len(retrieved)
+        print(f"\n得分断层截断: 平均 {before:.2f} -> {after:.2f} 个片段")
+
+    if args.show:
+        print(f"\n规则 {args.show} 命中的消息:")
+        for r in records:
+            if r["rule"] == args.show:
+                print(f"  {r['message']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""对话表基准测试：合成大规模对话库，对比复合索引和 SQLite 连接参数的效果
+
+在临时 SQLite 数据库中生成 --messages 条消息（默认 100 万，随机分布在各对话中，模拟交错写入），
+依次测量:
+  1. 没有复合索引时的上下文查询、对话详情和对话列表延迟（p50 / p95）；
+  2. 建立 (conversation_id, created_at)、(user_id, updated_at) 复合索引的耗时和之后的延迟；
+  3. 默认连接参数（rollback journal）与应用配置的连接参数（WAL、busy_timeout 等）下，
+     多个写线程和读线程并发时的写入吞吐与 database is locked 次数。
+
+示例:
+  python scripts/benchmark_chat_history.py
+  python scripts/benchmark_chat_history.py --messages 200000 --conversations 5000 --seconds 3
+  python scripts/benchmark_chat_history.py --path /tmp/chat_bench.db --keep
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.base import Base, sqlite_pragmas
+from app.models import sql_models  # noqa: F401
+
+COMPOSITE_INDEXES = {
+    "ix_messages_conversation_id_created_at": "messages (conversation_id, created_at)",
+    "ix_conversations_user_id_updated_at": "conversations (user_id, updated_at)",
+}
+
+# 与 app/api/chat.py 中的查询一致
+QUERIES = {
+    "上下文(最近11条)": (
+        "SELECT id, role, content FROM messages WHERE conversation_id = ? AND id != ? "
+        "ORDER BY created_at DESC LIMIT 11",
+        lambda conv, user: (conv, -1),
+    ),
+    "对话详情": (
+        "SELECT id, role, content, created_at FROM messages WHERE conversation_id = ? ORDER BY created_at",
+        lambda conv, user: (conv,),
+    ),
+    "对话列表": (
+        "SELECT id, title, updated_at FROM conversations WHERE user_id = ? ORDER BY updated_at DESC",
+        lambda conv, user: (user,),
+    ),
+}
+
+def populate(path: str, args) -> None:
+    """用应用的模型建表，去掉复合索引后批量写入合成数据"""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    for name in COMPOSITE_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    rng = np.random.default_rng(42)
+    base = datetime(2025, 1, 1)
+
+    conn.executemany(
+        "INSERT INTO users (id, email, hashed_password, is_active, is_superuser, created_at) VALUES (?, ?, '', 1, 0, ?)",
+        [(i, f"user{i}@example.com", base) for i in range(1, args.users + 1)]
+    )
+    owners = rng.integers(1, args.users + 1, size=args.conversations)
+    conn.executemany(
+        "INSERT INTO conversations (id, title, user_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+        [
+            (f"conv_{i}", f"对话 {i}", int(owners[i]), base, base + timedelta(seconds=int(s)))
+            for i, s in enumerate(rng.integers(0, 90 * 86400, size=args.conversations))
+        ]
+    )
+    content = ("苯甲酸在水中的溶解度随温度升高而增大，" * 8)[:args.content_chars]
+    written = 0
+    while written < args.messages:
+        count = min(args.batch_size, args.messages - written)
+        conversations = rng.integers(0, args.conversations, size=count)
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, message_type, created_at) VALUES (?, ?, ?, 'text', ?)",
+            [
+                (f"conv_{conv}", "user" if (written + i) % 2 == 0 else "assistant", content,
+                 base + timedelta(seconds=written + i))
+                for i, conv in enumerate(conversations)
+            ]
+        )
+        conn.commit()
+        written += count
+        print(f"\r已写入 {written}/{args.messages} 条消息", end="", flush=True)
+    print()
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+def measure_queries(path: str, args) -> dict:
+    conn = sqlite3.connect(path)
+    rng = random.Random(7)
+    results = {}
+    for label, (sql, params) in QUERIES.items():
+        latencies = []
+        for _ in range(args.samples):
+            conv = f"conv_{rng.randrange(args.conversations)}"
+            user = rng.randint(1, args.users)
+            start = time.perf_counter()
+            conn.execute(sql, params(conv, user)).fetchall()
+            latencies.append((time.perf_counter() - start) * 1000)
+        plan = " / ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params("conv_0", 1)))
+        results[label] = (np.percentile(latencies, 50), np.percentile(latencies, 95), plan)
+    conn.close()
+    return results
+
+def print_queries(title: str, results: dict) -> None:
+    print(title)
+    for label, (p50, p95, plan) in results.items():
+        print(f"  {label:<12} p50 {p50:8.3f}ms  p95 {p95:8.3f}ms  {plan}")
+
+def create_indexes(path: str) -> float:
+    conn = sqlite3.connect(path)
+    start = time.perf_counter()
+    for name, target in COMPOSITE_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return time.perf_counter() - start
+
+def run_concurrency(path: str, pragmas, args) -> dict:
+    """写线程模拟后台任务逐条更新消息，读线程模拟历史查询，统计吞吐和锁冲突"""
+    if pragmas:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+    else:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+    stop = time.perf_counter() + args.seconds
+    stats = {"writes": 0, "reads": 0, "locked": 0}
+    lock = threading.Lock()
+
+    def connect():
+        # 与 SQLAlchemy 默认一致：sqlite3 默认等待 5 秒；调优后由 busy_timeout 控制
+        conn = sqlite3.connect(path, timeout=args.default_timeout if not pragmas else 0, check_same_thread=False)
+        for pragma in pragmas or []:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn
+
+    def writer(seed):
+        rng = random.Random(seed)
+        conn = connect()
+        while time.perf_counter() < stop:
+            conv = f"conv_{rng.randrange(args.conversations)}"
+            try:
+                conn.execute(
+                    "INSERT INTO messages (conversation_id, role, content, message_type, created_at) VALUES (?, 'assistant', ?, 'text', ?)",
+                    (conv, "正在分析请求并调用相关工具...", datetime.now())
+                )
+                conn.execute("UPDATE conversations SET updated_at = ? WHERE id = ?", (datetime.now(), conv))
+                conn.commit()
+                with lock:
+                    stats["writes"] += 1
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                if "locked" not in str(e):
+                    raise
+                with lock:
+                    stats["locked"] += 1
+        conn.close()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        conn = connect()
+        sql, params = QUERIES["对话详情"]
+        while time.perf_counter() < stop:
+            try:
+                conn.execute(sql, params(f"conv_{rng.randrange(args.conversations)}", None)).fetchall()
+                with lock:
+                    stats["reads"] += 1
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                with lock:
+                    stats["locked"] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(100 + i,)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="对话表索引与 SQLite 连接参数基准测试")
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--conversations", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--content-chars", type=int, default=120, help="每条消息的文本长度")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--samples", type=int, default=200, help="每种查询的采样次数")
+    parser.add_argument("--writers", type=int, default=4, help="并发写线程数")
+    parser.add_argument("--readers", type=int, default=4, help="并发读线程数")
+    parser.add_argument("--seconds", type=float, default=5.0, help="每组并发测试的时长")
+    parser.add_argument("--default-timeout", type=float, default=5.0, help="默认参数下 sqlite3 的等待秒数")
+    parser.add_argument("--path", help="数据库路径（默认临时目录）")
+    parser.add_argument("--keep", action="store_true", help="保留生成的数据库")
+    args = parser.parse_args()
+
+    workdir = None
+    path = args.path
+    if not path:
+        workdir = tempfile.mkdtemp(prefix="chat_bench_")
+        path = os.path.join(workdir, "chat.db")
+    elif os.path.exists(path):
+        raise SystemExit(f"{path} 已存在")
+
+    try:
+        start = time.perf_counter()
+        populate(path, args)
+        print(f"合成数据: {args.messages} 条消息, {args.conversations} 个对话, {args.users} 个用户, "
+              f"耗时 {time.perf_counter() - start:.1f}s, 文件 {os.path.getsize(path) / 1024 ** 2:.0f}MB")
+
+        print_queries("无复合索引:", measure_queries(path, args))
+        print(f"建立复合索引耗时 {create_indexes(path):.1f}s")
+        print_queries("有复合索引:", measure_queries(path, args))
+
+        for title, pragmas in (("默认连接参数", None), ("调优连接参数", sqlite_pragmas())):
+            stats = run_concurrency(path, pragmas, args)
+            print(f"{title}: {args.writers} 写 / {args.readers} 读, 写入 {stats['writes'] / args.seconds:.0f}/s, "
+                  f"读取 {stats['reads'] / args.seconds:.0f}/s, database is locked {stats['locked']} 次")
+        if pragmas:
+            print("  " + ", ".join(pragmas))
+    finally:
+        if workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif args.keep or args.path:
+            print(f"数据库保留在 {path}")
+
+if __name__ == "__main__":
+    main()
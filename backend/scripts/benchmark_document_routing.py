@@ -0,0 +1,113 @@
+"""两级检索基准测试：比较全量 chunk 检索与“文件质心选文件 + 文件内 chunk 检索”在不同语料规模下的延迟和 recall@k
+
+合成语料中每个文件围绕一个主题中心生成 chunk 向量，多个文件共享主题（同一主题下的文件相互干扰，
+更接近真实知识库）。查询向量从随机文件的分布中采样，recall 以全量精确检索为基准。
+
+示例:
+  python scripts/benchmark_document_routing.py --files 100,1000,4000 --chunks-per-file 50
+  python scripts/benchmark_document_routing.py --backend int8 --top-files 10,20,50
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.document_router import DocumentRouter, accumulate_centroids
+from app.services.vector_index import HnswlibVectorIndex, NumpyFlatVectorIndex, QuantizedVectorIndex, normalize_rows
+
+def synthetic_corpus(files: int, chunks_per_file: int, dim: int, topics: int, seed: int = 42):
+    """返回 (chunk 向量, 每个 chunk 的 file_id, 查询向量)"""
+    rng = np.random.default_rng(seed)
+    topic_centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    file_centers = topic_centers[rng.integers(0, topics, files)] + 0.5 * rng.standard_normal((files, dim)).astype(np.float32)
+    file_ids = np.repeat(np.arange(files), chunks_per_file)
+    vectors = file_centers[file_ids] + 0.8 * rng.standard_normal((len(file_ids), dim)).astype(np.float32)
+    return normalize_rows(vectors), file_ids, file_centers
+
+def sample_queries(file_centers: np.ndarray, count: int, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picked = file_centers[rng.integers(0, len(file_centers), count)]
+    return normalize_rows(picked + 0.8 * rng.standard_normal(picked.shape).astype(np.float32))
+
+def open_index(backend: str, name: str, path: str):
+    if backend == "numpy":
+        return NumpyFlatVectorIndex(name, path=path)
+    if backend == "hnswlib":
+        return HnswlibVectorIndex(name, path=path)
+    if backend in QuantizedVectorIndex.MODES:
+        return QuantizedVectorIndex(name, path=path, mode=backend)
+    raise ValueError(f"未知后端: {backend}")
+
+def measure(search, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        results = search(query)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len({int(r["id"]) for r in results} & set(expected.tolist()))
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "recall": hits / (len(queries) * k),
+    }
+
+def run_size(files: int, args) -> list:
+    vectors, file_ids, file_centers = synthetic_corpus(files, args.chunks_per_file, args.dim, args.topics)
+    queries = sample_queries(file_centers, args.queries)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+
+    path = tempfile.mkdtemp(prefix="bench_routing_")
+    try:
+        chunks = open_index(args.backend, "chunks", os.path.join(path, "chunks"))
+        documents = open_index(args.backend, "documents", os.path.join(path, "documents"))
+        router = DocumentRouter(documents)
+        centroids = {}
+        for i in range(0, len(vectors), args.batch_size):
+            batch = vectors[i:i + args.batch_size]
+            metadatas = [{"file_id": int(f), "source": f"file-{f}.pdf"} for f in file_ids[i:i + args.batch_size]]
+            chunks.add([str(j) for j in range(i, i + len(batch))], batch, [""] * len(batch), metadatas)
+            accumulate_centroids(centroids, batch, metadatas)
+        chunks.persist()
+        router.write(centroids)
+
+        rows = [{"files": files, "chunks": len(vectors), "config": "flat",
+                 **measure(lambda q: chunks.query(q, args.k), queries, truth, args.k)}]
+        settings.DOCUMENT_ROUTING_MIN_FILES = 0
+        for top_files in args.top_files:
+            settings.DOCUMENT_ROUTING_TOP_FILES = top_files
+            rows.append({"files": files, "chunks": len(vectors), "config": f"route@{top_files}",
+                         **measure(lambda q: chunks.query(q, args.k, router.route(q)), queries, truth, args.k)})
+        return rows
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="两级检索基准测试")
+    parser.add_argument("--files", default="100,500,2000", help="逗号分隔的文件数（语料规模）")
+    parser.add_argument("--chunks-per-file", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=50, help="主题数，同一主题下的文件相互干扰")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--top-files", default=str(settings.DOCUMENT_ROUTING_TOP_FILES), help="逗号分隔的候选文件数")
+    parser.add_argument("--backend", default="numpy", help="numpy / hnswlib / int8 / binary")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    args.top_files = [int(x) for x in args.top_files.split(",") if x.strip()]
+
+    print(f"后端 {args.backend}, 每个文件 {args.chunks_per_file} 个 chunk, 维度 {args.dim}, 查询 {args.queries} 个, k={args.k}")
+    print(f"{'files':>8}{'chunks':>10}  {'config':<12}{'p50(ms)':>10}{'p99(ms)':>10}{'recall@' + str(args.k):>12}")
+    for files in [int(x) for x in args.files.split(",") if x.strip()]:
+        for row in run_size(files, args):
+            print(f"{row['files']:>8}{row['chunks']:>10}  {row['config']:<12}{row['p50_ms']:>10.2f}"
+                  f"{row['p99_ms']:>10.2f}{row['recall']:>12.3f}")
+
+if __name__ == "__main__":
+    main()
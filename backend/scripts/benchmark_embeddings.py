@@ -0,0 +1,157 @@
+"""本地嵌入模型基准测试：比较 PyTorch 与 ONNX Runtime（int8）的加载耗时、单条查询延迟、批量吞吐和检索一致性
+
+每个后端在独立子进程中运行，加载耗时包含 import 开销。首次运行 onnx 后端时会导出并量化模型（需要 torch），
+导出耗时单独报告，之后从 ONNX_MODEL_DIR 缓存加载。
+
+示例:
+  python scripts/benchmark_embeddings.py
+  python scripts/benchmark_embeddings.py --backends torch,onnx,onnx-fp32 --corpus data/sentences.txt
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+COMPOUNDS = ["苯", "乙醇", "乙酸", "咖啡因", "阿司匹林", "葡萄糖", "甲烷", "氨", "硫酸", "氯化钠",
+             "benzene", "ethanol", "acetic acid", "caffeine", "aspirin", "glucose", "methane", "ammonia"]
+TEMPLATES = ["{}的分子式和结构特点", "{}的物理性质，包括熔点和沸点", "{}在工业上的主要用途",
+             "{}的制备方法和反应条件", "{}的毒性与安全注意事项", "What are the chemical properties of {}?",
+             "{}与水反应的产物是什么", "{}的红外光谱特征峰"]
+
+def builtin_corpus() -> list:
+    return [t.format(c) for c in COMPOUNDS for t in TEMPLATES]
+
+def load_corpus(args) -> list:
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()][:args.limit]
+    return builtin_corpus()[:args.limit]
+
+def worker(args):
+    """子进程：加载指定后端并测量，向量写入 --output"""
+    export_seconds = 0.0
+    start = time.perf_counter()
+    if args.backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from app.core.config import settings
+        embeddings = HuggingFaceEmbeddings(
+            model_name=settings.EMBEDDING_MODEL,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+    else:
+        from app.core.config import settings
+        from app.services.embeddings import OnnxEmbeddings
+        quantize = args.backend == "onnx"
+        probe = OnnxEmbeddings.model_construct(
+            model_name=settings.EMBEDDING_MODEL, cache_dir=settings.ONNX_MODEL_DIR, quantize=quantize
+        )
+        # 导出只发生一次，不计入加载耗时
+        t0 = time.perf_counter()
+        probe.export()
+        export_seconds = time.perf_counter() - t0
+        start = time.perf_counter()
+        embeddings = OnnxEmbeddings(
+            model_name=settings.EMBEDDING_MODEL,
+            cache_dir=settings.ONNX_MODEL_DIR,
+            quantize=quantize,
+            num_threads=settings.ONNX_NUM_THREADS
+        )
+    load_seconds = time.perf_counter() - start
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        texts = json.load(f)
+
+    embeddings.embed_query(texts[0])  # 预热
+    latencies = []
+    for text in texts[:args.queries]:
+        t0 = time.perf_counter()
+        embeddings.embed_query(text)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    throughput = len(texts) / (time.perf_counter() - t0)
+    np.save(args.output, vectors)
+
+    print(json.dumps({
+        "backend": args.backend,
+        "export_s": export_seconds,
+        "load_s": load_seconds,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput": throughput,
+    }))
+
+def agreement(reference: np.ndarray, other: np.ndarray, k: int) -> dict:
+    """逐条向量余弦相似度，以及以每条文本为查询时 top-k 近邻与参考后端的重合率"""
+    cosine = np.sum(reference * other, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(other, axis=1) + 1e-12
+    )
+    k = min(k, len(reference) - 1)
+    ref_top = np.argsort(-(reference @ reference.T), axis=1)[:, 1:k + 1]
+    other_top = np.argsort(-(other @ other.T), axis=1)[:, 1:k + 1]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, other_top)])
+    return {"cosine_mean": float(cosine.mean()), "cosine_min": float(cosine.min()), "topk_overlap": float(overlap)}
+
+def main():
+    parser = argparse.ArgumentParser(description="本地嵌入模型基准测试")
+    parser.add_argument("--backends", default="torch,onnx", help="逗号分隔: torch, onnx (int8), onnx-fp32")
+    parser.add_argument("--corpus", help="文本文件，每行一条；默认使用内置化学问题")
+    parser.add_argument("--limit", type=int, default=1000, help="最多使用的文本条数")
+    parser.add_argument("--queries", type=int, default=100, help="单条查询延迟的采样数")
+    parser.add_argument("--k", type=int, default=10, help="检索一致性的 top-k")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        worker(args)
+        return
+
+    texts = load_corpus(args)
+    print(f"文本: {len(texts)} 条, 单条查询采样 {min(args.queries, len(texts))} 次, top-{args.k}")
+
+    rows, vectors = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "texts.json")
+        with open(input_path, "w", encoding="utf-8") as f:
+            json.dump(texts, f, ensure_ascii=False)
+
+        for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            output_path = os.path.join(tmp, f"{backend}.npy")
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--backend", backend,
+                 "--input", input_path, "--output", output_path, "--queries", str(args.queries)],
+                cwd=BACKEND_DIR, capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                print(f"跳过 {backend}:\n{proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+                continue
+            rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            vectors[backend] = np.load(output_path)
+
+    if not rows:
+        raise SystemExit("没有可用的后端")
+
+    reference = rows[0]["backend"]
+    print(f"{'backend':<12}{'export(s)':>10}{'load(s)':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'docs/s':>10}"
+          f"{'cos_mean':>10}{'cos_min':>10}{'top' + str(args.k):>8}")
+    for row in rows:
+        agree = agreement(vectors[reference], vectors[row["backend"]], args.k)
+        print(f"{row['backend']:<12}{row['export_s']:>10.2f}{row['load_s']:>10.2f}{row['p50_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{row['throughput']:>10.1f}{agree['cosine_mean']:>10.4f}"
+              f"{agree['cosine_min']:>10.4f}{agree['topk_overlap']:>8.3f}")
+    print(f"一致性以 {reference} 为参考")
+
+if __name__ == "__main__":
+    main()
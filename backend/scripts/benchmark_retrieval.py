@@ -0,0 +1,149 @@
+"""检索 + 重排序基准测试：比较写入提示词的片段的召回率和 token 数（merged 为合并相邻片段、去重后的 token 数）
+
+评测集为 JSONL，每行一个问题：
+  {"query": "苯的分子式是什么", "answers": ["C6H6"], "sources": ["有机化学.pdf"]}
+片段内容包含任一 answers 字符串，或 metadata.source 以任一 sources 结尾，即视为相关。
+
+未提供评测集时，从当前知识库随机抽取片段，以片段中的一句话作为查询、片段本身作为唯一相关结果
+（伪查询与原文字面重合，词法打分的结果会偏乐观）。
+
+示例:
+  python scripts/benchmark_retrieval.py --eval data/retrieval_eval.jsonl
+  python scripts/benchmark_retrieval.py --sample 100 --modes lexical,cross_encoder
+
+启用词法索引时额外报告 hybrid 配置（含 CAS 号、分子式等标识符的查询先查词法索引，见 scripts/build_lexical_index.py）。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services import reranker
+from app.services.context_processor import process_context
+from app.services.rag_service import get_rag_service
+from app.services.text_utils import estimate_tokens
+
+_SENTENCE = re.compile(r"[^。！？!?\.\n]{15,120}[。！？!?\.]?")
+
+def load_eval(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def sample_eval(rag_service, size: int, seed: int) -> list:
+    """从知识库中抽取伪查询"""
+    ids, documents = [], []
+    for batch in rag_service.index.iter_batches():
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+    if not ids:
+        raise SystemExit("知识库为空，请先上传文档或提供 --eval 评测集")
+
+    rng = random.Random(seed)
+    items = []
+    for i in rng.sample(range(len(ids)), min(size, len(ids))):
+        sentences = _SENTENCE.findall(documents[i] or "")
+        if sentences:
+            items.append({"query": rng.choice(sentences).strip(), "chunk_ids": [ids[i]]})
+    return items
+
+def is_relevant(result: dict, item: dict) -> bool:
+    metadata = result.get("metadata", {})
+    if result.get("id") in item.get("chunk_ids", []):
+        return True
+    if any(answer in result["content"] for answer in item.get("answers", [])):
+        return True
+    source = str(metadata.get("source", ""))
+    return any(source.endswith(s) for s in item.get("sources", []))
+
+async def run_config(rag_service, items: list, name: str, retrieve) -> dict:
+    hits, tokens, context_tokens, chunks, latencies = 0, 0, 0, 0, []
+    for item in items:
+        t0 = time.perf_counter()
+        results = await retrieve(item["query"])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += any(is_relevant(r, item) for r in results)
+        chunks += len(results)
+        tokens += sum(estimate_tokens(r["content"]) for r in results)
+        # 合并相邻片段、去重后实际写入提示词的 token 数
+        context_tokens += process_context(results)[1]["tokens_after"] if results else 0
+    n = len(items)
+    latencies.sort()
+    return {
+        "config": name,
+        "hit_rate": hits / n,
+        "chunks": chunks / n,
+        "tokens": tokens / n,
+        "context_tokens": context_tokens / n,
+        "p50_ms": latencies[n // 2],
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="检索 + 重排序基准测试")
+    parser.add_argument("--eval", help="评测集 JSONL 路径")
+    parser.add_argument("--sample", type=int, default=100, help="无评测集时抽取的伪查询数量")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline-k", type=int, default=5, help="基线（不重排序）的 top_k")
+    parser.add_argument("--candidates", type=int, default=settings.RERANK_CANDIDATES)
+    parser.add_argument("--top-n", type=int, default=settings.RERANK_TOP_N)
+    parser.add_argument("--cutoff", type=float, default=settings.RERANK_SCORE_CUTOFF)
+    parser.add_argument("--modes", default="lexical,cross_encoder", help="逗号分隔的重排序方式")
+    args = parser.parse_args()
+
+    rag_service = get_rag_service()
+    if rag_service.index is None:
+        raise SystemExit("向量数据库未初始化")
+
+    items = load_eval(args.eval) if args.eval else sample_eval(rag_service, args.sample, args.seed)
+    print(f"评测问题: {len(items)} 个, 候选 {args.candidates}, top_n {args.top_n}, 阈值 {args.cutoff}")
+
+    # 嵌入只计算一次，各配置只比较检索和重排序本身
+    embeddings = {}
+    for item in items:
+        embeddings[item["query"]] = await rag_service.embed_query(item["query"])
+
+    def vector_only(k):
+        return lambda q: rag_service.search_documents(q, top_k=k, query_embedding=embeddings[q])
+
+    rows = [
+        await run_config(rag_service, items, f"vector@{args.baseline_k}", vector_only(args.baseline_k)),
+        await run_config(rag_service, items, f"vector@{args.candidates}", vector_only(args.candidates)),
+    ]
+
+    if rag_service.lexical is not None:
+        # 含化学标识符的查询先查词法索引，其余与 vector@candidates 相同
+        rows.append(await run_config(
+            rag_service, items, f"hybrid@{args.candidates}",
+            lambda q: rag_service.hybrid_search(q, top_k=args.candidates, query_embedding=embeddings[q])
+        ))
+
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        settings.RERANK_MODE = mode
+        reranker.get_reranker.cache_clear()
+        if reranker.get_reranker().name != mode:
+            print(f"跳过 {mode}: 重排序器不可用")
+            continue
+
+        async def reranked(q):
+            candidates = await rag_service.search_documents(q, top_k=args.candidates, query_embedding=embeddings[q])
+            return await reranker.rerank(q, candidates, top_n=args.top_n, score_cutoff=args.cutoff)
+
+        rows.append(await run_config(rag_service, items, f"rerank:{mode}", reranked))
+
+    baseline_tokens = rows[0]["tokens"] or 1
+    print(f"{'config':<22}{'hit_rate':>10}{'chunks':>8}{'tokens':>10}{'merged':>10}{'saved':>8}{'p50(ms)':>10}")
+    for row in rows:
+        saved = 1 - row["context_tokens"] / baseline_tokens
+        print(
+            f"{row['config']:<22}{row['hit_rate']:>10.3f}{row['chunks']:>8.2f}{row['tokens']:>10.0f}"
+            f"{row['context_tokens']:>10.0f}{saved:>8.1%}{row['p50_ms']:>10.1f}"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
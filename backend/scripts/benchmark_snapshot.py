@@ -0,0 +1,127 @@
+"""知识库快照基准测试：合成语料写入临时向量库后导出、再导入到空库，统计吞吐和耗时
+
+全部在临时目录和临时 SQLite 数据库中进行，不影响现有知识库。--chunks 1000000 --dim 1024
+约生成 4GB 向量文件，可用于评估多 GB 语料的恢复时间（与重新调用嵌入模型的耗时对比）。
+
+示例:
+  python scripts/benchmark_snapshot.py --chunks 200000 --dim 384
+  python scripts/benchmark_snapshot.py --chunks 1000000 --dim 1024 --backend int8 --lexical
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.base import Base
+from app.models.sql_models import KnowledgeFile
+from app.services import knowledge_snapshot
+from app.services.document_router import DocumentRouter
+from app.services.lexical_index import LexicalIndex
+from app.services.vector_index import HnswlibVectorIndex, NumpyFlatVectorIndex, QuantizedVectorIndex, normalize_rows
+
+def open_index(backend: str, name: str, path: str):
+    if backend == "numpy":
+        return NumpyFlatVectorIndex(name, path=path)
+    if backend == "hnswlib":
+        return HnswlibVectorIndex(name, path=path)
+    if backend in QuantizedVectorIndex.MODES:
+        return QuantizedVectorIndex(name, path=path, mode=backend)
+    raise ValueError(f"未知后端: {backend}")
+
+def open_db(path: str):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+def populate(db, index, lexical, args) -> None:
+    """按批写入合成 chunk（每个文件 chunks_per_file 个），同时登记 knowledge_files"""
+    rng = np.random.default_rng(42)
+    text = ("苯甲酸 C7H6O2 CAS 65-85-0 在水中溶解度较低，" * 40)[:args.doc_chars]
+    files = (args.chunks + args.chunks_per_file - 1) // args.chunks_per_file
+    db.bulk_insert_mappings(KnowledgeFile, [
+        {"id": i, "filename": f"file-{i}.pdf", "file_path": "", "namespace": "shared",
+         "chunk_count": min(args.chunks_per_file, args.chunks - i * args.chunks_per_file), "status": "indexed"}
+        for i in range(files)
+    ])
+    db.commit()
+    for start in range(0, args.chunks, args.batch_size):
+        count = min(args.batch_size, args.chunks - start)
+        vectors = normalize_rows(rng.standard_normal((count, args.dim)).astype(np.float32))
+        rows = range(start, start + count)
+        ids = [f"chunk-{row}" for row in rows]
+        metadatas = [{"file_id": row // args.chunks_per_file, "namespace": "shared", "chunk_index": row % args.chunks_per_file}
+                     for row in rows]
+        index.add(ids=ids, embeddings=vectors, documents=[text] * count, metadatas=metadatas)
+        if lexical is not None:
+            lexical.add(ids, [text] * count, metadatas)
+    index.persist()
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库快照导出/导入基准测试")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--chunks-per-file", type=int, default=50)
+    parser.add_argument("--doc-chars", type=int, default=800, help="每个 chunk 的文本长度")
+    parser.add_argument("--backend", default="numpy", help="numpy / hnswlib / int8 / binary")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--lexical", action="store_true", help="同时导出/导入词法索引")
+    parser.add_argument("--rebuild-lexical", action="store_true", help="快照不带词法索引备份，导入时重新分词（对比用）")
+    parser.add_argument("--verify", action="store_true", help="导入前校验 SHA-256")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录")
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix="bench_snapshot_")
+    try:
+        source_db = open_db(os.path.join(path, "source.db"))
+        source = open_index(args.backend, "source", os.path.join(path, "source"))
+        use_lexical = args.lexical or args.rebuild_lexical
+        source_lexical = LexicalIndex(os.path.join(path, "source_lexical.db")) if use_lexical else None
+        t0 = time.perf_counter()
+        populate(source_db, source, source_lexical, args)
+        print(f"合成语料: {args.chunks} 个 chunk, {args.dim} 维, 后端 {args.backend}, 写入耗时 {time.perf_counter() - t0:.1f}s")
+
+        snapshot = os.path.join(path, "snapshot")
+        t0 = time.perf_counter()
+        knowledge_snapshot.export_snapshot(
+            source_db, source, snapshot,
+            lexical=None if args.rebuild_lexical else source_lexical, batch_size=args.batch_size
+        )
+        export_seconds = time.perf_counter() - t0
+        size = directory_bytes(snapshot)
+        vectors_size = os.path.getsize(os.path.join(snapshot, knowledge_snapshot.EMBEDDINGS_FILE))
+
+        target_db = open_db(os.path.join(path, "target.db"))
+        target = open_index(args.backend, "target", os.path.join(path, "target"))
+        router = DocumentRouter(open_index(args.backend, "documents", os.path.join(path, "documents")))
+        lexical = LexicalIndex(os.path.join(path, "lexical.db")) if use_lexical else None
+        t0 = time.perf_counter()
+        knowledge_snapshot.import_snapshot(
+            target_db, target, snapshot, lexical=lexical, router=router,
+            batch_size=args.batch_size, verify=args.verify
+        )
+        import_seconds = time.perf_counter() - t0
+        assert target.count() == args.chunks
+
+        print(f"快照大小: {size / 1e9:.2f} GB（向量 {vectors_size / 1e9:.2f} GB）")
+        print(f"{'step':<10}{'seconds':>10}{'MB/s':>10}{'chunks/s':>12}")
+        for step, seconds in (("export", export_seconds), ("import", import_seconds)):
+            print(f"{step:<10}{seconds:>10.1f}{size / 1e6 / seconds:>10.1f}{args.chunks / seconds:>12.0f}")
+    finally:
+        if args.keep:
+            print(f"临时目录: {path}")
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""向量索引后端基准测试：在同一份数据上比较构建耗时、内存、查询 p50/p99 延迟和 recall@k
+
+rss 为完成全部查询后的进程 RSS 增量（包含查询时映射进来的文件页，受页缓存影响较大），
+index 为查询时需要常驻内存的索引数据大小；recall 以精确检索为基准。
+
+示例:
+  python scripts/benchmark_vector_index.py --n 50000 --dim 1024 --backends numpy,hnswlib,chroma
+  python scripts/benchmark_vector_index.py --n 200000 --backends numpy,int8,binary --rescore 8
+  python scripts/benchmark_vector_index.py --from-collection --truncate 256   # 截断维度，recall 仍以原始维度为基准
+  python scripts/benchmark_vector_index.py --from-collection   # 使用当前知识库中的向量
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import psutil
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.vector_index import (
+    ChromaVectorIndex,
+    HnswlibVectorIndex,
+    NumpyFlatVectorIndex,
+    QuantizedVectorIndex,
+    create_chroma_client,
+    normalize_rows,
+    truncate_rows,
+)
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 64, seed: int = 42) -> np.ndarray:
+    """生成带簇结构的归一化向量，比均匀随机向量更接近真实文本嵌入的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return normalize_rows(vectors)
+
+def collection_vectors(limit: int) -> np.ndarray:
+    """读取当前知识库向量索引中的向量"""
+    from app.services.embedding_collections import active_collection_names
+    from app.services.vector_index import create_vector_index
+
+    collection_name, _ = active_collection_names()
+    index = create_vector_index(collection_name)
+    batches = []
+    total = 0
+    for batch in index.iter_batches(include_embeddings=True):
+        batches.append(batch["embeddings"])
+        total += len(batch["ids"])
+        if total >= limit:
+            break
+    if not batches:
+        raise SystemExit("知识库中没有向量，请先上传文档或使用合成数据")
+    return normalize_rows(np.concatenate(batches)[:limit])
+
+def rss_mb() -> float:
+    gc.collect()
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+def build_index(backend: str, path: str, args):
+    name = f"bench_{uuid.uuid4().hex[:8]}"
+    if backend == "numpy":
+        return NumpyFlatVectorIndex(name, path=path)
+    if backend == "hnswlib":
+        return HnswlibVectorIndex(name, path=path, M=args.M, ef_construction=args.ef_construction, ef_search=args.ef)
+    if backend in QuantizedVectorIndex.MODES:
+        return QuantizedVectorIndex(name, path=path, mode=backend, rescore_factor=args.rescore)
+    if backend == "chroma":
+        if args.chroma_http:
+            return ChromaVectorIndex(name, client=create_chroma_client())
+        import chromadb
+        from chromadb.config import Settings as ChromaSettings
+        client = chromadb.PersistentClient(path=path, settings=ChromaSettings(anonymized_telemetry=False, allow_reset=True))
+        return ChromaVectorIndex(name, client=client)
+    raise ValueError(f"未知后端: {backend}")
+
+def run_backend(backend: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, args) -> dict:
+    path = tempfile.mkdtemp(prefix=f"bench_{backend}_")
+    try:
+        ids = [str(i) for i in range(len(vectors))]
+        documents = [""] * len(vectors)
+        metadatas = [{"row": i} for i in range(len(vectors))]
+
+        mem_before = rss_mb()
+        start = time.perf_counter()
+        index = build_index(backend, path, args)
+        for i in range(0, len(vectors), args.batch_size):
+            end = i + args.batch_size
+            index.add(ids[i:end], vectors[i:end], documents[i:end], metadatas[i:end])
+        index.persist()
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, truth):
+            t0 = time.perf_counter()
+            results = index.query(query, args.k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            hits += len({int(r["id"]) for r in results} & set(expected.tolist()))
+        mem_after = rss_mb()
+        index_bytes = index.memory_bytes()
+
+        if backend == "chroma" and args.chroma_http:
+            index.client.delete_collection(index.collection_name)
+
+        return {
+            "backend": backend,
+            "build_s": build_seconds,
+            "memory_mb": mem_after - mem_before,
+            "index_mb": index_bytes / 1024 / 1024 if index_bytes is not None else float("nan"),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "recall": hits / (len(queries) * args.k),
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引后端基准测试")
+    parser.add_argument("--n", type=int, default=20000, help="向量数量")
+    parser.add_argument("--dim", type=int, default=1024, help="向量维度（合成数据）")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的 k")
+    parser.add_argument("--batch-size", type=int, default=1000, help="写入批大小")
+    parser.add_argument("--backends", default="numpy,int8,binary,hnswlib,chroma", help="逗号分隔的后端列表")
+    parser.add_argument("--M", type=int, default=16, help="hnswlib M")
+    parser.add_argument("--ef-construction", type=int, default=200, help="hnswlib ef_construction")
+    parser.add_argument("--ef", type=int, default=64, help="hnswlib ef（查询）")
+    parser.add_argument("--rescore", type=int, default=None, help="int8/binary 精排候选倍数（默认 int8=4, binary=16）")
+    parser.add_argument("--truncate", type=int, default=0, help="索引和查询向量截断到前 N 维（EMBEDDING_DIMENSIONS）")
+    parser.add_argument("--from-collection", action="store_true", help="使用当前知识库中的向量")
+    parser.add_argument("--chroma-http", action="store_true", help="chroma 后端使用配置的 HTTP 服务")
+    args = parser.parse_args()
+
+    if args.from_collection:
+        data = collection_vectors(args.n + args.queries)
+    else:
+        data = synthetic_vectors(args.n + args.queries, args.dim)
+    # 查询向量取自同一分布，但不写入索引
+    vectors, queries = data[:-args.queries], data[-args.queries:]
+    print(f"数据: {len(vectors)} 个向量, 维度 {vectors.shape[1]}, 查询 {len(queries)} 个, k={args.k}")
+
+    # 精确检索结果作为 recall 的基准（截断时以原始维度为准）
+    scores = queries @ vectors.T
+    truth = np.argsort(-scores, axis=1)[:, :args.k]
+    if args.truncate:
+        vectors, queries = truncate_rows(vectors, args.truncate), truncate_rows(queries, args.truncate)
+        print(f"截断为 {vectors.shape[1]} 维")
+
+    rows = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        try:
+            rows.append(run_backend(backend, vectors, queries, truth, args))
+        except ImportError as e:
+            print(f"跳过 {backend}: {e}")
+
+    print(f"{'backend':<10}{'build(s)':>10}{'rss(MB)':>10}{'index(MB)':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'recall@' + str(args.k):>12}")
+    for row in rows:
+        print(
+            f"{row['backend']:<10}{row['build_s']:>10.2f}{row['memory_mb']:>10.1f}{row['index_mb']:>10.1f}"
+            f"{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['recall']:>12.3f}"
+        )
+
+if __name__ == "__main__":
+    main()
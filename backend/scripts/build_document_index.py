@@ -0,0 +1,42 @@
+"""从 chunk 向量重建文件质心索引（两级检索的第一级）
+
+建立索引时会同步写入文件质心；升级前已入库的文件、或质心索引丢失时运行本脚本补齐。
+直接读取已有 chunk 向量求均值，不需要加载嵌入模型。
+
+示例:
+  python scripts/build_document_index.py
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.document_router import DocumentRouter, accumulate_centroids
+from app.services.embedding_collections import active_collection_names
+from app.services.vector_index import create_vector_index
+
+def main():
+    parser = argparse.ArgumentParser(description="重建文件质心索引")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    collection_name, documents_name = active_collection_names()
+    index = create_vector_index(collection_name)
+    router = DocumentRouter(create_vector_index(documents_name))
+
+    start = time.perf_counter()
+    centroids = {}
+    total = 0
+    for batch in index.iter_batches(args.batch_size, include_embeddings=True):
+        accumulate_centroids(centroids, batch["embeddings"], batch["metadatas"])
+        total += len(batch["ids"])
+    skipped = total - sum(entry["count"] for entry in centroids.values())
+
+    router.index.reset()
+    files = router.write(centroids)
+    print(f"已写入 {files} 个文件质心（{total} 个 chunk，其中 {skipped} 个没有 file_id），耗时 {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
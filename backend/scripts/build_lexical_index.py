@@ -0,0 +1,51 @@
+"""从向量库重建化学标识符词法索引（FTS5）
+
+词法索引在建立向量索引时同步写入；升级前已入库的文档、或词法索引文件丢失时运行本脚本补齐。
+不需要加载嵌入模型，耗时与语料规模线性相关。
+
+示例:
+  python scripts/build_lexical_index.py
+  python scripts/build_lexical_index.py --query "50-78-2 的性质"
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.chem_identifiers import detect_identifiers
+from app.services.lexical_index import get_lexical_index
+from app.services.embedding_collections import active_collection_names
+from app.services.vector_index import create_vector_index
+
+def main():
+    parser = argparse.ArgumentParser(description="重建词法索引")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--query", help="重建后用该查询测试一次检索")
+    args = parser.parse_args()
+
+    lexical = get_lexical_index()
+    if lexical is None:
+        raise SystemExit("词法索引未启用（LEXICAL_INDEX_ENABLED）或 SQLite 不支持 FTS5")
+
+    collection_name, _ = active_collection_names()
+    index = create_vector_index(collection_name)
+    start = time.perf_counter()
+    lexical.reset()
+    total = 0
+    for batch in index.iter_batches(args.batch_size):
+        lexical.add(batch["ids"], batch["documents"], batch["metadatas"])
+        total += len(batch["ids"])
+        print(f"已写入 {total} 个片段")
+    print(f"词法索引重建完成: {total} 个片段, 耗时 {time.perf_counter() - start:.1f}s, 路径 {settings.LEXICAL_INDEX_PATH}")
+
+    if args.query:
+        identifiers = detect_identifiers(args.query)
+        print(f"识别到的标识符: {identifiers}")
+        for result in lexical.search([i["value"] for i in identifiers], 5):
+            print(f"  {result['score']:.3f}  {result['id']}  {result['content'][:80]!r}")
+
+if __name__ == "__main__":
+    main()
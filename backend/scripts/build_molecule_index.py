@@ -0,0 +1,62 @@
+"""从向量库重建分子结构索引（分子 -> chunk）
+
+分子索引在建立向量索引时同步写入；升级前已入库的文档、修改指纹参数或扩充本地名称表之后、
+或索引文件丢失时运行本脚本补齐。不需要加载嵌入模型，耗时与语料规模线性相关（主要是 RDKit 解析）。
+
+示例:
+  python scripts/build_molecule_index.py
+  python scripts/build_molecule_index.py --query "CC(=O)Oc1ccccc1C(=O)O"
+  python scripts/build_molecule_index.py --query c1ccccc1 --mode substructure
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.molecule_index import get_molecule_index, resolve_query, canonical_smiles
+from app.services.embedding_collections import active_collection_names
+from app.services.vector_index import create_vector_index
+
+def main():
+    parser = argparse.ArgumentParser(description="重建分子结构索引")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--query", help="重建后用该结构（SMILES、化合物名或 CAS 号）测试一次检索")
+    parser.add_argument("--mode", choices=["similarity", "substructure"], default="similarity")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    molecules = get_molecule_index()
+    if molecules is None:
+        raise SystemExit("分子结构索引未启用（MOLECULE_INDEX_ENABLED）或未安装 RDKit")
+
+    collection_name, _ = active_collection_names()
+    index = create_vector_index(collection_name)
+    start = time.perf_counter()
+    molecules.reset()
+    total, mentions = 0, 0
+    for batch in index.iter_batches(args.batch_size):
+        mentions += molecules.add(batch["ids"], batch["documents"], batch["metadatas"])
+        total += len(batch["ids"])
+        print(f"已处理 {total} 个片段, {mentions} 处分子提及")
+    counts = molecules.count()
+    print(
+        f"分子结构索引重建完成: {total} 个片段, {counts['molecules']} 个分子, {counts['mentions']} 处提及, "
+        f"耗时 {time.perf_counter() - start:.1f}s, 路径 {settings.MOLECULE_INDEX_PATH}"
+    )
+
+    if args.query:
+        query = resolve_query(args.query)
+        if query is None:
+            raise SystemExit(f"无法解析结构: {args.query}")
+        start = time.perf_counter()
+        results = molecules.search(query, 5, mode=args.mode, threshold=args.threshold)
+        print(f"查询 {canonical_smiles(query)} ({args.mode}): {len(results)} 个片段, 耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
+        for result in results:
+            matched = ", ".join(f"{m['smiles']} ({m['similarity']:.2f})" for m in result["molecules"][:3])
+            print(f"  {result['score']:.3f}  {result['id']}  {matched}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""从向量库重建近重复片段索引（MinHash LSH 签名）
+
+签名在建立向量索引时同步写入；升级前已入库的文档、修改 NEAR_DUPLICATE_NUM_PERM / NEAR_DUPLICATE_SHINGLE_SIZE
+之后、或索引文件丢失时运行本脚本。只登记签名，不删除已入库的片段；--report 统计已入库片段中有多少与
+更早的片段近重复（即按当前阈值入库时会被跳过的片段）。不需要加载嵌入模型。
+
+示例:
+  python scripts/build_near_duplicate_index.py
+  python scripts/build_near_duplicate_index.py --report
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from app.core.config import settings
+from app.services.near_duplicates import get_near_duplicate_index
+from app.services.embedding_collections import active_collection_names
+from app.services.vector_index import create_vector_index
+
+def main():
+    parser = argparse.ArgumentParser(description="重建近重复片段索引")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--report", action="store_true", help="统计已入库片段中的近重复片段")
+    args = parser.parse_args()
+
+    near_duplicates = get_near_duplicate_index()
+    if near_duplicates is None:
+        raise SystemExit("近重复去重未启用（NEAR_DUPLICATE_ENABLED）")
+
+    collection_name, _ = active_collection_names()
+    index = create_vector_index(collection_name)
+    start = time.perf_counter()
+    # 保留入库时的跳过记录，依据的片段之后被删除时仍能恢复
+    near_duplicates.reset(settings.NEAR_DUPLICATE_NUM_PERM, settings.NEAR_DUPLICATE_SHINGLE_SIZE, keep_duplicates=True)
+    total, duplicates = 0, 0
+    for batch in index.iter_batches(args.batch_size):
+        if args.report:
+            chunks = [
+                Document(page_content=document or "", metadata={**(metadata or {}), "chunk_id": chunk_id, "file_id": None})
+                for chunk_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"])
+            ]
+            _, _, skipped = near_duplicates.filter_chunks(chunks)
+            duplicates += len(skipped)
+        near_duplicates.add_texts(batch["ids"], batch["documents"], batch["metadatas"])
+        total += len(batch["ids"])
+        print(f"已登记 {total} 个片段")
+    print(
+        f"近重复索引重建完成: {total} 个片段, {near_duplicates.count()} 个签名, 耗时 {time.perf_counter() - start:.1f}s, "
+        f"分段 {near_duplicates.bands}x{near_duplicates.rows}, 路径 {settings.NEAR_DUPLICATE_INDEX_PATH}"
+    )
+    if args.report:
+        print(f"其中 {duplicates} 个片段与更早的片段近重复（Jaccard >= {near_duplicates.threshold}），占 {duplicates / max(total, 1):.1%}")
+
+if __name__ == "__main__":
+    main()
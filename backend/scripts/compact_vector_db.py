@@ -0,0 +1,19 @@
+"""压缩向量集合：已删除向量占比超过阈值时重建集合（--force 强制重建）"""
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.rag_service import RAGService
+from app.services import knowledge_registry
+
+async def main(force: bool):
+    compacted = await knowledge_registry.compact_if_needed(RAGService(), force=force)
+    if compacted:
+        print("Vector collection compacted.")
+    else:
+        print("Deleted-vector ratio below threshold, nothing to do (use --force to rebuild anyway).")
+
+if __name__ == "__main__":
+    asyncio.run(main(force="--force" in sys.argv))
@@ -0,0 +1,83 @@
+"""知识库快照导出/导入：新节点上线或向量库损坏时直接恢复，不需要重新上传和计算嵌入
+
+导出写入 SNAPSHOT_DIR/<name>（向量为可内存映射的 float32 文件，另含 chunk 文本和 metadata、
+knowledge_files 记录和团队命名空间）；导入要求目标向量库和 knowledge_files 为空，
+同时重建词法索引、文件质心、chunk 注册表和统计计数器。
+
+示例:
+  python scripts/knowledge_snapshot.py export
+  python scripts/knowledge_snapshot.py export --name before-upgrade
+  python scripts/knowledge_snapshot.py list
+  python scripts/knowledge_snapshot.py import before-upgrade --verify
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.db.base import Base, engine, SessionLocal
+from app.services import knowledge_snapshot
+from app.services.document_router import DocumentRouter
+from app.services.embedding_collections import active_collection_names
+from app.services.lexical_index import get_lexical_index
+from app.services.near_duplicates import get_near_duplicate_index
+from app.services.molecule_index import get_molecule_index
+from app.services.vector_index import create_vector_index
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库快照导出/导入")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="导出快照")
+    export_parser.add_argument("--name", help="快照名，默认为当前时间")
+    export_parser.add_argument("--batch-size", type=int, default=1000)
+
+    import_parser = subparsers.add_parser("import", help="导入快照到空的知识库")
+    import_parser.add_argument("name", help="SNAPSHOT_DIR 下的快照名")
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+    import_parser.add_argument("--verify", action="store_true", help="导入前校验 SHA-256（需要完整读取一遍快照）")
+    import_parser.add_argument("--allow-model-mismatch", action="store_true", help="快照嵌入模型与当前配置不同时仍然导入")
+
+    subparsers.add_parser("list", help="列出已有快照")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for snapshot in knowledge_snapshot.list_snapshots():
+            print(f"{snapshot['name']:<28}{snapshot['chunks']:>10} chunks{snapshot['files']:>8} files  "
+                  f"{snapshot['dimension']}d  {snapshot['embedding']['model']}  {snapshot['created_at']}")
+        return
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        collection_name, documents_name = active_collection_names()
+        index = create_vector_index(collection_name)
+        if args.command == "export":
+            name = args.name or datetime.now().strftime("%Y%m%d-%H%M%S")
+            directory = knowledge_snapshot.resolve_snapshot(name)
+            manifest = knowledge_snapshot.export_snapshot(
+                db, index, directory, lexical=get_lexical_index(), batch_size=args.batch_size
+            )
+            print(json.dumps({"path": str(directory), **manifest}, ensure_ascii=False, indent=2))
+        else:
+            router = DocumentRouter(create_vector_index(documents_name)) if settings.DOCUMENT_ROUTING_ENABLED else None
+            result = knowledge_snapshot.import_snapshot(
+                db, index, knowledge_snapshot.resolve_snapshot(args.name),
+                lexical=get_lexical_index(),
+                router=router,
+                near_duplicates=get_near_duplicate_index(),
+                molecules=get_molecule_index(),
+                batch_size=args.batch_size,
+                verify=args.verify,
+                allow_model_mismatch=args.allow_model_mismatch
+            )
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
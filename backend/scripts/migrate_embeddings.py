@@ -0,0 +1,115 @@
+"""嵌入模型迁移：用新模型把现有 chunk 写入新版本集合，完成后原子切换，迁移期间查询继续使用旧集合
+
+修改 SILICONFLOW_EMBEDDING_MODEL / EMBEDDING_MODEL 后先运行 start 登记迁移任务，再由 run 执行
+（服务启动时也会自动接手未完成的任务）。文本从当前集合读取，不重新解析文件；按
+EMBEDDING_MIGRATION_MAX_PER_MINUTE 限速，中断后重新运行 run 从中断处继续。失败时当前集合保持生效，
+新集合被删除；切换后可用 rollback 切回上一个集合，确认无误后用 drop-inactive 删除旧集合释放空间。
+numpy / hnswlib / int8 / binary 后端的索引状态在进程内存中，服务运行时请通过管理接口在服务进程内执行。
+
+示例:
+  python scripts/migrate_embeddings.py status
+  python scripts/migrate_embeddings.py start --run
+  python scripts/migrate_embeddings.py start --provider local --model BAAI/bge-small-zh-v1.5
+  python scripts/migrate_embeddings.py run
+  python scripts/migrate_embeddings.py rollback
+  python scripts/migrate_embeddings.py drop-inactive
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.db.base import Base, engine, SessionLocal
+from app.services import embedding_collections, embedding_migration
+
+def print_status(db) -> None:
+    status = embedding_collections.list_collections(db)
+    print(f"配置的模型: {embedding_collections.format_spec(status['configured'])}"
+          f"{'（与当前集合不一致，需要迁移）' if status['migration_needed'] else ''}")
+    for row in status["collections"]:
+        marker = "*" if row["name"] == status["active"] else " "
+        progress = f"{row['migrated_chunks']}/{row['total_chunks']}" if row["status"] == embedding_collections.STATUS_BUILDING else ""
+        print(f"{marker} v{row['version']:<4}{row['name']:<28}{row['status']:<10}"
+              f"{embedding_collections.format_spec(row):<60}{row['dimension'] or '-':>6}d  {progress}")
+        if row["error_message"]:
+            print(f"        错误: {row['error_message']}")
+
+def run(version=None) -> None:
+    if settings.VECTOR_BACKEND != "chroma":
+        # 文件型索引的状态在各进程内存中，脚本看不到服务进程迁移期间的写入
+        print(f"注意: {settings.VECTOR_BACKEND} 后端的索引只在单个进程内一致，服务运行中请改用 "
+              f"POST /api/v1/knowledge/embedding-collections/migrate 在服务进程内执行迁移")
+    result = asyncio.run(embedding_migration.run_migration(version))
+    if result is None:
+        print("没有进行中的迁移任务")
+    else:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入模型迁移")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("status", help="查看各版本集合和迁移进度")
+
+    start_parser = subparsers.add_parser("start", help="登记迁移任务（默认迁移到配置中的模型）")
+    start_parser.add_argument("--provider", choices=[embedding_collections.PROVIDER_SILICONFLOW, embedding_collections.PROVIDER_LOCAL])
+    start_parser.add_argument("--model", help="模型名")
+    start_parser.add_argument("--dimensions", type=int, help="截断维度，0 为模型原始维度")
+    start_parser.add_argument("--run", action="store_true", help="登记后立即在当前进程执行")
+
+    run_parser = subparsers.add_parser("run", help="执行（或继续）迁移任务")
+    run_parser.add_argument("--version", type=int, help="只执行该版本的任务")
+
+    subparsers.add_parser("rollback", help="补齐切换后的增删并切回上一个集合")
+    subparsers.add_parser("cancel", help="取消进行中的迁移任务")
+    subparsers.add_parser("drop-inactive", help="删除已停用和失败的集合（之后不能回滚）")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if args.command == "status":
+            print_status(db)
+        elif args.command == "start":
+            spec = embedding_collections.configured_spec()
+            if args.provider:
+                spec["provider"] = args.provider
+            if args.model:
+                spec["model"] = args.model
+            if args.dimensions is not None:
+                spec["dimensions"] = args.dimensions
+            try:
+                collection = embedding_migration.start_migration(db, spec)
+            except (ValueError, RuntimeError) as e:
+                raise SystemExit(str(e))
+            print(f"已登记迁移任务 v{collection['version']}: {collection['name']} ({collection['dimension']} 维)")
+            if args.run:
+                run(collection["version"])
+            else:
+                print("运行 python scripts/migrate_embeddings.py run 执行，或等待服务启动时自动接手")
+        elif args.command == "run":
+            run(args.version)
+        elif args.command == "rollback":
+            try:
+                collection = embedding_migration.prepare_rollback(db)
+            except ValueError as e:
+                raise SystemExit(str(e))
+            run(collection["version"])
+        elif args.command == "cancel":
+            try:
+                collection = embedding_migration.cancel_migration(db)
+            except ValueError as e:
+                raise SystemExit(str(e))
+            print(f"已取消: {collection['name']}")
+        else:
+            dropped = embedding_migration.drop_inactive(db)
+            print(f"已删除 {len(dropped)} 个集合: {', '.join(dropped)}" if dropped else "没有需要删除的集合")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""把升级前消息和答案缓存中内联保存的 SDF、属性表移入消息附件存储，data 中改为附件引用
+
+只处理带 smiles 的记录（工具生成的分子消息都有）；已迁移的记录不再包含内联字段，可重复运行。
+前端对两种格式都能显示，迁移可以在服务运行时进行。
+
+示例:
+  python scripts/migrate_message_artifacts.py
+  python scripts/migrate_message_artifacts.py --dry-run
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.base import SessionLocal
+from app.models.sql_models import AnswerCacheEntry, Message
+from app.services.artifact_store import KINDS, get_artifact_store
+
+def migrate_table(db, model, store, batch_size, dry_run):
+    """按 ID 分批扫描 data 非空的记录；返回 (迁移记录数, 内联字节数, 迁移后字节数)"""
+    migrated = before = after = 0
+    last_id = 0
+    while True:
+        rows = db.query(model).filter(model.id > last_id, model.data.isnot(None)).order_by(model.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        for row in rows:
+            data = row.data or {}  # JSON null 也会被 isnot(None) 选中
+            inline = {kind: data[kind] for kind in KINDS if data.get(kind)}
+            if not inline or not data.get("smiles"):
+                continue
+            migrated += 1
+            before += len(json.dumps(inline, ensure_ascii=False))
+            if not dry_run:
+                row.data = store.extract_inline(row.data)
+                after += len(json.dumps(row.data["artifacts"], ensure_ascii=False))
+        if not dry_run:
+            db.commit()
+    return migrated, before, after
+
+def main():
+    parser = argparse.ArgumentParser(description="迁移消息内联的 SDF 和属性表到附件存储")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="只统计需要迁移的记录数")
+    args = parser.parse_args()
+
+    store = get_artifact_store()
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        for label, model in (("消息", Message), ("答案缓存", AnswerCacheEntry)):
+            migrated, before, after = migrate_table(db, model, store, args.batch_size, args.dry_run)
+            if args.dry_run:
+                print(f"{label}: {migrated} 条需要迁移，内联数据约 {before / 1024:.0f}KB")
+            else:
+                print(f"{label}: 迁移 {migrated} 条，内联数据 {before / 1024:.0f}KB -> 引用 {after / 1024:.1f}KB")
+        if not args.dry_run:
+            print(f"迁移完成，耗时 {time.perf_counter() - start:.1f}s，附件目录 {store.root}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""为升级前入库的 chunk 补写命名空间 metadata，并按文件重建命名空间计数器
+
+命名空间取自 knowledge_files.namespace（先运行 alembic upgrade head 补列，旧文件为 shared）。
+只改写 metadata，不重新计算嵌入；同时更新词法索引和文件质心索引，可重复运行。
+
+示例:
+  python scripts/migrate_namespaces.py
+  python scripts/migrate_namespaces.py --dry-run
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.base import Base, engine, SessionLocal
+from app.models.sql_models import KnowledgeFile
+from app.services import knowledge_registry
+from app.services.embedding_collections import active_collection_names
+from app.services.knowledge_namespaces import SHARED_NAMESPACE
+from app.services.lexical_index import get_lexical_index
+from app.services.vector_index import create_vector_index
+
+def pending_updates(index, file_namespaces, batch_size):
+    """先收集需要改写的记录再写入：部分后端按 ID 重写时会改变遍历顺序"""
+    updates = []
+    for batch in index.iter_batches(batch_size):
+        for chunk_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+            namespace = file_namespaces.get(metadata.get("file_id"), SHARED_NAMESPACE)
+            if metadata.get("namespace") != namespace:
+                updates.append((chunk_id, document, {**metadata, "namespace": namespace}))
+    return updates
+
+def apply_updates(index, updates, batch_size, lexical=None):
+    for i in range(0, len(updates), batch_size):
+        batch = updates[i:i + batch_size]
+        ids = [chunk_id for chunk_id, _, _ in batch]
+        metadatas = [metadata for _, _, metadata in batch]
+        index.update_metadata(ids, metadatas)
+        if lexical is not None:
+            lexical.add(ids, [document for _, document, _ in batch], metadatas)
+    index.persist()
+
+def main():
+    parser = argparse.ArgumentParser(description="补写 chunk 命名空间")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="只统计需要改写的记录数")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        file_namespaces = {
+            file_id: namespace or SHARED_NAMESPACE
+            for file_id, namespace in db.query(KnowledgeFile.id, KnowledgeFile.namespace).all()
+        }
+        start = time.perf_counter()
+        collection_name, documents_name = active_collection_names()
+        chunks = create_vector_index(collection_name)
+        documents = create_vector_index(documents_name)
+        chunk_updates = pending_updates(chunks, file_namespaces, args.batch_size)
+        document_updates = pending_updates(documents, file_namespaces, args.batch_size)
+        print(f"需要改写 {len(chunk_updates)} 个 chunk, {len(document_updates)} 个文件质心")
+        if args.dry_run:
+            return
+
+        apply_updates(chunks, chunk_updates, args.batch_size, lexical=get_lexical_index())
+        apply_updates(documents, document_updates, args.batch_size)
+
+        db.query(KnowledgeFile).filter(KnowledgeFile.namespace.is_(None)).update(
+            {"namespace": SHARED_NAMESPACE}, synchronize_session=False
+        )
+        counts = knowledge_registry.rebuild_namespace_stats(db)
+        knowledge_registry.bump_version(db)
+        db.commit()
+        print(f"命名空间迁移完成，耗时 {time.perf_counter() - start:.1f}s")
+        for namespace, entry in sorted(counts.items()):
+            print(f"  {namespace}: {entry['file_count']} 个文件, {entry['total_chunks']} 个 chunk")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""以向量库为准重新统计 chunk 数，校准知识库计数器和 chunk 注册表"""
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.base import Base, engine, SessionLocal
+from app.models import sql_models
+from app.services.rag_service import RAGService
+from app.services import knowledge_registry
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        result = knowledge_registry.recount_stats(db, RAGService())
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""按当前 CHUNK_SIZE / CHUNK_OVERLAP 重建知识库索引，从解析缓存读取文本，不再解析 PDF
+
+默认逐个文件重建（先写入新 chunk 再删除旧 chunk，重建期间检索不中断）；--reset 清空当前集合后整体重建。
+嵌入模型取当前生效集合登记的模型，更换嵌入模型请使用 scripts/migrate_embeddings.py。解析缓存缺失的文件默认跳过，--parse-missing 时解析原文件并补写缓存；
+--warm-cache 只为缺失缓存的文件补建缓存，不重建索引（升级后可先运行一次）。
+
+示例:
+  python scripts/reindex_knowledge.py --warm-cache
+  python scripts/reindex_knowledge.py
+  python scripts/reindex_knowledge.py --namespace shared --file-id 3 --file-id 7
+  python scripts/reindex_knowledge.py --reset
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.base import Base, engine, SessionLocal
+from app.models.sql_models import KnowledgeFile
+from app.services import knowledge_ingest, knowledge_registry
+from app.services.rag_service import RAGService
+
+def select_files(db, args):
+    query = db.query(KnowledgeFile).filter(KnowledgeFile.status == "indexed")
+    if args.namespace:
+        query = query.filter(KnowledgeFile.namespace == args.namespace)
+    if args.file_id:
+        query = query.filter(KnowledgeFile.id.in_(args.file_id))
+    return query.order_by(KnowledgeFile.id).all()
+
+def warm_cache(db, files) -> None:
+    start = time.perf_counter()
+    parsed = 0
+    for file_record in files:
+        if knowledge_ingest.load_pages(file_record, parse_missing=False) is not None:
+            continue
+        if not file_record.file_path or not os.path.exists(file_record.file_path):
+            print(f"  跳过 {file_record.id} {file_record.filename}: 原文件不存在")
+            continue
+        knowledge_ingest.load_pages(file_record, parse_missing=True)
+        db.commit()
+        parsed += 1
+        print(f"  已解析 {file_record.id} {file_record.filename}")
+    print(f"解析缓存补建完成: 解析 {parsed} 个文件, 耗时 {time.perf_counter() - start:.1f}s")
+
+async def reindex(db, rag_service, files, args) -> None:
+    if args.reset:
+        missing = [f for f in files if knowledge_ingest.load_pages(f, parse_missing=False) is None]
+        if missing and not args.parse_missing:
+            names = ", ".join(f"{f.id}:{f.filename}" for f in missing[:10])
+            raise SystemExit(f"{len(missing)} 个文件没有解析缓存（{names}），请先运行 --warm-cache 或加 --parse-missing")
+        if not await rag_service.clear_database():
+            raise SystemExit("清空向量库失败")
+        knowledge_registry.reset_registry(db)
+        for file_record in db.query(KnowledgeFile).all():
+            file_record.chunk_count = 0
+        db.commit()
+
+    start = time.perf_counter()
+    indexed, skipped, chunks = 0, 0, 0
+    for file_record in files:
+        try:
+            if args.reset:
+                count = await knowledge_ingest.index_file(db, rag_service, file_record, parse_missing=args.parse_missing)
+                result = {"status": "indexed", "chunks": count}
+            else:
+                result = await knowledge_ingest.reindex_file(db, rag_service, file_record, parse_missing=args.parse_missing)
+        except Exception as e:
+            db.rollback()
+            print(f"  失败 {file_record.id} {file_record.filename}: {e}")
+            skipped += 1
+            continue
+        if result["status"] == "indexed":
+            indexed += 1
+            chunks += result["chunks"]
+            print(f"  已重建 {file_record.id} {file_record.filename}: {result['chunks']} 个 chunk")
+        else:
+            skipped += 1
+            print(f"  跳过 {file_record.id} {file_record.filename}: {result['reason']}")
+    print(f"重建完成: {indexed} 个文件, {chunks} 个 chunk, 跳过 {skipped} 个, 耗时 {time.perf_counter() - start:.1f}s")
+
+    # 文件的 chunk 被替换后，依据旧 chunk 跳过近重复片段的其他文件需要重建
+    restored = await knowledge_ingest.restore_near_duplicates(db, rag_service)
+    if restored["reindexed"]:
+        print(f"恢复近重复片段: 重建 {restored['reindexed']} 个文件")
+
+def main():
+    parser = argparse.ArgumentParser(description="从解析缓存重建知识库索引")
+    parser.add_argument("--namespace", help="只重建该命名空间的文件")
+    parser.add_argument("--file-id", type=int, action="append", help="只重建指定文件（可重复）")
+    parser.add_argument("--parse-missing", action="store_true", help="缓存缺失时解析原文件")
+    parser.add_argument("--warm-cache", action="store_true", help="只补建解析缓存，不重建索引")
+    parser.add_argument("--reset", action="store_true", help="清空当前集合后整体重建")
+    args = parser.parse_args()
+    if args.reset and (args.namespace or args.file_id):
+        parser.error("--reset 会清空整个向量库，不能与 --namespace / --file-id 同时使用")
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        files = select_files(db, args)
+        print(f"共 {len(files)} 个已索引文件")
+        if args.warm_cache:
+            warm_cache(db, files)
+        else:
+            asyncio.run(reindex(db, RAGService(), files, args))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""将已有向量集合截断到新的维度（保留前 N 维并重新归一化），无需重新调用嵌入模型
+
+修改 EMBEDDING_DIMENSIONS 后运行；只能降维，升维或更换模型请使用 scripts/migrate_embeddings.py。
+作用于当前生效的嵌入集合，并更新其登记的截断维度（查询向量随之截断）。
+重建期间持有向量集合压缩租约，避免与定时压缩同时执行；迁移后知识库版本号加一，答案缓存清空。
+
+示例:
+  python scripts/reproject_embeddings.py                 # 使用配置中的 EMBEDDING_DIMENSIONS
+  python scripts/reproject_embeddings.py --dimensions 256 --dry-run
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.db.base import Base, engine, SessionLocal
+from app.services import embedding_collections, knowledge_registry
+from app.services.answer_cache import get_answer_cache
+from app.services.vector_index import create_vector_index, truncate_rows
+
+def reproject(db, args):
+    active = embedding_collections.get_active(db)
+    index = create_vector_index(active.name)
+    current = index.get_dimension()
+    count = index.count()
+    print(f"集合 {active.name} ({index.backend}): {count} 个向量, 当前维度 {current}")
+
+    if current is None:
+        print("集合为空，无需迁移")
+        return
+    if args.dimensions == current:
+        print("维度已一致，无需迁移")
+        return
+    if args.dimensions > current:
+        raise SystemExit(f"不能从 {current} 维升到 {args.dimensions} 维，请重新建立索引")
+    if args.dry_run:
+        print(f"将截断为 {args.dimensions} 维（--dry-run，未修改）")
+        return
+
+    state = knowledge_registry.get_collection_state(db, active.name)
+    db.commit()
+    if not knowledge_registry.acquire_compaction_lease(db, active.name):
+        raise SystemExit("向量集合正在压缩，请稍后重试")
+    db.refresh(state)
+    try:
+        live = index.rewrite(lambda vectors: truncate_rows(vectors, args.dimensions))
+        index.persist()
+        # 文件质心与 chunk 向量同一空间，一并截断
+        documents = create_vector_index(active.documents_name)
+        if documents.count():
+            documents.rewrite(lambda vectors: truncate_rows(vectors, args.dimensions))
+            documents.persist()
+        state.live_vectors = live
+        state.deleted_vectors = 0
+        state.last_compacted_at = datetime.now()
+        # 查询向量按集合登记的截断维度计算
+        active.dimensions = args.dimensions
+        active.dimension = args.dimensions
+        index.set_tags({**index.get_tags(), "embedding_dimension": args.dimensions})
+    finally:
+        state.compaction_started_at = None
+        db.commit()
+
+    # 查询向量维度变化后旧的答案缓存不再可用
+    knowledge_registry.bump_version(db)
+    db.commit()
+    get_answer_cache().clear(db)
+    print(f"已迁移 {live} 个向量: {current} -> {args.dimensions} 维")
+    if settings.EMBEDDING_DIMENSIONS != args.dimensions:
+        print(f"请将 EMBEDDING_DIMENSIONS 设置为 {args.dimensions}，与当前集合保持一致")
+
+def main():
+    parser = argparse.ArgumentParser(description="向量集合降维迁移")
+    parser.add_argument("--dimensions", type=int, default=settings.EMBEDDING_DIMENSIONS, help="目标维度")
+    parser.add_argument("--dry-run", action="store_true", help="只检查，不修改集合")
+    args = parser.parse_args()
+
+    if args.dimensions <= 0:
+        raise SystemExit("请通过 --dimensions 或 EMBEDDING_DIMENSIONS 指定目标维度")
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        reproject(db, args)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
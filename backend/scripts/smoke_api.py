@@ -0,0 +1,179 @@
+"""接口冒烟测试：对正在运行的服务并发执行对话和知识库接口，检查多 worker 部署下的读写一致性
+
+注册若干临时用户，每个用户并发创建对话、追加消息、读取历史和详情、删除对话，并检查用户之间的隔离；
+再读取知识库文件列表、统计和命名空间（--upload 时上传一个小文档，等待索引完成后删除）。
+请求由多个 worker 交替处理，任一 worker 读不到其他 worker 的写入都会报错。结束时汇总各接口的
+Server-Timing 数据库耗时。有失败时退出码为 1。
+
+示例:
+  python scripts/smoke_api.py --base-url http://localhost:8000
+  python scripts/smoke_api.py --base-url http://backend-postgres:8000 --users 8 --upload
+  docker compose --profile postgres up --build --exit-code-from api-smoke
+"""
+import argparse
+import asyncio
+import re
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+import numpy as np
+
+SERVER_TIMING_PATTERN = re.compile(r"db;dur=([\d.]+)")
+
+class SmokeRun:
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.failures = []
+        self.db_ms = defaultdict(list)
+
+    async def request(self, label: str, method: str, url: str, expect: int = 200, **kwargs) -> httpx.Response:
+        response = await self.client.request(method, url, **kwargs)
+        match = SERVER_TIMING_PATTERN.search(response.headers.get("server-timing", ""))
+        if match:
+            self.db_ms[label].append(float(match.group(1)))
+        if response.status_code != expect:
+            self.fail(f"{method} {url}: 期望 {expect}，实际 {response.status_code} {response.text[:200]}")
+        return response
+
+    def fail(self, message: str) -> None:
+        self.failures.append(message)
+        print(f"  失败: {message}")
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            if (await client.get("/api/v1/ping")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.perf_counter() > deadline:
+            raise SystemExit(f"服务在 {timeout:.0f}s 内未就绪")
+        await asyncio.sleep(1)
+
+async def create_user(run: SmokeRun, run_id: str, index: int) -> dict:
+    email = f"smoke-{run_id}-{index}@example.com"
+    password = uuid.uuid4().hex
+    await run.request("register", "POST", "/api/auth/register", json={"email": email, "password": password})
+    response = await run.request(
+        "login", "POST", "/api/auth/login/access-token", data={"username": email, "password": password}
+    )
+    token = response.json().get("access_token") if response.status_code == 200 else None
+    return {"email": email, "headers": {"Authorization": f"Bearer {token}"}}
+
+async def chat_suite(run: SmokeRun, user: dict, run_id: str, index: int, conversations: int, concurrency) -> list:
+    """每个对话两轮消息；返回创建的对话 ID"""
+    headers = user["headers"]
+    ids = [f"smoke_{run_id}_{index}_{i}" for i in range(conversations)]
+
+    async def converse(conversation_id):
+        async with concurrency:
+            for message in ("苯的分子式是什么？", "它有哪些同分异构体？"):
+                await run.request(
+                    "chat", "POST", "/api/v1/chat", headers=headers,
+                    json={"message": message, "conversation_id": conversation_id, "use_rag": False, "max_tokens": 64}
+                )
+            response = await run.request("history_detail", "GET", f"/api/v1/chat/history/{conversation_id}", headers=headers)
+            if response.status_code == 200:
+                roles = [m["role"] for m in response.json()["messages"]]
+                if roles != ["user", "assistant", "user", "assistant"]:
+                    run.fail(f"{conversation_id}: 消息顺序或数量不正确 {roles}")
+
+    await asyncio.gather(*(converse(conversation_id) for conversation_id in ids))
+    response = await run.request("history", "GET", "/api/v1/chat/history", headers=headers)
+    if response.status_code == 200:
+        listed = {conv["conversation_id"] for conv in response.json()}
+        missing = set(ids) - listed
+        if missing:
+            run.fail(f"{user['email']}: 历史列表缺少 {len(missing)} 个对话")
+    return ids
+
+async def knowledge_suite(run: SmokeRun, user: dict, upload: bool, timeout: float) -> None:
+    headers = user["headers"]
+    await run.request("knowledge_files", "GET", "/api/v1/knowledge/files", headers=headers)
+    await run.request("knowledge_stats", "GET", "/api/v1/knowledge/stats", headers=headers)
+    response = await run.request("knowledge_namespaces", "GET", "/api/v1/knowledge/namespaces", headers=headers)
+    if response.status_code == 200 and not any(ns["kind"] == "user" for ns in response.json()):
+        run.fail(f"{user['email']}: 命名空间列表缺少个人命名空间")
+    if not upload:
+        return
+
+    content = "# 冒烟测试\n\n苯（C6H6）是最简单的芳香烃，CAS 号 71-43-2。乙醇的 SMILES 为 CCO。\n".encode("utf-8")
+    response = await run.request(
+        "knowledge_upload", "POST", "/api/v1/knowledge/upload", headers=headers,
+        files={"files": (f"smoke-{uuid.uuid4().hex[:8]}.md", content, "text/markdown")}
+    )
+    if response.status_code != 200:
+        return
+    deadline = time.perf_counter() + timeout
+    record = None
+    while time.perf_counter() < deadline:
+        files = (await run.request("knowledge_files", "GET", "/api/v1/knowledge/files", headers=headers)).json()
+        record = files[0] if files else None
+        if record and record["status"] in ("indexed", "failed"):
+            break
+        await asyncio.sleep(1)
+    if not record or record["status"] != "indexed" or not record["chunks"]:
+        run.fail(f"{user['email']}: 上传的文档未完成索引 {record}")
+    if record:
+        await run.request("knowledge_delete", "DELETE", f"/api/v1/knowledge/files/{record['id']}", headers=headers)
+
+async def cleanup_suite(run: SmokeRun, users: list, conversations: dict) -> None:
+    """其他用户看不到、删不掉；删除后所有 worker 都读不到"""
+    for index, user in enumerate(users):
+        other = users[(index + 1) % len(users)]
+        for conversation_id in conversations[index]:
+            if other is not user:
+                await run.request("history_detail", "GET", f"/api/v1/chat/history/{conversation_id}", expect=404, headers=other["headers"])
+            await run.request("history_delete", "DELETE", f"/api/v1/chat/history/{conversation_id}", headers=user["headers"])
+            await run.request("history_detail", "GET", f"/api/v1/chat/history/{conversation_id}", expect=404, headers=user["headers"])
+
+async def main_async(args) -> int:
+    run_id = uuid.uuid4().hex[:8]
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.request_timeout) as client:
+        await wait_until_ready(client, args.ready_timeout)
+        run = SmokeRun(client)
+        start = time.perf_counter()
+
+        users = await asyncio.gather(*(create_user(run, run_id, i) for i in range(args.users)))
+        print(f"已注册 {len(users)} 个用户")
+
+        concurrency = asyncio.Semaphore(args.concurrency)
+        conversations = await asyncio.gather(*(
+            chat_suite(run, user, run_id, i, args.conversations, concurrency) for i, user in enumerate(users)
+        ))
+        print(f"对话: {sum(len(ids) for ids in conversations)} 个对话, 每个 2 轮")
+
+        await asyncio.gather(*(knowledge_suite(run, user, args.upload, args.index_timeout) for user in users))
+        print("知识库: 文件列表、统计、命名空间" + ("、上传与删除" if args.upload else ""))
+
+        await cleanup_suite(run, users, dict(enumerate(conversations)))
+        print(f"清理与隔离检查完成，总耗时 {time.perf_counter() - start:.1f}s")
+
+    print("数据库耗时（Server-Timing，毫秒）:")
+    for label, values in sorted(run.db_ms.items()):
+        print(f"  {label:<22}{len(values):>6} 次  p50 {np.percentile(values, 50):7.2f}  p95 {np.percentile(values, 95):7.2f}  max {max(values):7.2f}")
+    if run.failures:
+        print(f"{len(run.failures)} 项检查失败")
+        return 1
+    print("全部检查通过")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="对话与知识库接口冒烟测试")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--conversations", type=int, default=8, help="每个用户创建的对话数")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时进行的对话数")
+    parser.add_argument("--upload", action="store_true", help="上传一个小文档并等待索引完成（需要可用的嵌入模型）")
+    parser.add_argument("--ready-timeout", type=float, default=120, help="等待服务就绪的秒数")
+    parser.add_argument("--index-timeout", type=float, default=120, help="等待上传文档索引完成的秒数")
+    parser.add_argument("--request-timeout", type=float, default=30)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+if __name__ == "__main__":
+    main()
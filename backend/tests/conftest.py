@@ -0,0 +1,38 @@
+"""测试环境：数据库、向量索引和各类缓存都放在临时目录中，不连接远程模型服务
+
+环境变量必须在导入 app 之前设置（settings 和数据库引擎在导入时创建）。
+"""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="chemistry_bot_tests_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_tmp}/test.db",
+    "VECTOR_BACKEND": "numpy",
+    "VECTOR_DB_PATH": f"{_tmp}/vector_db",
+    "LEXICAL_INDEX_PATH": f"{_tmp}/lexical_index.db",
+    "NEAR_DUPLICATE_INDEX_PATH": f"{_tmp}/near_duplicates.db",
+    "MOLECULE_INDEX_PATH": f"{_tmp}/molecule_index.db",
+    "UPLOAD_DIR": f"{_tmp}/uploads",
+    "SNAPSHOT_DIR": f"{_tmp}/snapshots",
+    "LOG_FILE": f"{_tmp}/logs/app.log",
+    "RETRIEVAL_GATE_LOG": f"{_tmp}/logs/retrieval_gate.jsonl",
+    "SILICONFLOW_API_KEY": "",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app.db.base import Base, SessionLocal, engine
+from app.models import sql_models  # noqa: F401
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,87 @@
+import asyncio
+
+from app.api import chat
+from app.services.rag_service import RAGService
+from app.db.base import async_engine
+from app.models.sql_models import Conversation, Message, User
+
+class FakeRAGService:
+    """记录嵌入和检索调用；标识符识别沿用 RAGService 的实现"""
+    lexical = object()
+    has_exact_identifiers = RAGService.has_exact_identifiers
+
+    def __init__(self):
+        self.embedded = []
+        self.retrieved = []
+
+    async def embed_query(self, text):
+        self.embedded.append(text)
+        return [float(len(self.embedded)), 1.0, 0.0]
+
+    async def retrieve(self, query, top_k=None, where=None, query_embedding=None):
+        self.retrieved.append((query, query_embedding))
+        return []
+
+class FakeLLMService:
+    async def generate_response(self, query, context="", history=None, max_tokens=1000):
+        return "你好！有什么化学问题可以帮你？"
+
+def start_turn(db, message):
+    user = User(email="chemist@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    db.add(Conversation(id="conv-1", title=message, user_id=user.id))
+    db.add(Message(conversation_id="conv-1", role="user", content=message))
+    assistant = Message(conversation_id="conv-1", role="assistant", content="")
+    db.add(assistant)
+    db.commit()
+    return user.id, assistant.id
+
+def run_turn(user_id, assistant_id, message):
+    async def run():
+        try:
+            await chat.process_chat_background("conv-1", assistant_id, chat.ChatRequest(message=message), user_id)
+        finally:
+            await async_engine.dispose()
+    asyncio.run(run())
+
+def use_fakes(monkeypatch, retrieve=False):
+    rag_service = FakeRAGService()
+    monkeypatch.setattr(chat, "get_rag_service", lambda: rag_service)
+    monkeypatch.setattr(chat, "LLMService", FakeLLMService)
+    monkeypatch.setattr(chat.settings, "ANSWER_CACHE_ENABLED", True)
+    if retrieve:
+        monkeypatch.setattr(chat.knowledge_namespaces, "search_namespaces", lambda db, user, requested=None: ["shared"])
+        monkeypatch.setattr(chat.retrieval_gate, "decide", lambda db, message, **kwargs: {"retrieve": True, "reason": "knowledge"})
+    return rag_service
+
+def test_gated_off_turn_does_not_embed_question(db, monkeypatch):
+    rag_service = use_fakes(monkeypatch)
+    monkeypatch.setattr(chat.settings, "ANSWER_CACHE_NON_RAG", False)
+    user_id, assistant_id = start_turn(db, "你好")
+
+    run_turn(user_id, assistant_id, "你好")
+
+    assert rag_service.embedded == []
+    db.expire_all()
+    assert db.get(Message, assistant_id).content == "你好！有什么化学问题可以帮你？"
+
+def test_identifier_question_skips_cache_embedding(db, monkeypatch):
+    rag_service = use_fakes(monkeypatch, retrieve=True)
+    user_id, assistant_id = start_turn(db, "50-78-2 的熔点是多少")
+
+    run_turn(user_id, assistant_id, "50-78-2 的熔点是多少")
+
+    # 词法索引可能直接命中，由检索决定是否需要向量
+    assert rag_service.embedded == []
+    assert rag_service.retrieved == [("50-78-2 的熔点是多少", None)]
+
+def test_retrieval_embeds_raw_question(db, monkeypatch):
+    rag_service = use_fakes(monkeypatch, retrieve=True)
+    user_id, assistant_id = start_turn(db, "什么是手性分子？")
+
+    run_turn(user_id, assistant_id, "什么是手性分子？")
+
+    # 缓存用归一化问题的向量，检索用原始问题的向量
+    assert rag_service.embedded == ["什么是手性分子", "什么是手性分子？"]
+    assert rag_service.retrieved == [("什么是手性分子？", [2.0, 1.0, 0.0])]
@@ -0,0 +1,26 @@
+from app.models.sql_models import AnswerCacheEntry
+from app.services import knowledge_registry
+
+def add_cached_answer(db, kb_version: int) -> None:
+    db.add(AnswerCacheEntry(question="苯的分子式", answer="C6H6", kb_version=kb_version, tool_fingerprint="f"))
+
+def test_bump_version_purges_answers_from_older_versions(db):
+    version = knowledge_registry.get_kb_version(db)
+    add_cached_answer(db, version)
+    db.commit()
+
+    knowledge_registry.bump_version(db)
+    db.commit()
+
+    assert db.query(AnswerCacheEntry).count() == 0
+
+def test_bump_version_keeps_answers_without_knowledge_base(db):
+    # chat.py 以 kb_version=-1 缓存不使用知识库的回答
+    add_cached_answer(db, -1)
+    add_cached_answer(db, knowledge_registry.get_kb_version(db))
+    db.commit()
+
+    knowledge_registry.bump_version(db)
+    db.commit()
+
+    assert [entry.kb_version for entry in db.query(AnswerCacheEntry).all()] == [-1]
@@ -0,0 +1,72 @@
+import uuid
+
+import chromadb
+import pytest
+
+from app.services import vector_index
+from app.services.vector_index import ChromaVectorIndex, load_collection_pointer, save_collection_pointer
+
+@pytest.fixture
+def chroma(db, monkeypatch):
+    monkeypatch.setattr(vector_index.settings, "VECTOR_COMPACTION_GRACE_SECONDS", 0)
+    return chromadb.EphemeralClient()
+
+def add_vectors(index, ids):
+    index.add(
+        ids=ids,
+        embeddings=[[1.0, float(i), 0.0] for i in range(len(ids))],
+        documents=[f"片段 {chunk_id}" for chunk_id in ids],
+        metadatas=[{"file_id": 1} for _ in ids]
+    )
+
+def test_compaction_swaps_pointer_for_other_handles(chroma):
+    name = f"chunks_{uuid.uuid4().hex[:8]}"
+    compactor = ChromaVectorIndex(name, client=chroma)
+    # 另一个 worker 在压缩前打开的同名索引
+    worker = ChromaVectorIndex(name, client=chroma)
+    add_vectors(compactor, ["a", "b", "c"])
+    compactor.delete(["b"])
+
+    assert compactor.compact() == 2
+
+    assert load_collection_pointer(name) == (f"{name}__v2", None)
+    assert name not in [collection.name for collection in chroma.list_collections()]
+    # 旧集合已删除，其他 worker 按名称重新解析后继续检索和写入
+    assert sorted(hit["id"] for hit in worker.query([1.0, 0.0, 0.0], k=5)) == ["a", "c"]
+    add_vectors(worker, ["d"])
+    assert compactor.count() == 3
+    assert compactor.get(ids=["d"])["ids"] == ["d"]
+
+def test_writes_during_compaction_reach_target(chroma):
+    name = f"chunks_{uuid.uuid4().hex[:8]}"
+    index = ChromaVectorIndex(name, client=chroma)
+    add_vectors(index, ["a"])
+    target = chroma.create_collection(f"{name}__v2")
+    save_collection_pointer(name, physical_name=name, compaction_target=f"{name}__v2")
+
+    add_vectors(index, ["b"])
+    index.delete(["a"])
+
+    assert target.get()["ids"] == ["b"]
+    assert index.count() == 1
+
+def test_reconcile_restores_changes_missed_by_copy(chroma):
+    source = chroma.create_collection(f"src_{uuid.uuid4().hex[:8]}")
+    target = chroma.create_collection(f"dst_{uuid.uuid4().hex[:8]}")
+    source.add(ids=["a", "b"], embeddings=[[1.0, 0.0], [0.0, 1.0]], documents=["a", "b"])
+    target.add(ids=["a", "stale"], embeddings=[[1.0, 0.0], [1.0, 1.0]], documents=["a", "stale"])
+
+    assert vector_index.reconcile_collections(source, target) == 2
+
+    assert sorted(target.get()["ids"]) == ["a", "b"]
+
+def test_handle_reopens_collection_recreated_by_other_worker(chroma):
+    name = f"chunks_{uuid.uuid4().hex[:8]}"
+    worker = ChromaVectorIndex(name, client=chroma)
+    add_vectors(worker, ["a"])
+    # 共享 Chroma 服务的另一个进程清空（删除后重建）了同名集合
+    other = ChromaVectorIndex(name, client=chroma)
+    other.reset()
+    add_vectors(other, ["b"])
+
+    assert [hit["id"] for hit in worker.query([1.0, 0.0, 0.0], k=5)] == ["b"]
@@ -14,6 +14,17 @@ export interface Message {
     data?: any; // For molecule properties, images, etc.
 }
 
+// Reference to a stored SDF / property table (message.data.artifacts[kind])
+export interface ArtifactRef {
+    id: string;
+    kind: 'sdf' | 'properties';
+    size: number;
+    url: string;
+}
+
+// Artifacts never change once written; share one request per artifact across messages
+const artifactRequests = new Map<string, Promise<any>>();
+
 function getHeaders(contentType: string = 'application/json'): HeadersInit {
     const headers: HeadersInit = {};
     if (contentType) {
@@ -88,7 +99,8 @@ export const api = {
         return response.json();
     },
 
-    async sendMessage(message: string, imagePath?: string, conversationId?: string): Promise<any> {
+    // namespaces limits retrieval; omitted means every namespace the user can read
+    async sendMessage(message: string, imagePath?: string, conversationId?: string, namespaces?: string[]): Promise<any> {
         const response = await fetch(`${API_BASE_URL}/chat`, {
             method: 'POST',
             headers: getHeaders(),
@@ -96,7 +108,8 @@ export const api = {
                 message, 
                 use_rag: true,
                 image_path: imagePath,
-                conversation_id: conversationId
+                conversation_id: conversationId,
+                namespaces
             }),
         });
         if (!response.ok) throw new Error('Network response was not ok');
@@ -157,6 +170,19 @@ export const api = {
         }
         return response.json();
     },
+    // Fetched lazily when a molecule card renders; the browser cache keeps them across reloads
+    getArtifact(ref: ArtifactRef): Promise<any> {
+        let request = artifactRequests.get(ref.url);
+        if (!request) {
+            request = fetch(ref.url).then((response) => {
+                if (!response.ok) throw new Error('Failed to fetch artifact');
+                return ref.kind === 'properties' ? response.json() : response.text();
+            });
+            request.catch(() => artifactRequests.delete(ref.url));
+            artifactRequests.set(ref.url, request);
+        }
+        return request;
+    },
 
     async getChatHistory(): Promise<any> {
         const response = await fetch(`${API_BASE_URL}/chat/history`, {
@@ -185,9 +211,10 @@ export const api = {
         return response.json();
     },
 
-    async uploadDocuments(files: File[]): Promise<any> {
+    async uploadDocuments(files: File[], namespace?: string): Promise<any> {
         const formData = new FormData();
         files.forEach(file => formData.append('files', file));
+        if (namespace) formData.append('namespace', namespace);
 
         const response = await fetch(`${API_BASE_URL}/knowledge/upload`, {
             method: 'POST',
@@ -199,8 +226,9 @@ export const api = {
         return response.json();
     },
 
-    async getKnowledgeFiles(): Promise<any[]> {
-        const response = await fetch(`${API_BASE_URL}/knowledge/files`, {
+    async getKnowledgeFiles(namespace?: string): Promise<any[]> {
+        const query = namespace ? `?namespace=${encodeURIComponent(namespace)}` : '';
+        const response = await fetch(`${API_BASE_URL}/knowledge/files${query}`, {
             headers: getHeaders()
         });
         if (!response.ok) throw new Error('Failed to fetch knowledge files');
@@ -216,8 +244,9 @@ export const api = {
         return response.json();
     },
 
-    async resetKnowledgeBase(): Promise<any> {
-        const response = await fetch(`${API_BASE_URL}/knowledge/reset`, {
+    async resetKnowledgeBase(namespace?: string): Promise<any> {
+        const query = namespace ? `?namespace=${encodeURIComponent(namespace)}` : '';
+        const response = await fetch(`${API_BASE_URL}/knowledge/reset${query}`, {
             method: 'POST',
             headers: getHeaders()
         });
@@ -231,5 +260,13 @@ export const api = {
         });
         if (!response.ok) throw new Error('Failed to get stats');
         return response.json();
+    },
+
+    async getKnowledgeNamespaces(): Promise<any[]> {
+        const response = await fetch(`${API_BASE_URL}/knowledge/namespaces`, {
+            headers: getHeaders()
+        });
+        if (!response.ok) throw new Error('Failed to fetch knowledge namespaces');
+        return response.json();
     }
 };
@@ -91,6 +91,10 @@ if %errorlevel% neq 0 (
     )
 )
 echo     - Backend dependencies are ready.
+echo     - Applying database migrations...
+pushd backend
+alembic upgrade head
+popd
 
 :: ----------------------------------------------------------
 :: 3. 前端环境配置 (Frontend Setup)
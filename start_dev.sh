@@ -77,6 +77,9 @@ pip install -r requirements.txt -i https://pypi.tuna.tsinghua.edu.cn/simple
 
 echo "    - Backend dependencies are ready."
 
+echo "    - Applying database migrations..."
+alembic upgrade head
+
 # 3. Frontend Setup
 echo ""
 echo "[*] Step 3/4: Setting up Frontend environment..."